@@ -0,0 +1,148 @@
+"""
+Компактное представление доступности аудиторий: одна битовая маска на (аудитория, день).
+
+Бит i (0..13) соответствует слоту i+1. Отсутствующая в БД строка BookingSlot
+означает, что слот свободен (AVAILABLE), поэтому маски строятся только по
+"занятым" строкам одним запросом на весь диапазон дат.
+"""
+import datetime
+from collections import defaultdict
+
+from django.utils import timezone
+
+from main.models import BookingSlot, BookingSlotStatus, TIME_SLOTS_DETAILS
+
+SLOTS_PER_DAY = len(TIME_SLOTS_DETAILS)
+FULL_DAY_MASK = (1 << SLOTS_PER_DAY) - 1
+
+KIND_AVAILABLE = 'AVAILABLE'
+KIND_AUCTION = 'IN_AUCTION'
+
+
+def slot_bit(slot_number):
+    return 1 << (slot_number - 1)
+
+
+def range_mask(start_slot, end_slot):
+    """ Маска непрерывного диапазона слотов [start_slot, end_slot]. """
+    return ((1 << (end_slot - start_slot + 1)) - 1) << (start_slot - 1)
+
+
+def window_starts(free_mask, duration):
+    """
+    Маска стартовых слотов, с которых начинается окно из duration подряд свободных слотов:
+    бит j установлен, если свободны все биты j..j+duration-1.
+    """
+    starts = free_mask
+    for shift in range(1, duration):
+        starts &= free_mask >> shift
+    return starts
+
+
+def iter_bits(mask):
+    """ Номера слотов (с 1) для установленных битов маски по возрастанию. """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length()
+        mask ^= low
+
+
+class RoomDayAvailability:
+    """ Состояние одного дня одной аудитории в виде масок. """
+    __slots__ = ('blocked', 'auction', 'auction_ranges')
+
+    def __init__(self):
+        self.blocked = 0          # BOOKED / UNAVAILABLE - нельзя ни бронировать, ни перебивать
+        self.auction = 0          # IN_AUCTION - можно перебить ставкой
+        self.auction_ranges = set()  # маски диапазонов лидирующих заявок (целостность диапазона)
+
+    def free_mask(self, include_auction):
+        busy = self.blocked if include_auction else self.blocked | self.auction
+        return FULL_DAY_MASK & ~busy
+
+    def respects_auction_ranges(self, window):
+        """ Окно может перебить аукцион, только если целиком покрывает диапазон текущего лидера. """
+        return all(not (r & window) or (r & window) == r for r in self.auction_ranges)
+
+
+def load_availability(room_ids, date_from, date_to):
+    """
+    Строит маски для всех (аудитория, день) одним запросом.
+    Возвращает dict {(room_id, date): RoomDayAvailability}; отсутствующий ключ - день полностью свободен.
+    """
+    rows = BookingSlot.objects.filter(
+        room_id__in=room_ids,
+        date__gte=date_from,
+        date__lte=date_to,
+    ).exclude(
+        status=BookingSlotStatus.AVAILABLE,
+    ).values_list(
+        'room_id', 'date', 'slot_number', 'status',
+        'current_highest_attempt__start_slot__slot_number',
+        'current_highest_attempt__end_slot__slot_number',
+    )
+
+    days = defaultdict(RoomDayAvailability)
+    for room_id, date, slot_number, status, leader_start, leader_end in rows:
+        day = days[(room_id, date)]
+        if status == BookingSlotStatus.IN_AUCTION:
+            day.auction |= slot_bit(slot_number)
+            if leader_start and leader_end:
+                day.auction_ranges.add(range_mask(leader_start, leader_end))
+        else:
+            day.blocked |= slot_bit(slot_number)
+    return days
+
+
+def started_slots_mask(date, now=None):
+    """ Маска слотов, которые уже начались (для сегодняшней даты) - их нельзя предлагать. """
+    now = timezone.localtime(now or timezone.now())
+    if date < now.date():
+        return FULL_DAY_MASK
+    if date > now.date():
+        return 0
+    mask = 0
+    for slot_number, times in TIME_SLOTS_DETAILS.items():
+        if times['start'] <= now.time():
+            mask |= slot_bit(slot_number)
+    return mask
+
+
+def find_earliest_windows(rooms, date_from, date_to, duration, limit, include_auction=False, now=None):
+    """
+    Ищет самые ранние окна из duration подряд идущих слотов по всем аудиториям и датам за один проход.
+
+    rooms - список объектов Room (уже отфильтрованных). Результат отсортирован по
+    (дата, начальный слот, свободное раньше аукционного, имя аудитории) и обрезан до limit.
+    """
+    rooms = sorted(rooms, key=lambda room: room.name)
+    days = load_availability([room.id for room in rooms], date_from, date_to)
+    empty_day = RoomDayAvailability()
+
+    results = []
+    date = date_from
+    while date <= date_to and len(results) < limit:
+        started = started_slots_mask(date, now)
+        candidates = []
+        for room in rooms:
+            day = days.get((room.id, date), empty_day)
+            free = day.free_mask(include_auction) & ~started
+            for start_slot in iter_bits(window_starts(free, duration)):
+                window = range_mask(start_slot, start_slot + duration - 1)
+                kind = KIND_AVAILABLE
+                if window & day.auction:
+                    if not day.respects_auction_ranges(window):
+                        continue
+                    kind = KIND_AUCTION
+                candidates.append((start_slot, kind != KIND_AVAILABLE, room.name, room, kind))
+        candidates.sort(key=lambda c: c[:3])
+        for start_slot, _, _, room, kind in candidates[:limit - len(results)]:
+            results.append({
+                'room': room,
+                'date': date,
+                'start_slot': start_slot,
+                'end_slot': start_slot + duration - 1,
+                'kind': kind,
+            })
+        date += datetime.timedelta(days=1)
+    return results
@@ -0,0 +1,301 @@
+"""
+Пакетное бронирование: несколько диапазонов (или серия по расписанию) в одной транзакции.
+
+Баллы проверяются один раз на весь пакет, все затрагиваемые слоты блокируются
+одним упорядоченным запросом, заявки и изменения слотов пишутся bulk-операциями.
+"""
+import datetime
+import logging
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import connection, transaction, IntegrityError
+from django.db.models import Q, F, Sum
+from django.utils import timezone
+
+from main import versions
+from main.models import (
+    BookingSlot, BookingAttempt, User, PointTransaction,
+    BookingSlotStatus, BookingAttemptStatus
+)
+from . import engine
+from .services import (
+    aware_slot_start, build_room_day, load_auctions, load_proxy_caps, raise_proxy_leader, demote_leaders,
+    apply_decision_to_slots, record_auctions, lock_room_day, CONFLICT_MESSAGE
+)
+
+logger = logging.getLogger(__name__)
+
+ITEM_CREATED = 'created'
+ITEM_FAILED = 'failed'
+
+
+class BatchItem:
+    """ Один элемент пакета и результат его обработки. """
+
+    def __init__(self, index, room, date, start_slot, end_slot, total_bid=None):
+        self.index = index
+        self.room = room
+        self.date = date
+        self.start_slot = start_slot
+        self.end_slot = end_slot
+        self.slot_numbers = list(range(start_slot, end_slot + 1))
+        self.requested_bid = total_bid
+        self.start_datetime = None
+        self.decision = None
+        self.price = 0
+        self.slots = []
+        self.attempt = None
+        self.status = None
+        self.error = None
+
+    @property
+    def is_instant(self):
+        return self.decision is not None and self.decision.kind == engine.INSTANT
+
+    def fail(self, error):
+        self.status = ITEM_FAILED
+        self.error = error
+
+    def as_result(self):
+        result = {
+            'index': self.index,
+            'room': self.room.id,
+            'date': self.date,
+            'start_slot_number': self.start_slot,
+            'end_slot_number': self.end_slot,
+            'status': self.status,
+        }
+        if self.error:
+            result['error'] = self.error
+        if self.attempt is not None and self.status == ITEM_CREATED:
+            result['attempt_id'] = self.attempt.id
+            result['attempt_status'] = self.attempt.status
+            result['total_bid'] = self.attempt.total_bid
+        return result
+
+
+def expand_recurrence(room, start_slot, end_slot, date_from, date_to, weekdays, interval_weeks=1, total_bid=None):
+    """
+    Разворачивает правило повторения в список элементов пакета:
+    все даты в [date_from, date_to] с днем недели из weekdays (0 - понедельник),
+    каждую interval_weeks-ю неделю, считая от недели date_from.
+    """
+    items = []
+    week_zero = date_from - datetime.timedelta(days=date_from.weekday())
+    date = date_from
+    while date <= date_to:
+        week_index = (date - week_zero).days // 7
+        if date.weekday() in weekdays and week_index % interval_weeks == 0:
+            items.append({
+                'room': room, 'date': date,
+                'start_slot_number': start_slot, 'end_slot_number': end_slot,
+                'total_bid': total_bid,
+            })
+        date += datetime.timedelta(days=1)
+    return items
+
+
+def _lock_slots(items):
+    """
+    Блокирует все слоты пакета одним запросом в детерминированном порядке
+    (room, date, slot_number), чтобы параллельные пакеты не взаимоблокировались.
+    Недостающие слоты создаются bulk-запросом и блокируются повторно.
+    В стратегии 'advisory' блокируются дни аудиторий, а не строки слотов.
+    """
+    def keys_filter(item_list):
+        return reduce(or_, (
+            Q(room=item.room, date=item.date, slot_number__in=item.slot_numbers) for item in item_list
+        ))
+
+    advisory = settings.BOOKING_BID_STRATEGY == 'advisory' and connection.vendor == 'postgresql'
+    if advisory:
+        # Вместо блокировки строк - advisory-блокировки дней аудиторий в детерминированном порядке
+        for room_id, date in sorted({(item.room.id, item.date) for item in items}):
+            lock_room_day(room_id, date)
+
+    def fetch():
+        queryset = BookingSlot.objects.filter(keys_filter(items))
+        if not advisory:
+            queryset = queryset.select_for_update()
+        return {
+            (slot.room_id, slot.date, slot.slot_number): slot
+            for slot in queryset.order_by('room_id', 'date', 'slot_number')
+        }
+
+    slots = fetch()
+    missing = [
+        BookingSlot(room=item.room, date=item.date, slot_number=n, status=BookingSlotStatus.AVAILABLE).fill_times()
+        for item in items for n in item.slot_numbers
+        if (item.room.id, item.date, n) not in slots
+    ]
+    if missing:
+        # ignore_conflicts: слот мог быть создан параллельным запросом - тогда просто заблокируем его
+        BookingSlot.objects.bulk_create(missing, ignore_conflicts=True)
+        slots = fetch()
+    return slots
+
+
+def _evaluate(item, day, now):
+    """ Проверяет один элемент ядром аукциона и применяет решение к состоянию дня (без записи в БД). """
+    amount = item.requested_bid or engine.minimum_bid(item.start_slot, item.end_slot)
+    decision = engine.evaluate_bid(day, item.start_slot, item.end_slot, amount, now, item.start_datetime)
+    if not decision.accepted:
+        if decision.raised is not None:
+            # Ставку отбила автоставка лидера: его новая сумма видна следующим элементам и будет записана
+            item.decision = decision
+            day.apply(decision, None)
+        return item.fail(decision.message)
+    item.decision = decision
+    item.price = decision.amount
+    # Временный id, чтобы следующие элементы пакета видели этот диапазон занятым
+    day.apply(decision, -(item.index + 1))
+    return None
+
+
+def place_batch(user, raw_items, all_or_nothing=True, now=None):
+    """
+    Обрабатывает пакет индивидуальных заявок пользователя.
+
+    raw_items - список dict с ключами room, date, start_slot_number, end_slot_number, total_bid.
+    Возвращает (успешно ли применен пакет, список результатов по элементам).
+    """
+    now = now or timezone.now()
+    items = [
+        BatchItem(i, raw['room'], raw['date'], raw['start_slot_number'], raw['end_slot_number'], raw.get('total_bid'))
+        for i, raw in enumerate(raw_items)
+    ]
+    for item in items:
+        item.start_datetime = aware_slot_start(item.date, item.start_slot)
+        if item.start_datetime <= now:
+            item.fail("Слот уже начался.")
+
+    with transaction.atomic():
+        # Одна проверка баланса на весь пакет: блокируем пользователя и считаем замороженные ставки
+        user = User.objects.select_for_update().get(pk=user.pk)
+        frozen = user.initiated_attempts.filter(
+            status=BookingAttemptStatus.BIDDING,
+            funding_group__isnull=True
+        ).aggregate(total=Sum('total_bid'))['total'] or 0
+        budget = user.booking_points - frozen
+
+        pending = [item for item in items if item.status is None]
+        slots = _lock_slots(pending) if pending else {}
+        for item in pending:
+            item.slots = [slots[(item.room.id, item.date, n)] for n in item.slot_numbers]
+
+        leader_ids = {
+            slot.current_highest_attempt_id for item in pending for slot in item.slots
+            if slot.status == BookingSlotStatus.IN_AUCTION and slot.current_highest_attempt_id
+        }
+        auctions = load_auctions(leader_ids)
+        day_slots = {}
+        for item in pending:
+            day_slots.setdefault((item.room.id, item.date), {}).update((slot.slot_number, slot) for slot in item.slots)
+        proxy_caps = load_proxy_caps(auctions)
+        days = {key: build_room_day(list(slots_by_number.values()), auctions, proxy_caps) for key, slots_by_number in day_slots.items()}
+
+        for item in pending:
+            _evaluate(item, days[(item.room.id, item.date)], now)
+            if item.status is not None:
+                continue
+            if item.price > budget:
+                item.fail(f"Недостаточно баллов: доступно {budget} ББ с учетом замороженных ставок, требуется {item.price} ББ.")
+                continue
+            budget -= item.price
+
+        accepted = [item for item in items if item.status is None]
+        if all_or_nothing and len(accepted) != len(items):
+            transaction.set_rollback(True)
+            for item in accepted:
+                item.fail("Пакет отклонен целиком из-за ошибок в других элементах.")
+            return False, [item.as_result() for item in items]
+
+        raised = [item.decision for item in items if item.decision is not None and item.decision.raised is not None]
+        for decision in raised:
+            raise_proxy_leader(decision, auctions)
+        if raised:
+            versions.bump_attempts([decision.raised[0] for decision in raised])
+
+        try:
+            # Своя точка сохранения: при нарушении ограничения откатывается только запись пакета
+            with transaction.atomic():
+                _apply(user, accepted, auctions)
+        except IntegrityError as e:
+            logger.info(f"Пакетная бронь пользователя {user.id} пересеклась с параллельной заявкой: {e}")
+            for item in accepted:
+                item.fail(CONFLICT_MESSAGE)
+            return False, [item.as_result() for item in items]
+
+    for item in accepted:
+        item.status = ITEM_CREATED
+    logger.info(f"Пакетная бронь пользователя {user.id}: создано {len(accepted)} из {len(items)} заявок.")
+    return bool(accepted), [item.as_result() for item in items]
+
+
+def _displaced_leaders(item, by_index):
+    """
+    Реальные id лидеров, которых вытесняет элемент: временный id элемента этого же пакета
+    заменяется лидерами, которых вытеснил тот элемент (цепочка может быть длиннее одного шага).
+    """
+    leaders = []
+    for leader_id in item.decision.demoted:
+        if leader_id > 0:
+            leaders.append(leader_id)
+        else:
+            leaders.extend(_displaced_leaders(by_index[-leader_id - 1], by_index))
+    return tuple(leaders)
+
+
+def _apply(user, accepted, auctions):
+    """ Записывает принятые элементы пакета bulk-операциями. """
+    if not accepted:
+        return
+
+    # Перебитые лидеры выходят из BIDDING до вставки, иначе сработает ограничение исключения.
+    # Отрицательные id - элементы этого же пакета, перебитые более поздними элементами: они сразу LOST.
+    demoted_ids = [leader_id for item in accepted for leader_id in item.decision.demoted]
+    demote_leaders([leader_id for leader_id in demoted_ids if leader_id > 0])
+    superseded = {-leader_id - 1 for leader_id in demoted_ids if leader_id < 0}
+
+    for item in accepted:
+        if item.index in superseded:
+            attempt_status = BookingAttemptStatus.LOST
+        else:
+            attempt_status = BookingAttemptStatus.INSTANT_BOOKED if item.is_instant else BookingAttemptStatus.BIDDING
+        item.attempt = BookingAttempt(
+            initiator=user, room=item.room,
+            start_slot=item.slots[0], end_slot=item.slots[-1],
+            total_bid=item.price,
+            status=attempt_status,
+            booking_date=item.start_datetime,
+        ).fill_range()
+    BookingAttempt.objects.bulk_create([item.attempt for item in accepted])
+
+    live = [item for item in accepted if item.index not in superseded]
+    by_index = {item.index: item for item in accepted}
+    for item in live:
+        # Аукционы пишутся по реальным id: лидеры, перебитые поглощенным элементом пакета, переходят к его победителю
+        item.decision.demoted = _displaced_leaders(item, by_index)
+    changed_slots = []
+    for item in live:
+        apply_decision_to_slots(item.decision, item.slots, item.attempt)
+        changed_slots.extend(item.slots)
+    BookingSlot.objects.bulk_update(changed_slots, ['status', 'current_highest_attempt', 'final_booking_attempt'])
+    record_auctions([(item.decision, item.attempt) for item in live], auctions)
+
+    instant_items = [item for item in accepted if item.is_instant]
+    if instant_items:
+        instant_total = sum(item.price for item in instant_items)
+        User.objects.filter(pk=user.pk).update(booking_points=F('booking_points') - instant_total)
+        PointTransaction.objects.bulk_create([
+            PointTransaction(
+                user=user, amount=-item.price,
+                transaction_type=PointTransaction.TransactionType.BOOKING_SPEND_INDIVIDUAL,
+                related_attempt=item.attempt,
+                description=f"Мгновенная бронь {len(item.slot_numbers)} слотов (пакетная заявка)."
+            )
+            for item in instant_items
+        ])
+    versions.bump_attempts([item.attempt.id for item in accepted] + [leader_id for leader_id in demoted_ids if leader_id > 0])
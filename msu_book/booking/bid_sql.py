@@ -0,0 +1,227 @@
+"""
+Ставка одним вызовом функции PostgreSQL (BOOKING_BID_STRATEGY = 'sql', только PostgreSQL).
+
+Функция booking_place_bid (создается post_migrate, см. install) выполняет два выражения
+по порядку внутри одного вызова. Первое блокирует слоты диапазона и открытые аукционы
+их лидеров, проверяет баланс, статусы слотов, целостность диапазона и сумму лидера,
+переводит перебитых лидеров в LOST и возвращает исход. Второе (только при исходе ok)
+вставляет заявку, обновляет слоты и строку Auction. Выражения разделены, потому что
+порядок выполнения data-modifying CTE одного запроса не определен: вставка могла бы
+выполниться раньше перевода лидеров в LOST и нарушить booking_attempts_no_overlap.
+Задержка ставки - один сетевой round trip (SELECT booking_place_bid(...)) вместо десятка запросов ORM.
+
+Этим путем идут индивидуальные ставки вне часа до начала (открытие аукциона
+и перебитие). Мгновенная бронь, овертайм последнего часа, групповые ставки,
+автоставки (своя или лидера) и диапазоны с несозданными слотами обрабатывает services.place_bid.
+"""
+import logging
+
+from django.db import connection, transaction, IntegrityError
+from rest_framework import status
+
+from main.models import (
+    BookingSlot, BookingAttempt, BookingSlotStatus, BookingAttemptStatus, AuctionStatus
+)
+from . import engine
+
+logger = logging.getLogger(__name__)
+
+OK = 'ok'
+MISSING_SLOTS = 'missing_slots'
+PROXY_LEADER = 'proxy_leader'
+INSUFFICIENT_FUNDS = 'insufficient_funds'
+LEADER_MISSING = 'leader_missing'
+
+# Статусы подставляются в тело функции литералами при ее создании
+STATUS_LITERALS = {
+    'available': BookingSlotStatus.AVAILABLE.value, 'in_auction': BookingSlotStatus.IN_AUCTION.value,
+    'bidding': BookingAttemptStatus.BIDDING.value, 'lost': BookingAttemptStatus.LOST.value,
+    'open': AuctionStatus.OPEN.value, 'merged': AuctionStatus.MERGED.value,
+}
+
+PLACE_BID_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION booking_place_bid(
+    p_user_id bigint, p_room_id bigint, p_date date, p_start integer, p_end integer, p_amount integer,
+    p_now timestamptz, p_range_start_at timestamptz, p_close_at timestamptz, p_hard_deadline timestamptz
+) RETURNS TABLE (
+    bid_outcome text, bid_current_max integer, bid_demoted bigint[],
+    bid_attempt_id bigint, bid_start_slot_id bigint, bid_end_slot_id bigint
+) LANGUAGE plpgsql AS $$
+DECLARE
+    v_slot_ids bigint[];
+    v_auction_ids bigint[];
+    v_leaders_close_at timestamptz;
+BEGIN
+    WITH locked AS MATERIALIZED (
+        SELECT id, slot_number, status, current_highest_attempt_id
+        FROM booking_slots
+        WHERE room_id = p_room_id AND date = p_date AND slot_number BETWEEN p_start AND p_end
+        ORDER BY slot_number
+        FOR UPDATE
+    ),
+    leaders AS MATERIALIZED (
+        SELECT id AS auction_id, leader_id, start_slot_number, end_slot_number, amount, max_amount, close_at
+        FROM auctions
+        WHERE status = {open}
+          AND leader_id IN (SELECT current_highest_attempt_id FROM locked WHERE status = {in_auction})
+        ORDER BY id
+        FOR UPDATE
+    ),
+    verdict AS MATERIALIZED (
+        SELECT CASE
+            WHEN (SELECT count(*) FROM locked) < p_end - p_start + 1 THEN 'missing_slots'
+            WHEN COALESCE((SELECT booking_points FROM users WHERE id = p_user_id), 0)
+                 - COALESCE((SELECT sum(total_bid) FROM booking_attempts
+                              WHERE initiator_id = p_user_id AND status = {bidding} AND funding_group_id IS NULL), 0)
+                 < p_amount THEN 'insufficient_funds'
+            WHEN EXISTS (SELECT 1 FROM locked WHERE status NOT IN ({available}, {in_auction})) THEN 'slot_taken'
+            WHEN (SELECT count(DISTINCT COALESCE(current_highest_attempt_id, 0)) FROM locked WHERE status = {in_auction})
+                 <> (SELECT count(*) FROM leaders) THEN 'leader_missing'
+            WHEN EXISTS (SELECT 1 FROM leaders WHERE start_slot_number < p_start OR end_slot_number > p_end) THEN 'range_integrity'
+            WHEN EXISTS (SELECT 1 FROM leaders WHERE max_amount IS NOT NULL) THEN 'proxy_leader'
+            WHEN EXISTS (SELECT 1 FROM leaders) AND p_amount <= (SELECT max(amount) FROM leaders) THEN 'low_bid'
+            ELSE 'ok'
+        END AS outcome
+    ),
+    demoted AS (
+        UPDATE booking_attempts SET status = {lost}, updated_at = p_now
+        WHERE id IN (SELECT leader_id FROM leaders) AND status = {bidding}
+          AND (SELECT outcome FROM verdict) = 'ok'
+        RETURNING id
+    )
+    SELECT verdict.outcome,
+           (SELECT max(amount) FROM leaders),
+           (SELECT array_agg(id ORDER BY id) FROM demoted),
+           (SELECT array_agg(id ORDER BY slot_number) FROM locked),
+           (SELECT array_agg(auction_id ORDER BY auction_id) FROM leaders),
+           (SELECT max(close_at) FROM leaders)
+    INTO bid_outcome, bid_current_max, bid_demoted, v_slot_ids, v_auction_ids, v_leaders_close_at
+    FROM verdict;
+
+    IF bid_outcome <> 'ok' THEN
+        RETURN NEXT;
+        RETURN;
+    END IF;
+
+    -- Перебитые лидеры уже в LOST, поэтому вставка не пересекается с ними по booking_attempts_no_overlap
+    bid_start_slot_id := v_slot_ids[1];
+    bid_end_slot_id := v_slot_ids[array_upper(v_slot_ids, 1)];
+    INSERT INTO booking_attempts (
+        initiator_id, room_id, start_slot_id, end_slot_id, date, start_slot_number, end_slot_number,
+        total_bid, funding_group_id, status, created_at, updated_at, booking_date
+    )
+    VALUES (p_user_id, p_room_id, bid_start_slot_id, bid_end_slot_id, p_date, p_start, p_end,
+            p_amount, NULL, {bidding}, p_now, p_now, p_range_start_at)
+    RETURNING id INTO bid_attempt_id;
+
+    UPDATE booking_slots SET status = {in_auction}, current_highest_attempt_id = bid_attempt_id, final_booking_attempt_id = NULL
+    WHERE id = ANY(v_slot_ids);
+
+    IF v_auction_ids IS NULL THEN
+        INSERT INTO auctions (
+            room_id, date, start_slot_number, end_slot_number, leader_id, amount,
+            last_bid_at, close_at, hard_deadline, status, created_at, settled_at
+        )
+        VALUES (p_room_id, p_date, p_start, p_end, bid_attempt_id, p_amount,
+                p_now, p_close_at, p_hard_deadline, {open}, p_now, NULL);
+    ELSE
+        -- Покрытые аукционы, кроме аукциона с наименьшим id, - MERGED; он получает новый диапазон и лидера
+        UPDATE auctions SET status = {merged}
+        WHERE id = ANY(v_auction_ids[2:]);
+        UPDATE auctions SET
+            start_slot_number = p_start, end_slot_number = p_end, leader_id = bid_attempt_id, amount = p_amount,
+            last_bid_at = p_now,
+            -- Продленное закрытие перебитых аукционов не сбрасывается (см. engine.effective_close)
+            close_at = LEAST(GREATEST(p_close_at, v_leaders_close_at), p_hard_deadline),
+            hard_deadline = p_hard_deadline
+        WHERE id = v_auction_ids[1];
+    END IF;
+    RETURN NEXT;
+END
+$$
+""".format(**{name: "'%s'" % value for name, value in STATUS_LITERALS.items()})
+
+PLACE_BID_SQL = """
+SELECT bid_outcome, bid_current_max, bid_demoted, bid_attempt_id, bid_start_slot_id, bid_end_slot_id
+FROM booking_place_bid(%(user_id)s, %(room_id)s, %(date)s, %(start)s, %(end)s, %(amount)s,
+                       %(now)s, %(range_start_at)s, %(close_at)s, %(hard_deadline)s)
+"""
+
+
+def install(using, **kwargs):
+    """ Создает (пересоздает) функцию booking_place_bid; подключается к post_migrate приложения booking. """
+    from django.db import connections
+    db = connections[using]
+    if db.vendor == 'postgresql':
+        with db.cursor() as cursor:
+            cursor.execute(PLACE_BID_FUNCTION_SQL)
+
+
+def supports(funding_group, in_instant_window):
+    """ Может ли ставка пойти через SQL (иначе - services.place_bid). """
+    return connection.vendor == 'postgresql' and funding_group is None and not in_instant_window
+
+
+def _reject(reason, message, start, end, amount, now):
+    from .services import BidResult
+    return BidResult.rejected(engine.BidDecision(engine.REJECT, start, end, amount, now, reason=reason, message=message))
+
+
+def place_bid_sql(user, room, date, start_slot, end_slot, amount, range_start_at, now):
+    """
+    Индивидуальная ставка вне часа до начала одним вызовом booking_place_bid.
+    Возвращает BidResult или None, если ставку должен обработать services.place_bid
+    (нет слотов в БД или у лидера автоставка).
+    """
+    from .services import BidResult
+
+    if range_start_at - now < engine.INSTANT_BOOKING_WINDOW:
+        return None
+    if amount is None or amount < engine.minimum_bid(start_slot, end_slot):
+        return _reject(engine.BELOW_MINIMUM, f"Минимальная ставка {engine.minimum_bid(start_slot, end_slot)} ББ.", start_slot, end_slot, amount, now)
+
+    deadline = engine.hard_deadline(range_start_at)
+    close_at = engine.effective_close(engine.initial_close_time(range_start_at), now, deadline)
+    params = {
+        'user_id': user.pk, 'room_id': room.pk, 'date': date, 'start': start_slot, 'end': end_slot,
+        'amount': amount, 'now': now, 'range_start_at': range_start_at, 'close_at': close_at, 'hard_deadline': deadline,
+    }
+    try:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(PLACE_BID_SQL, params)
+                outcome, current_max, demoted, attempt_id, start_slot_id, end_slot_id = cursor.fetchone()
+    except IntegrityError as e:
+        logger.info(f"Ставка пользователя {user.id} на {room} {date} слоты {start_slot}-{end_slot} проиграла гонку: {e}")
+        return BidResult.conflict()
+
+    if outcome in (MISSING_SLOTS, PROXY_LEADER):
+        return None
+    if outcome == INSUFFICIENT_FUNDS:
+        return BidResult(error={"total_bid": f"Недостаточно баллов для ставки {amount} ББ с учетом замороженных ставок."}, status_code=status.HTTP_400_BAD_REQUEST)
+    if outcome == engine.SLOT_TAKEN:
+        return _reject(outcome, "Слот уже забронирован или недоступен.", start_slot, end_slot, amount, now)
+    if outcome == LEADER_MISSING:
+        return _reject(engine.RANGE_INTEGRITY, "Ошибка состояния аукциона (лидер не найден).", start_slot, end_slot, amount, now)
+    if outcome == engine.RANGE_INTEGRITY:
+        return _reject(outcome, "Перебить заявку можно только тем же или более длинным диапазоном, покрывающим ее целиком.", start_slot, end_slot, amount, now)
+    if outcome == engine.LOW_BID:
+        return _reject(outcome, f"Ставка ({amount} ББ) должна быть > текущей ({current_max} ББ).", start_slot, end_slot, amount, now)
+
+    demoted = tuple(demoted or ())
+    decision = engine.BidDecision(
+        engine.OVERBID if current_max is not None else engine.AUCTION_OPEN, start_slot, end_slot, amount, now,
+        demoted=demoted, close_at=close_at, deadline=deadline,
+    )
+    # Заявку для ответа собираем в памяти - без повторного чтения из БД
+    slot_kwargs = {'room': room, 'date': date, 'status': BookingSlotStatus.IN_AUCTION}
+    attempt = BookingAttempt(
+        id=attempt_id, initiator=user, room=room,
+        start_slot=BookingSlot(id=start_slot_id, slot_number=start_slot, **slot_kwargs),
+        end_slot=BookingSlot(id=end_slot_id, slot_number=end_slot, **slot_kwargs),
+        date=date, start_slot_number=start_slot, end_slot_number=end_slot,
+        total_bid=amount, status=BookingAttemptStatus.BIDDING,
+        created_at=now, updated_at=now, booking_date=range_start_at,
+    )
+    logger.info(f"Новая ставка {attempt_id} принята через SQL. Перебиты: {list(demoted)}.")
+    return BidResult(attempt=attempt, decision=decision)
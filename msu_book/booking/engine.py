@@ -0,0 +1,310 @@
+"""
+Чистое (без ORM) ядро правил аукциона.
+
+Состояние одного дня одной аудитории хранится компактно (RoomDay): bytearray
+статусов слотов и массив id лидирующих заявок, плюс словарь диапазонов лидеров.
+Функции ядра только принимают решения; запись в БД делают представления,
+пакетная бронь и задача Celery (см. booking.services), а инструмент
+auction_replay прогоняет через ядро потоки ставок без базы данных.
+
+Правила (см. README):
+- целостность диапазона: перебить заявку можно только тем же или более длинным
+  диапазоном, целиком покрывающим диапазон текущего лидера;
+- аукцион закрывается за 1 час до начала первого слота диапазона;
+- овертайм: ставка в последние 3 минуты продлевает аукцион до "ставка + 3 мин";
+- жесткий дедлайн: не позже чем за 20 минут до начала первого слота;
+- мгновенная бронь: меньше чем за час до начала свободный диапазон бронируется
+  сразу по минимальной цене (1 ББ за слот);
+- автоставка: лидер с максимумом (max_amount) на тот же диапазон сам поднимает
+  ставку до "ставка соперника + 1 ББ", пока хватает максимума; соперник с максимумом
+  становится лидером по минимально выигрывающей цене.
+"""
+import datetime
+from array import array
+
+from main.models import BookingSlotStatus, TIME_SLOTS_DETAILS
+
+SLOTS_PER_DAY = len(TIME_SLOTS_DETAILS)
+
+# Компактные коды статусов слота
+FREE = 0
+AUCTION = 1
+BOOKED = 2
+UNAVAILABLE = 3
+
+STATUS_CODES = {
+    BookingSlotStatus.AVAILABLE: FREE,
+    BookingSlotStatus.IN_AUCTION: AUCTION,
+    BookingSlotStatus.BOOKED: BOOKED,
+    BookingSlotStatus.UNAVAILABLE: UNAVAILABLE,
+}
+
+AUCTION_CLOSE_BEFORE_START = datetime.timedelta(hours=1)
+OVERTIME = datetime.timedelta(minutes=3)
+HARD_DEADLINE_BEFORE_START = datetime.timedelta(minutes=20)
+INSTANT_BOOKING_WINDOW = datetime.timedelta(hours=1)
+POINTS_PER_SLOT = 1
+MIN_INCREMENT = 1 # Минимальный шаг перебития (ставка должна быть > текущей)
+
+# Виды решений по ставке
+INSTANT = 'instant'
+AUCTION_OPEN = 'auction_open'
+OVERBID = 'overbid'
+REJECT = 'reject'
+
+# Коды отказов
+SLOT_TAKEN = 'slot_taken'
+AUCTION_RUNNING = 'auction_running'
+RANGE_INTEGRITY = 'range_integrity'
+LOW_BID = 'low_bid'
+BELOW_MINIMUM = 'below_minimum'
+AUCTION_CLOSED = 'auction_closed'
+SLOT_STARTED = 'slot_started'
+OUTBID_BY_PROXY = 'outbid_by_proxy'
+
+# Решения по закрытию
+CLOSE_WAIT = 'wait'
+CLOSE_EXTEND = 'extend'
+CLOSE_SETTLE = 'settle'
+
+
+def slot_start(date, slot_number, tzinfo=None):
+    """ Время начала слота; tzinfo - таймзона, в которой заданы TIME_SLOTS_DETAILS. """
+    return datetime.datetime.combine(date, TIME_SLOTS_DETAILS[slot_number]['start'], tzinfo=tzinfo)
+
+
+def slot_end(date, slot_number, tzinfo=None):
+    return datetime.datetime.combine(date, TIME_SLOTS_DETAILS[slot_number]['end'], tzinfo=tzinfo)
+
+
+def initial_close_time(range_start_at):
+    """ Плановое закрытие аукциона: за час до начала первого слота диапазона. """
+    return range_start_at - AUCTION_CLOSE_BEFORE_START
+
+
+def hard_deadline(range_start_at):
+    """ Жесткий дедлайн аукциона: за 20 минут до начала первого слота. """
+    return range_start_at - HARD_DEADLINE_BEFORE_START
+
+
+def effective_close(close_at, last_bid_at=None, deadline=None):
+    """
+    Фактическое время закрытия с учетом овертайма: min(max(close_at, last_bid_at + 3 мин), дедлайн).
+    Общее правило для ставок (открыт ли аукцион, до какого времени он продлен) и закрывателя.
+    """
+    end = close_at
+    if last_bid_at is not None:
+        overtime_end = last_bid_at + OVERTIME
+        end = overtime_end if end is None else max(end, overtime_end)
+    if deadline is not None and end is not None:
+        end = min(end, deadline)
+    return end
+
+
+def minimum_bid(start_slot, end_slot):
+    return (end_slot - start_slot + 1) * POINTS_PER_SLOT
+
+
+class Leader:
+    """
+    Лидирующая заявка на дне аудитории.
+    max_amount - максимум автоставки, уже ограниченный доступными баллами (None - без автоставки).
+    """
+    __slots__ = ('attempt_id', 'start', 'end', 'amount', 'last_bid_at', 'close_at', 'deadline', 'max_amount')
+
+    def __init__(self, attempt_id, start, end, amount, last_bid_at=None, close_at=None, deadline=None, max_amount=None):
+        self.attempt_id = attempt_id
+        self.start = start
+        self.end = end
+        self.amount = amount
+        self.last_bid_at = last_bid_at
+        self.close_at = close_at
+        self.deadline = deadline
+        self.max_amount = max_amount
+
+    @property
+    def top(self):
+        """ Сколько лидер готов поставить: текущая ставка или максимум автоставки. """
+        return max(self.amount, self.max_amount or 0)
+
+
+class RoomDay:
+    """
+    Состояние аукционов одной аудитории на одну дату.
+    status[n] и leader[n] индексируются номером слота (1..14), индекс 0 не используется.
+    """
+    __slots__ = ('status', 'leader', 'leaders')
+
+    def __init__(self):
+        self.status = bytearray(SLOTS_PER_DAY + 1)
+        self.leader = array('q', bytes(8 * (SLOTS_PER_DAY + 1)))
+        self.leaders = {}
+
+    def set_slot(self, slot_number, status_code, leader_id=0):
+        self.status[slot_number] = status_code
+        self.leader[slot_number] = leader_id or 0
+
+    def add_leader(self, leader):
+        self.leaders[leader.attempt_id] = leader
+        for n in range(leader.start, leader.end + 1):
+            self.status[n] = AUCTION
+            self.leader[n] = leader.attempt_id
+
+    def apply(self, decision, attempt_id):
+        """ Применяет принятое решение к состоянию (используется реплеем и последовательными обработчиками). """
+        if decision.raised is not None:
+            leader = self.leaders.get(decision.raised[0])
+            if leader is not None:
+                leader.amount = decision.raised[1]
+                leader.last_bid_at = decision.now
+                leader.close_at = effective_close(leader.close_at, decision.now, leader.deadline)
+        if decision.kind == REJECT:
+            return
+        for leader_id in decision.demoted:
+            self.leaders.pop(leader_id, None)
+        if decision.kind == INSTANT:
+            for n in range(decision.start, decision.end + 1):
+                self.set_slot(n, BOOKED)
+            return
+        self.add_leader(Leader(
+            attempt_id, decision.start, decision.end, decision.amount,
+            last_bid_at=decision.now, close_at=decision.close_at, deadline=decision.deadline,
+            max_amount=decision.max_amount,
+        ))
+
+    def settle(self, attempt_id):
+        """ Закрывает аукцион лидера: его слоты становятся BOOKED. """
+        leader = self.leaders.pop(attempt_id, None)
+        if leader is not None:
+            for n in range(leader.start, leader.end + 1):
+                self.set_slot(n, BOOKED)
+        return leader
+
+
+class BidDecision:
+    """
+    Решение по ставке. raised - (id лидера, новая сумма), если ставку отбила автоставка лидера:
+    ставка отклонена, но сумму лидера нужно поднять.
+    """
+    __slots__ = ('kind', 'reason', 'message', 'start', 'end', 'amount', 'demoted', 'close_at', 'deadline', 'now', 'max_amount', 'raised')
+
+    def __init__(self, kind, start, end, amount, now, reason=None, message=None, demoted=(), close_at=None, deadline=None,
+                 max_amount=None, raised=None):
+        self.kind = kind
+        self.reason = reason
+        self.message = message
+        self.start = start
+        self.end = end
+        self.amount = amount
+        self.demoted = demoted
+        self.close_at = close_at
+        self.deadline = deadline
+        self.now = now
+        self.max_amount = max_amount
+        self.raised = raised
+
+    @property
+    def accepted(self):
+        return self.kind != REJECT
+
+
+def _reject(reason, message, start, end, amount, now):
+    return BidDecision(REJECT, start, end, amount, now, reason=reason, message=message)
+
+
+def evaluate_bid(day, start, end, amount, now, range_start_at, max_amount=None):
+    """
+    Решает судьбу ставки amount на диапазон [start, end] без побочных эффектов.
+
+    range_start_at - время начала первого слота (в той же таймзоне, что и now).
+    Для мгновенной брони amount игнорируется: цена всегда минимальная.
+    max_amount - максимум автоставки (уже ограниченный доступными баллами): в споре ставка
+    сама поднимается до минимально выигрывающей, но не выше максимума.
+    """
+    if range_start_at <= now:
+        return _reject(SLOT_STARTED, "Слот уже начался.", start, end, amount, now)
+
+    status = day.status
+    leader_ids = set()
+    for n in range(start, end + 1):
+        code = status[n]
+        if code == BOOKED or code == UNAVAILABLE:
+            return _reject(SLOT_TAKEN, f"Слот {n} уже забронирован или недоступен.", start, end, amount, now)
+        if code == AUCTION:
+            leader_ids.add(day.leader[n])
+
+    leaders = [day.leaders[i] for i in leader_ids if i in day.leaders]
+    in_instant_window = (range_start_at - now) < INSTANT_BOOKING_WINDOW
+
+    if in_instant_window:
+        if not leader_ids:
+            price = minimum_bid(start, end)
+            return BidDecision(INSTANT, start, end, price, now)
+        # В последний час перебивать можно только аукцион в овертайме, до жесткого дедлайна
+        still_open = leaders and all(
+            now < (effective_close(leader.close_at, leader.last_bid_at, leader.deadline) or now)
+            for leader in leaders
+        )
+        if not still_open:
+            return _reject(AUCTION_RUNNING, "Невозможно мгновенно забронировать, так как аукцион уже идет.", start, end, amount, now)
+
+    deadline = hard_deadline(range_start_at)
+    if now >= deadline:
+        return _reject(AUCTION_CLOSED, "Прием ставок на этот диапазон завершен.", start, end, amount, now)
+
+    if amount is None or amount < minimum_bid(start, end):
+        return _reject(BELOW_MINIMUM, f"Минимальная ставка {minimum_bid(start, end)} ББ.", start, end, amount, now)
+
+    if len(leaders) != len(leader_ids):
+        # Слот ссылается на лидера, которого нет в состоянии - состояние неконсистентно
+        return _reject(RANGE_INTEGRITY, "Ошибка состояния аукциона (лидер не найден).", start, end, amount, now)
+
+    for leader in leaders:
+        if leader.start < start or leader.end > end:
+            return _reject(
+                RANGE_INTEGRITY,
+                f"Перебить заявку на слоты {leader.start}-{leader.end} можно только тем же или более длинным диапазоном, покрывающим ее целиком.",
+                start, end, amount, now,
+            )
+
+    current_max = max((leader.amount for leader in leaders), default=0)
+    top = max(amount, max_amount or 0)
+    if leaders and top <= current_max:
+        return _reject(LOW_BID, f"Ставка ({top} ББ) должна быть > текущей ({current_max} ББ).", start, end, amount, now)
+
+    # Автоставка лидера защищает только свой диапазон: более длинный диапазон она не перебивает
+    defender = leaders[0] if len(leaders) == 1 and leaders[0].max_amount and (leaders[0].start, leaders[0].end) == (start, end) else None
+    if defender is not None and top <= defender.top:
+        # При равных максимумах выигрывает более ранняя ставка
+        raised = min(defender.top, top + MIN_INCREMENT)
+        decision = _reject(OUTBID_BY_PROXY, f"Ставку перебила автоставка лидера, текущая ставка {raised} ББ.", start, end, amount, now)
+        decision.raised = (defender.attempt_id, raised)
+        return decision
+
+    if leaders and max_amount:
+        # Автоставка занимает лидерство по минимально выигрывающей цене
+        opponent = defender.top if defender is not None else current_max
+        amount = max(amount, min(top, opponent + MIN_INCREMENT))
+
+    # Перебитие не сбрасывает уже продленное закрытие: берется самое позднее из планового и закрытий
+    # перебитых аукционов, а сама ставка в последние 3 минуты продлевает его (не дальше дедлайна)
+    close_at = max([initial_close_time(range_start_at)] + [leader.close_at for leader in leaders if leader.close_at])
+    return BidDecision(
+        OVERBID if leaders else AUCTION_OPEN, start, end, amount, now,
+        demoted=tuple(leader.attempt_id for leader in leaders),
+        close_at=effective_close(close_at, now, deadline), deadline=deadline,
+        max_amount=max_amount if max_amount and max_amount > amount else None,
+    )
+
+
+def evaluate_close(now, close_at, last_bid_at, deadline=None):
+    """
+    Решение закрывателя по одному аукциону: ждать, продлить (овертайм) или закрыть.
+    Возвращает (решение, новое время закрытия или None).
+    """
+    if close_at and now < close_at:
+        return CLOSE_WAIT, close_at
+    end = effective_close(close_at, last_bid_at, deadline)
+    if end is not None and now < end:
+        return CLOSE_EXTEND, end
+    return CLOSE_SETTLE, None
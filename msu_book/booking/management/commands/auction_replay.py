@@ -0,0 +1,123 @@
+import datetime
+import json
+import random
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from main.models import BookingAttempt
+from booking import engine
+
+
+class Command(BaseCommand):
+    help = ('Прогоняет поток ставок (записанный или синтетический) через ядро аукциона без БД '
+            'и измеряет пропускную способность ядра (ставок в секунду)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--input', help='JSONL-файл со ставками: room, date, start, end, amount, at (ISO).')
+        parser.add_argument('--export', help='Выгрузить историю заявок из БД в JSONL-файл и выйти.')
+        parser.add_argument('--bids', type=int, default=200000, help='Количество синтетических ставок.')
+        parser.add_argument('--rooms', type=int, default=50, help='Количество аудиторий в синтетическом потоке.')
+        parser.add_argument('--days', type=int, default=14, help='Горизонт дат синтетического потока.')
+        parser.add_argument('--seed', type=int, default=1, help='Seed генератора синтетического потока.')
+        parser.add_argument('--repeat', type=int, default=3, help='Количество прогонов (берется лучший).')
+
+    def handle(self, *args, **options):
+        if options['export']:
+            count = self.export(options['export'])
+            self.stdout.write(f"Выгружено {count} заявок в {options['export']}.")
+            return
+
+        if options['input']:
+            bids = self.load(options['input'])
+        else:
+            bids = self.synthetic(options['bids'], options['rooms'], options['days'], options['seed'])
+        if not bids:
+            raise CommandError("Поток ставок пуст.")
+
+        best = None
+        for _ in range(max(options['repeat'], 1)):
+            elapsed, outcomes, settled = self.replay(bids)
+            if best is None or elapsed < best[0]:
+                best = (elapsed, outcomes, settled)
+        elapsed, outcomes, settled = best
+
+        self.stdout.write(f"Ставок: {len(bids)}, время ядра: {elapsed:.3f} с, {len(bids) / elapsed:,.0f} ставок/с")
+        for outcome, count in sorted(outcomes.items()):
+            self.stdout.write(f"  {outcome}: {count}")
+        self.stdout.write(f"  закрыто аукционов в конце потока: {settled}")
+
+    @staticmethod
+    def replay(bids):
+        """ Один прогон: все ставки через evaluate_bid/apply, затем закрытие оставшихся аукционов. """
+        days = {}
+        outcomes = Counter()
+        evaluate_bid = engine.evaluate_bid
+        slot_start = engine.slot_start
+        attempt_id = 0
+        started = time.perf_counter()
+        for room, date, start, end, amount, at in bids:
+            day = days.get((room, date))
+            if day is None:
+                day = days[(room, date)] = engine.RoomDay()
+            decision = evaluate_bid(day, start, end, amount, at, slot_start(date, start))
+            attempt_id += 1
+            day.apply(decision, attempt_id)
+            outcomes[decision.reason or decision.kind] += 1
+
+        settled = 0
+        final_time = bids[-1][5]
+        for day in days.values():
+            for leader in list(day.leaders.values()):
+                if engine.evaluate_close(final_time, leader.close_at, leader.last_bid_at, leader.deadline)[0] == engine.CLOSE_SETTLE:
+                    day.settle(leader.attempt_id)
+                    settled += 1
+        return time.perf_counter() - started, outcomes, settled
+
+    @staticmethod
+    def synthetic(count, rooms, days, seed):
+        """ Синтетический поток: ставки идут по времени, даты в пределах горизонта, диапазоны 1-3 слота. """
+        rng = random.Random(seed)
+        now = datetime.datetime(2025, 1, 6, 8, 0)
+        dates = [now.date() + datetime.timedelta(days=d) for d in range(days)]
+        bids = []
+        for _ in range(count):
+            now += datetime.timedelta(seconds=rng.randint(0, 3))
+            start = rng.randint(1, engine.SLOTS_PER_DAY)
+            end = min(start + rng.randint(0, 2), engine.SLOTS_PER_DAY)
+            bids.append((rng.randrange(rooms), rng.choice(dates), start, end, rng.randint(1, 40), now))
+        return bids
+
+    @staticmethod
+    def load(path):
+        bids = []
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                bids.append((
+                    row['room'], datetime.date.fromisoformat(row['date']), row['start'], row['end'],
+                    row['amount'], datetime.datetime.fromisoformat(row['at']),
+                ))
+        bids.sort(key=lambda bid: bid[5])
+        return bids
+
+    @staticmethod
+    def export(path):
+        """ Выгружает историю заявок (в порядке создания) в формате --input, время - наивное локальное. """
+        rows = BookingAttempt.objects.order_by('created_at').values_list(
+            'room_id', 'start_slot__date', 'start_slot__slot_number', 'end_slot__slot_number', 'total_bid', 'created_at',
+        )
+        count = 0
+        with open(path, 'w', encoding='utf-8') as f:
+            for room_id, date, start, end, amount, created_at in rows.iterator():
+                at = timezone.make_naive(created_at) if timezone.is_aware(created_at) else created_at
+                f.write(json.dumps({
+                    'room': room_id, 'date': date.isoformat(), 'start': start, 'end': end,
+                    'amount': amount, 'at': at.isoformat(),
+                }) + '\n')
+                count += 1
+        return count
@@ -0,0 +1,99 @@
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Exists, Max, Min, OuterRef
+
+from main.models import (
+    Auction, AuctionStatus, BookingAttempt, BookingAttemptStatus, BookingSlot, BookingSlotStatus,
+)
+from booking import engine
+from booking.services import aware_slot_start
+
+OLD_CLOSE_COLUMN = 'auction_close_time'
+
+
+class Command(BaseCommand):
+    help = ('Создает открытые аукционы (Auction) для торгов, начатых до перехода на таблицу auctions: '
+            'по одной строке на каждую лидирующую заявку в статусе bidding. Время закрытия берется из старой '
+            'колонки booking_slots.auction_close_time, поэтому запускать до ее удаления')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать заявки без аукциона.')
+        parser.add_argument(
+            '--drop-column', action='store_true',
+            help='После успешного переноса удалить колонку booking_slots.auction_close_time.',
+        )
+
+    def handle(self, *args, **options):
+        leaders = self.pending_leaders()
+        if options['dry_run']:
+            self.stdout.write(f"Лидирующих заявок без открытого аукциона: {leaders.count()}.")
+            return
+
+        has_old_column = self.has_old_column()
+        if not has_old_column:
+            self.stdout.write(self.style.WARNING(
+                f"Колонки booking_slots.{OLD_CLOSE_COLUMN} нет: время закрытия считается заново от начала диапазона."
+            ))
+
+        created, conflicts = 0, []
+        for attempt in leaders.select_related('room').iterator():
+            led = BookingSlot.objects.filter(
+                current_highest_attempt=attempt, status=BookingSlotStatus.IN_AUCTION,
+            ).aggregate(date=Min('date'), start=Min('slot_number'), end=Max('slot_number'))
+            range_start = aware_slot_start(led['date'], led['start'])
+            deadline = engine.hard_deadline(range_start)
+            close_at = self.old_close_at(attempt.id) if has_old_column else None
+            if close_at is None:
+                close_at = engine.initial_close_time(range_start)
+            try:
+                with transaction.atomic():
+                    Auction.objects.create(
+                        room=attempt.room, date=led['date'],
+                        start_slot_number=led['start'], end_slot_number=led['end'],
+                        leader=attempt, amount=attempt.total_bid, max_amount=attempt.max_bid,
+                        last_bid_at=attempt.updated_at, close_at=min(close_at, deadline), hard_deadline=deadline,
+                    )
+                created += 1
+            except IntegrityError:
+                conflicts.append(attempt.id)
+
+        self.stdout.write(self.style.SUCCESS(f"Создано открытых аукционов: {created}."))
+        if conflicts:
+            self.stdout.write(self.style.WARNING(
+                f"На диапазон уже есть открытый аукцион (нужно разобрать вручную): {conflicts[:50]}"
+            ))
+            return
+
+        if options['drop_column'] and has_old_column:
+            with connection.cursor() as cursor:
+                cursor.execute(f"ALTER TABLE booking_slots DROP COLUMN {OLD_CLOSE_COLUMN}")
+            self.stdout.write(self.style.SUCCESS(f"Колонка booking_slots.{OLD_CLOSE_COLUMN} удалена."))
+
+    @staticmethod
+    def pending_leaders():
+        # Лидер хотя бы одного слота в аукционе, не ведущий ни одного открытого аукциона
+        return BookingAttempt.objects.filter(
+            status=BookingAttemptStatus.BIDDING,
+        ).filter(
+            Exists(BookingSlot.objects.filter(
+                current_highest_attempt=OuterRef('pk'), status=BookingSlotStatus.IN_AUCTION,
+            )),
+            ~Exists(Auction.objects.filter(leader=OuterRef('pk'), status=AuctionStatus.OPEN)),
+        ).order_by('id')
+
+    @staticmethod
+    def has_old_column():
+        with connection.cursor() as cursor:
+            columns = connection.introspection.get_table_description(cursor, BookingSlot._meta.db_table)
+        return any(column.name == OLD_CLOSE_COLUMN for column in columns)
+
+    @staticmethod
+    def old_close_at(attempt_id):
+        # Овертайм продлевал время у всех слотов лидера, берем самое позднее
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT MAX({OLD_CLOSE_COLUMN}) FROM booking_slots "
+                "WHERE current_highest_attempt_id = %s AND status = %s",
+                [attempt_id, BookingSlotStatus.IN_AUCTION],
+            )
+            return cursor.fetchone()[0]
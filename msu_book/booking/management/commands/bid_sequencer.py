@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from booking.sequencer import PartitionWorker
+
+
+class Command(BaseCommand):
+    help = ('Обработчик очереди ставок (BOOKING_SEQUENCER_ENABLED): по очереди проводит ставки каждой партиции '
+            '(аудитория, дата) строго в порядке поступления. Можно запускать несколько процессов - '
+            'они делят партиции через аренды в Redis')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--partitions', help='Номера партиций через запятую (по умолчанию - все).')
+        parser.add_argument('--max-partitions', type=int,
+                            help='Сколько партиций держит один процесс (по умолчанию - сколько удастся взять).')
+        parser.add_argument('--once', action='store_true', help='Один проход по партициям и выход.')
+
+    def handle(self, *args, **options):
+        partitions = None
+        if options['partitions']:
+            try:
+                partitions = [int(p) for p in options['partitions'].split(',')]
+            except ValueError:
+                raise CommandError("--partitions: ожидаются целые числа через запятую.")
+            if any(p < 0 or p >= settings.BOOKING_SEQUENCER_PARTITIONS for p in partitions):
+                raise CommandError(f"--partitions: номера от 0 до {settings.BOOKING_SEQUENCER_PARTITIONS - 1}.")
+
+        if options['max_partitions'] is not None and options['max_partitions'] < 1:
+            raise CommandError("--max-partitions: ожидается число больше 0.")
+
+        worker = PartitionWorker(partitions, max_partitions=options['max_partitions'])
+        if options['once']:
+            self.stdout.write(f"Обработано ставок: {worker.run_once()}")
+            return
+        self.stdout.write(f"Обработчик {worker.consumer} запущен, партиций: {len(worker.partitions)}.")
+        try:
+            worker.run_forever()
+        except KeyboardInterrupt:
+            self.stdout.write("Остановлен.")
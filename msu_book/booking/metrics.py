@@ -0,0 +1,78 @@
+"""
+Метрики жизненного цикла аукционов: задержка закрытия, объемы работы закрывателя,
+длительность расчетов и текущий хвост просроченных аукционов.
+"""
+from django.db.models import Count, Min, Sum, F
+from django.utils import timezone
+
+from main.models import Auction, AuctionStatus
+from monitoring.registry import REGISTRY, DEFAULT_COUNT_BUCKETS
+
+# Задержка закрытия: от 1 секунды до 30 минут
+LAG_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800)
+
+SETTLEMENT_LAG = REGISTRY.histogram(
+    'auction_settlement_lag_seconds', 'Задержка между Auction.close_at и фактическим закрытием аукциона.',
+    shared=True, buckets=LAG_BUCKETS,
+)
+SETTLEMENT_DURATION = REGISTRY.histogram(
+    'auction_settlement_duration_seconds', 'Длительность транзакции закрытия одного аукциона.',
+    shared=True,
+)
+SETTLEMENT_LOCK_WAIT = REGISTRY.histogram(
+    'auction_settlement_lock_wait_seconds', 'Ожидание блокировок заявки и слотов при закрытии аукциона.',
+    shared=True,
+)
+RUN_AUCTIONS = REGISTRY.histogram(
+    'auction_closer_run_auctions', 'Количество аукционов за один запуск закрывателя.',
+    ('outcome',), shared=True, buckets=DEFAULT_COUNT_BUCKETS,
+)
+AUCTIONS_TOTAL = REGISTRY.counter(
+    'auction_closer_auctions', 'Аукционы, обработанные закрывателем (due/extended/settled/skipped/failed).',
+    ('outcome',), shared=True,
+)
+OVERTIME_EXTENSIONS = REGISTRY.counter(
+    'auction_overtime_extensions', 'Количество продлений аукционов (овертайм).',
+    shared=True,
+)
+LAST_RUN_TIMESTAMP = REGISTRY.gauge(
+    'auction_closer_last_run_timestamp_seconds', 'Время (unix) последнего завершенного запуска закрывателя.',
+    shared=True,
+)
+
+
+def overdue_auction_backlog(now=None):
+    """
+    Текущий хвост: открытые аукционы, у которых close_at уже прошло.
+    Возвращает количество слотов в них, количество аукционов и возраст самого старого (сек).
+    """
+    now = now or timezone.now()
+    stats = Auction.objects.filter(
+        status=AuctionStatus.OPEN,
+        close_at__lte=now,
+    ).aggregate(
+        slots=Sum(F('end_slot_number') - F('start_slot_number') + 1),
+        auctions=Count('id'),
+        oldest=Min('close_at'),
+    )
+    oldest_age = (now - stats['oldest']).total_seconds() if stats['oldest'] else 0
+    return {
+        'overdue_slots': stats['slots'] or 0,
+        'overdue_auctions': stats['auctions'],
+        'oldest_overdue_seconds': oldest_age,
+    }
+
+
+def _collect_backlog():
+    backlog = overdue_auction_backlog()
+    return [
+        ({'kind': 'slots'}, backlog['overdue_slots']),
+        ({'kind': 'auctions'}, backlog['overdue_auctions']),
+        ({'kind': 'oldest_seconds'}, backlog['oldest_overdue_seconds']),
+    ]
+
+
+OVERDUE_BACKLOG = REGISTRY.gauge(
+    'auction_overdue_backlog', 'Просроченные открытые аукционы на момент выгрузки метрик.',
+    ('kind',), collect_fn=_collect_backlog,
+)
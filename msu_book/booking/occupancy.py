@@ -0,0 +1,133 @@
+"""
+Матрица занятости (аудитория × слот) для тепловой карты этажа или корпуса.
+
+Колоночный формат: id и названия аудиторий передаются один раз, затем для каждой даты -
+одна строка из len(rooms) * SLOTS_PER_DAY символов-кодов статуса (аудитория i занимает
+символы [i * SLOTS_PER_DAY, (i + 1) * SLOTS_PER_DAY)). Коды - индексы в CODES.
+
+Строка дня кэшируется под версией дня и версией каталога аудиторий (main.versions),
+поэтому повторные запросы не ходят в БД, пока в этот день не было записей.
+Недостающие дни считаются одним запросом (аудитории LEFT JOIN слоты этих дат).
+"""
+import datetime
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import FilteredRelation, Q
+
+from main import versions
+from main.models import Room, BookingSlotStatus, TIME_SLOTS_DETAILS
+
+logger = logging.getLogger(__name__)
+
+SLOTS_PER_DAY = len(TIME_SLOTS_DETAILS)
+
+CODES = ['available', 'in_auction', 'booked', 'unavailable', 'inactive']
+STATUS_CODES = {
+    BookingSlotStatus.AVAILABLE: '0',
+    BookingSlotStatus.IN_AUCTION: '1',
+    BookingSlotStatus.BOOKED: '2',
+    BookingSlotStatus.UNAVAILABLE: '3',
+}
+CODE_AVAILABLE = '0'
+CODE_INACTIVE = '4'
+
+ROOMS_CACHE_KEY = 'occupancy:rooms:{scope}:{rooms_version}'
+DAY_CACHE_KEY = 'occupancy:day:{date}:{scope}:{rooms_version}:{day_version}'
+
+
+def _rooms_queryset(building, floor):
+    rooms = Room.objects.all()
+    if building is not None:
+        rooms = rooms.filter(building=building)
+    if floor is not None:
+        rooms = rooms.filter(floor=floor)
+    return rooms.order_by('floor', 'name', 'id')
+
+
+def compute_days(dates, building=None, floor=None):
+    """
+    Аудитории и строки кодов для дат одним запросом.
+    Возвращает (rooms, {date: строка кодов}), rooms - список (id, name, floor, is_active).
+    """
+    rooms_queryset = _rooms_queryset(building, floor)
+    if not dates:
+        rooms = list(rooms_queryset.values_list('id', 'name', 'floor', 'is_active'))
+        return rooms, {}
+
+    rows = rooms_queryset.annotate(
+        day_slots=FilteredRelation('booking_slots', condition=Q(booking_slots__date__in=dates)),
+    ).values_list('id', 'name', 'floor', 'is_active', 'day_slots__date', 'day_slots__slot_number', 'day_slots__status')
+
+    rooms = []
+    index = {}
+    cells = []
+    for room_id, name, room_floor, is_active, date, slot_number, slot_status in rows:
+        if room_id not in index:
+            index[room_id] = len(rooms)
+            rooms.append((room_id, name, room_floor, is_active))
+        if date is not None:
+            cells.append((date, index[room_id], slot_number, slot_status))
+
+    days = {}
+    for date in dates:
+        day = []
+        for _, _, _, is_active in rooms:
+            day.extend((CODE_AVAILABLE if is_active else CODE_INACTIVE) * SLOTS_PER_DAY)
+        days[date] = day
+    for date, room_index, slot_number, slot_status in cells:
+        if rooms[room_index][3] and 1 <= slot_number <= SLOTS_PER_DAY:
+            days[date][room_index * SLOTS_PER_DAY + slot_number - 1] = STATUS_CODES.get(slot_status, CODE_AVAILABLE)
+    return rooms, {date: ''.join(day) for date, day in days.items()}
+
+
+def occupancy_matrix(date_from, date_to, building=None, floor=None):
+    """ Матрица занятости в колоночном формате (см. описание модуля). """
+    dates = [date_from + datetime.timedelta(days=offset) for offset in range((date_to - date_from).days + 1)]
+    current = versions.current([versions.ROOMS, *(versions.availability_key(date) for date in dates)])
+    use_cache = versions.cacheable(current)
+
+    rooms, days = None, {}
+    if use_cache:
+        scope = f"{building or '*'}:{'*' if floor is None else floor}"
+        rooms_key = ROOMS_CACHE_KEY.format(scope=scope, rooms_version=current[versions.ROOMS])
+        day_keys = {
+            date: DAY_CACHE_KEY.format(
+                date=date.isoformat(), scope=scope, rooms_version=current[versions.ROOMS],
+                day_version=current[versions.availability_key(date)],
+            )
+            for date in dates
+        }
+        try:
+            cached = cache.get_many([rooms_key, *day_keys.values()])
+        except Exception as e:
+            logger.warning(f"Кэш матрицы занятости недоступен: {e}")
+            cached, use_cache = {}, False
+        rooms = cached.get(rooms_key)
+        days = {date: cached[key] for date, key in day_keys.items() if key in cached}
+
+    missing = [date for date in dates if date not in days]
+    if rooms is None or missing:
+        rooms, computed = compute_days(missing, building, floor)
+        days.update(computed)
+        if use_cache:
+            to_cache = {rooms_key: rooms, **{day_keys[date]: codes for date, codes in computed.items()}}
+            try:
+                cache.set_many(to_cache, timeout=settings.OCCUPANCY_CACHE_TTL)
+            except Exception as e:
+                logger.warning(f"Не удалось закэшировать матрицу занятости: {e}")
+
+    return {
+        'date_from': date_from,
+        'date_to': date_to,
+        'slots_per_day': SLOTS_PER_DAY,
+        'codes': CODES,
+        'rooms': {
+            'id': [room[0] for room in rooms],
+            'name': [room[1] for room in rooms],
+            'floor': [room[2] for room in rooms],
+        },
+        'dates': dates,
+        'matrix': [days[date] for date in dates],
+    }
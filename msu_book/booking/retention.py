@@ -0,0 +1,168 @@
+"""
+Хранение истории: вынос прошедших слотов и завершенных заявок из горячих таблиц.
+
+Заявки переносятся в booking_attempts_archive, слоты прошедших дней сворачиваются
+в одну строку RoomDaySummary на (аудитория, день). Работа идет ограниченными
+пачками: строки каждой пачки выбираются с SELECT ... FOR UPDATE SKIP LOCKED, поэтому
+задача не ждет и не блокирует строки, которые сейчас обрабатывают ставки или закрыватель.
+"""
+import datetime
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Exists, OuterRef
+from django.utils import timezone
+
+from main import versions
+from main.models import (
+    BookingSlot, BookingAttempt, ArchivedBookingAttempt, RoomDaySummary, Auction,
+    BookingSlotStatus, BookingAttemptStatus, AuctionStatus
+)
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_COUNTERS = ('booked_slots', 'unavailable_slots', 'won_attempts', 'instant_attempts', 'points_spent')
+
+
+def _bump_summaries(deltas):
+    """ Прибавляет к сводкам дней накопленные значения: deltas - {(room_id, date): {поле: прирост}}. """
+    if not deltas:
+        return
+    keys = Q()
+    for room_id, date in deltas:
+        keys |= Q(room_id=room_id, date=date)
+    existing = {
+        (summary.room_id, summary.date): summary
+        for summary in RoomDaySummary.objects.select_for_update().filter(keys)
+    }
+    to_create, to_update = [], []
+    for key, delta in deltas.items():
+        summary = existing.get(key)
+        if summary is None:
+            summary = RoomDaySummary(room_id=key[0], date=key[1])
+            to_create.append(summary)
+        else:
+            to_update.append(summary)
+        for field in SUMMARY_COUNTERS:
+            setattr(summary, field, getattr(summary, field) + delta.get(field, 0))
+        summary.booked_mask |= delta.get('booked_mask', 0)
+    RoomDaySummary.objects.bulk_create(to_create)
+    RoomDaySummary.objects.bulk_update(to_update, SUMMARY_COUNTERS + ('booked_mask',))
+
+
+def _new_delta():
+    return defaultdict(int)
+
+
+def archive_attempts(queryset, batch_size=None, max_batches=None):
+    """
+    Переносит заявки из queryset в архив пачками по batch_size. Возвращает количество перенесенных.
+    Выигранные и мгновенные заявки учитываются в сводке дня аудитории.
+    """
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    max_batches = max_batches or settings.ARCHIVE_MAX_BATCHES
+    archived = 0
+    for _ in range(max_batches):
+        with transaction.atomic():
+            ids = list(
+                queryset.select_for_update(skip_locked=True, of=('self',)).order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            rows = BookingAttempt.objects.filter(id__in=ids).values(
+                'id', 'initiator_id', 'room_id', 'start_slot__date', 'start_slot__slot_number', 'end_slot__slot_number',
+                'total_bid', 'funding_group_id', 'status', 'created_at', 'updated_at', 'booking_date',
+            )
+            archive_rows = []
+            deltas = defaultdict(_new_delta)
+            for row in rows:
+                archive_rows.append(ArchivedBookingAttempt(
+                    original_id=row['id'], initiator_id=row['initiator_id'], room_id=row['room_id'],
+                    date=row['start_slot__date'],
+                    start_slot_number=row['start_slot__slot_number'], end_slot_number=row['end_slot__slot_number'],
+                    total_bid=row['total_bid'], funding_group_id=row['funding_group_id'], status=row['status'],
+                    created_at=row['created_at'], updated_at=row['updated_at'], booking_date=row['booking_date'],
+                ))
+                if row['status'] in (BookingAttemptStatus.WON, BookingAttemptStatus.INSTANT_BOOKED):
+                    delta = deltas[(row['room_id'], row['start_slot__date'])]
+                    delta['won_attempts' if row['status'] == BookingAttemptStatus.WON else 'instant_attempts'] += 1
+                    delta['points_spent'] += row['total_bid']
+            # ignore_conflicts: пачка могла быть заархивирована, но не удалена при сбое предыдущего запуска
+            ArchivedBookingAttempt.objects.bulk_create(archive_rows, ignore_conflicts=True)
+            _bump_summaries(deltas)
+            versions.bump_attempts(ids)
+            BookingAttempt.objects.filter(id__in=ids).delete()
+        archived += len(ids)
+        if len(ids) < batch_size:
+            break
+    return archived
+
+
+def archive_past_slots(cutoff_date, batch_size=None, max_batches=None):
+    """
+    Сворачивает слоты с датой раньше cutoff_date в RoomDaySummary и удаляет их.
+    Слоты, на которые еще ссылаются заявки (start_slot/end_slot), и слоты IN_AUCTION не трогаются.
+    """
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    max_batches = max_batches or settings.ARCHIVE_MAX_BATCHES
+    referenced = BookingAttempt.objects.filter(Q(start_slot=OuterRef('pk')) | Q(end_slot=OuterRef('pk')))
+    candidates = BookingSlot.objects.filter(date__lt=cutoff_date).exclude(
+        status=BookingSlotStatus.IN_AUCTION,
+    ).exclude(Exists(referenced))
+
+    archived = 0
+    for _ in range(max_batches):
+        with transaction.atomic():
+            slots = list(
+                candidates.select_for_update(skip_locked=True).order_by('date', 'room_id', 'slot_number')
+                .values_list('id', 'room_id', 'date', 'slot_number', 'status')[:batch_size]
+            )
+            if not slots:
+                break
+            deltas = defaultdict(_new_delta)
+            for _, room_id, date, slot_number, slot_status in slots:
+                delta = deltas[(room_id, date)]
+                if slot_status == BookingSlotStatus.BOOKED:
+                    delta['booked_slots'] += 1
+                    delta['booked_mask'] |= 1 << (slot_number - 1)
+                elif slot_status == BookingSlotStatus.UNAVAILABLE:
+                    delta['unavailable_slots'] += 1
+            _bump_summaries(deltas)
+            BookingSlot.objects.filter(id__in=[slot[0] for slot in slots]).delete()
+        archived += len(slots)
+        if len(slots) < batch_size:
+            break
+    return archived
+
+
+def purge_closed_auctions(cutoff_date):
+    """ Закрытые аукционы прошедших дней не нужны: результат уже в заявках и сводках. """
+    deleted, _ = Auction.objects.filter(date__lt=cutoff_date).exclude(status=AuctionStatus.OPEN).delete()
+    return deleted
+
+
+def run_retention(now=None):
+    """
+    Один проход хранения: заявки прошедших дней и давние LOST/CANCELLED заявки -> архив,
+    затем слоты прошедших дней -> сводки, затем закрытые аукционы.
+    """
+    now = now or timezone.now()
+    cutoff_date = timezone.localdate(now) - datetime.timedelta(days=settings.ARCHIVE_RETENTION_DAYS)
+    stale_before = now - datetime.timedelta(days=settings.ARCHIVE_RETENTION_DAYS)
+
+    attempts = BookingAttempt.objects.filter(
+        Q(start_slot__date__lt=cutoff_date) & ~Q(status=BookingAttemptStatus.BIDDING)
+        | Q(status__in=[BookingAttemptStatus.LOST, BookingAttemptStatus.CANCELLED], updated_at__lt=stale_before)
+    )
+    result = {
+        'attempts': archive_attempts(attempts),
+        'slots': archive_past_slots(cutoff_date),
+        'auctions': purge_closed_auctions(cutoff_date),
+    }
+    logger.info(
+        f"Хранение: до {cutoff_date} в архив перенесено {result['attempts']} заявок, "
+        f"свернуто {result['slots']} слотов, удалено {result['auctions']} закрытых аукционов."
+    )
+    return result
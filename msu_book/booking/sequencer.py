@@ -0,0 +1,312 @@
+"""
+Последовательная обработка ставок через Redis Streams (режим BOOKING_SEQUENCER_ENABLED).
+
+Вместо того чтобы десятки запросов одновременно конкурировали за одни и те же строки
+слотов популярной аудитории, представление кладет ставку в поток своей партиции
+и сразу отвечает билетом. Партиция выбирается по (аудитория, дата), поэтому все
+ставки одного дня аудитории попадают в один поток и обрабатываются строго по порядку.
+
+Поток каждой партиции в любой момент читает только один обработчик: он берет
+аренду партиции (SET NX PX) и держит ее, продлевая, пока жив. Новые записи всех своих
+партиций обработчик ждет одним блокирующим XREADGROUP ... BLOCK, проводит каждую ставку
+через services.submit_bid и записывает результат в ключ билета. Обработчики запускаются
+командой bid_sequencer (сколько угодно процессов - они делят партиции через аренды,
+свободную партицию упавшего обработчика забирает другой). Клиент получает результат
+long-poll запросом к /booking/tickets/<ticket>/.
+"""
+import datetime
+import json
+import logging
+import time
+import uuid
+import zlib
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+
+from main.models import User, Room, BookingGroup
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = 'bids:stream:{}'
+LEASE_KEY = 'bids:lease:{}'
+TICKET_KEY = 'bids:ticket:{}'
+NOTIFY_KEY = 'bids:ticket:{}:ready'
+CONSUMER_GROUP = 'bid-sequencer'
+
+TICKET_QUEUED = 'queued'
+TICKET_DONE = 'done'
+
+# Аренду снимает и продлевает только ее владелец: GET и DEL/PEXPIRE отдельными командами
+# могли бы задеть аренду, которую после истечения нашей уже взял другой обработчик
+RELEASE_LEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+RENEW_LEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        import redis
+        _client = redis.Redis.from_url(settings.BOOKING_SEQUENCER_REDIS_URL)
+    return _client
+
+
+def partition_for(room_id, date):
+    """ Номер партиции для дня аудитории: стабилен между процессами (crc32, а не hash()). """
+    return zlib.crc32(f'{room_id}:{date.isoformat()}'.encode()) % settings.BOOKING_SEQUENCER_PARTITIONS
+
+
+def enqueue_bid(user, room, date, start_slot, end_slot, total_bid=None, funding_group=None, max_bid=None):
+    """ Кладет ставку в поток партиции и возвращает id билета. """
+    client = get_client()
+    ticket = uuid.uuid4().hex
+    ttl = settings.BOOKING_SEQUENCER_TICKET_TTL
+    client.set(TICKET_KEY.format(ticket), json.dumps({'status': TICKET_QUEUED, 'user_id': user.pk}), ex=ttl)
+    client.xadd(
+        STREAM_KEY.format(partition_for(room.pk, date)),
+        {
+            'ticket': ticket,
+            'user_id': user.pk,
+            'room_id': room.pk,
+            'date': date.isoformat(),
+            'start_slot': start_slot,
+            'end_slot': end_slot,
+            'total_bid': '' if total_bid is None else total_bid,
+            'funding_group_id': '' if funding_group is None else funding_group.pk,
+            'max_bid': '' if max_bid is None else max_bid,
+        },
+        maxlen=settings.BOOKING_SEQUENCER_STREAM_MAXLEN, approximate=True,
+    )
+    return ticket
+
+
+def get_ticket(ticket):
+    raw = get_client().get(TICKET_KEY.format(ticket))
+    return json.loads(raw) if raw else None
+
+
+def wait_ticket(ticket, timeout):
+    """
+    Long-poll: ждет результат билета не дольше timeout секунд.
+    Возвращает состояние билета (queued или done) или None, если билет неизвестен или истек.
+    """
+    client = get_client()
+    deadline = time.monotonic() + timeout
+    while True:
+        state = get_ticket(ticket)
+        remaining = deadline - time.monotonic()
+        if state is None or state['status'] == TICKET_DONE or remaining <= 0:
+            return state
+        # Обработчик пушит в список уведомлений после записи результата
+        client.blpop(NOTIFY_KEY.format(ticket), timeout=max(1, int(remaining)))
+
+
+def _finish_ticket(client, ticket, user_id, status_code, body):
+    ttl = settings.BOOKING_SEQUENCER_TICKET_TTL
+    pipe = client.pipeline()
+    pipe.set(TICKET_KEY.format(ticket), json.dumps(
+        {'status': TICKET_DONE, 'user_id': user_id, 'status_code': status_code, 'body': body},
+        cls=DjangoJSONEncoder,
+    ), ex=ttl)
+    pipe.rpush(NOTIFY_KEY.format(ticket), 1)
+    pipe.expire(NOTIFY_KEY.format(ticket), ttl)
+    pipe.execute()
+
+
+def process_entry(fields, now=None):
+    """ Проводит одну ставку из потока через services.submit_bid. Возвращает (HTTP-статус, тело ответа). """
+    from .serializers import BookingAttemptDetailSerializer
+    from .services import submit_bid
+
+    try:
+        user = User.objects.get(pk=int(fields['user_id']))
+        room = Room.objects.get(pk=int(fields['room_id']), is_active=True)
+        funding_group = BookingGroup.objects.get(pk=int(fields['funding_group_id'])) if fields['funding_group_id'] else None
+    except (User.DoesNotExist, Room.DoesNotExist, BookingGroup.DoesNotExist) as e:
+        return 404, {'error': f"Объект не найден: {e}"}
+
+    result = submit_bid(
+        user, room, datetime.date.fromisoformat(fields['date']),
+        int(fields['start_slot']), int(fields['end_slot']),
+        int(fields['total_bid']) if fields['total_bid'] else None,
+        funding_group=funding_group, now=now,
+        # Записи, поставленные в очередь до появления автоставок, поля max_bid не имеют
+        max_bid=int(fields['max_bid']) if fields.get('max_bid') else None,
+    )
+    if not result.ok:
+        return result.status_code, result.error
+    return 201, BookingAttemptDetailSerializer(result.attempt).data
+
+
+class PartitionWorker:
+    """
+    Обработчик партиций одного процесса. Партицию читает только владелец аренды;
+    записи подтверждаются (XACK) после записи результата билета, поэтому после падения
+    обработчика следующий владелец сначала дочитывает неподтвержденные записи.
+    """
+
+    def __init__(self, partitions=None, batch_size=None, lease_ms=None, max_partitions=None):
+        self.client = get_client()
+        self.partitions = list(partitions) if partitions is not None else list(range(settings.BOOKING_SEQUENCER_PARTITIONS))
+        self.batch_size = batch_size or settings.BOOKING_SEQUENCER_BATCH_SIZE
+        self.lease_ms = lease_ms or settings.BOOKING_SEQUENCER_LEASE_MS
+        # Ожидание новых записей короче аренды: между ожиданиями аренды продлеваются
+        self.block_ms = min(settings.BOOKING_SEQUENCER_BLOCK_MS, self.lease_ms // 3)
+        self.max_partitions = max_partitions or len(self.partitions)
+        self.consumer = uuid.uuid4().hex
+        self.owned = set()
+        self._groups_ready = set()
+        self._release_script = self.client.register_script(RELEASE_LEASE_LUA)
+        self._renew_script = self.client.register_script(RENEW_LEASE_LUA)
+        self._stopped = False
+
+    def _ensure_group(self, stream):
+        if stream in self._groups_ready:
+            return
+        import redis
+        try:
+            self.client.xgroup_create(stream, CONSUMER_GROUP, id='0', mkstream=True)
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        self._groups_ready.add(stream)
+
+    def _acquire(self, partition):
+        return bool(self.client.set(LEASE_KEY.format(partition), self.consumer, nx=True, px=self.lease_ms))
+
+    def _renew(self, partition):
+        return bool(self._renew_script(keys=[LEASE_KEY.format(partition)], args=[self.consumer, self.lease_ms]))
+
+    def _release(self, partition):
+        self._release_script(keys=[LEASE_KEY.format(partition)], args=[self.consumer])
+
+    def _claim(self, stream):
+        # Записи, которые взял прежний владелец партиции и не подтвердил (упал посреди пачки)
+        claimed = self.client.xautoclaim(stream, CONSUMER_GROUP, self.consumer, min_idle_time=0, count=self.batch_size)[1]
+        return [(entry_id, raw) for entry_id, raw in claimed if raw]
+
+    def _read(self, stream):
+        claimed = self._claim(stream)
+        if claimed:
+            return claimed
+        response = self.client.xreadgroup(CONSUMER_GROUP, self.consumer, {stream: '>'}, count=self.batch_size)
+        return response[0][1] if response else []
+
+    def _process(self, partition, stream, entries):
+        """
+        Проводит записи партиции по порядку. Останавливается, если аренда потеряна.
+        До и после пачки закрывает устаревшие и сломанные соединения с БД (как Celery перед
+        и после задачи): обработчик живет долго, и CONN_MAX_AGE без этого не действует.
+        """
+        if not entries:
+            return 0
+        close_old_connections()
+        try:
+            return self._process_entries(partition, stream, entries)
+        finally:
+            close_old_connections()
+
+    def _process_entries(self, partition, stream, entries):
+        processed = 0
+        for entry_id, raw in entries:
+            fields = {k.decode(): v.decode() for k, v in raw.items()}
+            state = get_ticket(fields['ticket'])
+            # Результат уже записан (падение между записью результата и XACK) - второй раз не проводим
+            if state is None or state['status'] != TICKET_DONE:
+                try:
+                    status_code, body = process_entry(fields)
+                except Exception:
+                    logger.error(f"Ошибка обработки ставки {fields.get('ticket')} из очереди:", exc_info=True)
+                    status_code, body = 500, {'error': "Внутренняя ошибка сервера при обработке заявки."}
+                _finish_ticket(self.client, fields['ticket'], int(fields['user_id']), status_code, body)
+            self.client.xack(stream, CONSUMER_GROUP, entry_id)
+            self.client.xdel(stream, entry_id)
+            processed += 1
+            if not self._renew(partition):
+                # Аренда истекла и, возможно, уже у другого обработчика: остаток пачки дочитает он
+                logger.warning(f"Аренда партиции {partition} потеряна обработчиком {self.consumer}.")
+                self.owned.discard(partition)
+                break
+        return processed
+
+    def run_partition(self, partition):
+        """ Обрабатывает одну пачку партиции, если удалось взять аренду. Возвращает число обработанных ставок. """
+        if not self._acquire(partition):
+            return 0
+        stream = STREAM_KEY.format(partition)
+        try:
+            self._ensure_group(stream)
+            return self._process(partition, stream, self._read(stream))
+        finally:
+            self._release(partition)
+
+    def run_once(self):
+        return sum(self.run_partition(partition) for partition in self.partitions)
+
+    def refresh_leases(self):
+        """
+        Продлевает свои аренды и берет свободные партиции (не больше max_partitions).
+        По только что взятой партиции сначала дочитывает неподтвержденные записи прежнего владельца.
+        Возвращает число обработанных ставок.
+        """
+        processed = 0
+        for partition in self.partitions:
+            if partition in self.owned:
+                if not self._renew(partition):
+                    self.owned.discard(partition)
+                continue
+            if len(self.owned) >= self.max_partitions or not self._acquire(partition):
+                continue
+            stream = STREAM_KEY.format(partition)
+            self._ensure_group(stream)
+            self.owned.add(partition)
+            while partition in self.owned:
+                claimed = self._claim(stream)
+                if not claimed:
+                    break
+                processed += self._process(partition, stream, claimed)
+        return processed
+
+    def poll(self):
+        """ Одно блокирующее чтение новых записей всех своих партиций (до block_ms). Возвращает число обработанных ставок. """
+        processed = self.refresh_leases()
+        if not self.owned:
+            # Все партиции заняты другими обработчиками - ждем, не освободится ли какая-нибудь
+            time.sleep(self.block_ms / 1000)
+            return processed
+        partition_of = {STREAM_KEY.format(partition): partition for partition in self.owned}
+        response = self.client.xreadgroup(
+            CONSUMER_GROUP, self.consumer, {stream: '>' for stream in sorted(partition_of)},
+            count=self.batch_size, block=self.block_ms,
+        )
+        for stream, entries in response or []:
+            stream = stream.decode() if isinstance(stream, bytes) else stream
+            partition = partition_of[stream]
+            if partition in self.owned:
+                processed += self._process(partition, stream, entries)
+        return processed
+
+    def stop(self):
+        self._stopped = True
+
+    def run_forever(self):
+        try:
+            while not self._stopped:
+                self.poll()
+        finally:
+            for partition in list(self.owned):
+                self._release(partition)
+            self.owned.clear()
@@ -2,8 +2,9 @@
 from rest_framework import serializers
 from main.models import (
     Room, FloorChoices, BookingAttempt, BookingGroup, User, BookingSlot,
-    TimeSlotNumberChoices, BookingAttemptStatus
+    TimeSlotNumberChoices, BookingAttemptStatus, BuildingChoices, RoomType, TIME_SLOTS_DETAILS
 )
+from django.conf import settings
 import datetime
 from django.utils import timezone
 from django.db.models import Sum # Для подсчета замороженных баллов
@@ -61,6 +62,9 @@ class BookingAttemptCreateSerializer(serializers.Serializer):
 
     # Либо total_bid (для индивидуальной), либо funding_group (для групповой)
     total_bid = serializers.IntegerField(min_value=1, required=False, allow_null=True)
+    # Автоставка: при перебитии на тот же диапазон ставка сама поднимается до max_bid
+    max_bid = serializers.IntegerField(min_value=1, required=False, allow_null=True,
+                                       help_text="Максимум автоставки (только с total_bid). Должен быть обеспечен баллами.")
     funding_group = serializers.PrimaryKeyRelatedField(
         queryset=BookingGroup.objects.all(), # Фильтрация по админу будет во view
         required=False,
@@ -103,6 +107,14 @@ class BookingAttemptCreateSerializer(serializers.Serializer):
                     {"total_bid": f"Минимальная ставка {num_slots} ББ ({num_slots} слот(а/ов) по 1 ББ)."}
                 )
 
+        # 3.1. Автоставка - только для индивидуальной ставки и не ниже самой ставки
+        max_bid = data.get('max_bid')
+        if max_bid is not None:
+            if total_bid is None:
+                raise serializers.ValidationError({"max_bid": "Автоставка доступна только для индивидуальной ставки (total_bid)."})
+            if max_bid < total_bid:
+                raise serializers.ValidationError({"max_bid": "Максимум автоставки не может быть меньше ставки."})
+
         # 4. Проверка, что пользователь является админом группы (если указана)
         # Эту проверку лучше делать во view, т.к. нужен request.user
         # if funding_group:
@@ -116,6 +128,104 @@ class BookingAttemptCreateSerializer(serializers.Serializer):
 
         return data
 
+# --- Сериализаторы для пакетного (повторяющегося) бронирования ---
+class BatchBookingItemSerializer(serializers.Serializer):
+    """ Один диапазон пакета: аудитория, дата и слоты. Групповые ставки в пакете не поддерживаются. """
+    room = serializers.PrimaryKeyRelatedField(queryset=Room.objects.filter(is_active=True))
+    date = serializers.DateField(input_formats=['%Y-%m-%d'])
+    start_slot_number = serializers.ChoiceField(choices=TimeSlotNumberChoices.choices)
+    end_slot_number = serializers.ChoiceField(choices=TimeSlotNumberChoices.choices)
+    total_bid = serializers.IntegerField(min_value=1, required=False, allow_null=True,
+                                         help_text="Ставка за диапазон. По умолчанию - минимальная (1 ББ за слот).")
+
+    def validate(self, data):
+        if data['start_slot_number'] > data['end_slot_number']:
+            raise serializers.ValidationError({"end_slot_number": "Конечный слот не может быть раньше начального."})
+        num_slots = data['end_slot_number'] - data['start_slot_number'] + 1
+        if data.get('total_bid') is not None and data['total_bid'] < num_slots:
+            raise serializers.ValidationError({"total_bid": f"Минимальная ставка {num_slots} ББ."})
+        if data['date'] < timezone.now().date():
+            raise serializers.ValidationError({"date": "Нельзя забронировать на прошедшую дату."})
+        return data
+
+
+class BatchBookingRecurrenceSerializer(serializers.Serializer):
+    """ Правило повторения: одна аудитория и диапазон слотов по выбранным дням недели. """
+    room = serializers.PrimaryKeyRelatedField(queryset=Room.objects.filter(is_active=True))
+    start_slot_number = serializers.ChoiceField(choices=TimeSlotNumberChoices.choices)
+    end_slot_number = serializers.ChoiceField(choices=TimeSlotNumberChoices.choices)
+    date_from = serializers.DateField(input_formats=['%Y-%m-%d'])
+    date_to = serializers.DateField(input_formats=['%Y-%m-%d'])
+    weekdays = serializers.ListField(child=serializers.IntegerField(min_value=0, max_value=6), min_length=1,
+                                     help_text="Дни недели: 0 - понедельник, 6 - воскресенье.")
+    interval_weeks = serializers.IntegerField(min_value=1, max_value=4, default=1, help_text="Каждую N-ю неделю.")
+    total_bid = serializers.IntegerField(min_value=1, required=False, allow_null=True,
+                                         help_text="Ставка за каждое занятие. По умолчанию - минимальная.")
+
+    def validate(self, data):
+        if data['start_slot_number'] > data['end_slot_number']:
+            raise serializers.ValidationError({"end_slot_number": "Конечный слот не может быть раньше начального."})
+        if data['date_to'] < data['date_from']:
+            raise serializers.ValidationError({"date_to": "Конец периода не может быть раньше начала."})
+        if data['date_from'] < timezone.now().date():
+            raise serializers.ValidationError({"date_from": "Нельзя забронировать на прошедшую дату."})
+        return data
+
+
+class BatchBookingCreateSerializer(serializers.Serializer):
+    """
+    Пакетная заявка: либо явный список диапазонов (items), либо правило повторения (recurrence).
+    all_or_nothing=True - при любой ошибке не создается ни одной заявки.
+    """
+    items = BatchBookingItemSerializer(many=True, required=False)
+    recurrence = BatchBookingRecurrenceSerializer(required=False)
+    all_or_nothing = serializers.BooleanField(default=True)
+
+    def validate(self, data):
+        from .batch import expand_recurrence
+
+        items = data.get('items')
+        recurrence = data.get('recurrence')
+        if (items is None) == (recurrence is None):
+            raise serializers.ValidationError("Укажите либо список диапазонов (items), либо правило повторения (recurrence).")
+        if recurrence is not None:
+            items = expand_recurrence(
+                recurrence['room'], recurrence['start_slot_number'], recurrence['end_slot_number'],
+                recurrence['date_from'], recurrence['date_to'], set(recurrence['weekdays']),
+                recurrence['interval_weeks'], recurrence.get('total_bid'),
+            )
+        if not items:
+            raise serializers.ValidationError("Пакет не содержит ни одного диапазона.")
+        max_items = settings.BATCH_BOOKING_MAX_ITEMS
+        if len(items) > max_items:
+            raise serializers.ValidationError(f"Пакет не может содержать больше {max_items} диапазонов.")
+
+        # Диапазоны внутри пакета не должны пересекаться (один пользователь не перебивает сам себя)
+        seen = {}
+        for index, item in enumerate(items):
+            key = (item['room'].id, item['date'])
+            for other_start, other_end, other_index in seen.get(key, []):
+                if item['start_slot_number'] <= other_end and other_start <= item['end_slot_number']:
+                    raise serializers.ValidationError(f"Диапазоны {other_index} и {index} пересекаются.")
+            seen.setdefault(key, []).append((item['start_slot_number'], item['end_slot_number'], index))
+
+        data['items'] = items
+        return data
+
+
+class BatchBookingItemResultSerializer(serializers.Serializer):
+    index = serializers.IntegerField()
+    room = serializers.IntegerField()
+    date = serializers.DateField()
+    start_slot_number = serializers.IntegerField()
+    end_slot_number = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=['created', 'failed'])
+    error = serializers.CharField(required=False)
+    attempt_id = serializers.IntegerField(required=False)
+    attempt_status = serializers.CharField(required=False)
+    total_bid = serializers.IntegerField(required=False)
+
+
 # --- Сериализатор для отображения деталей созданной заявки ---
 class BookingAttemptDetailSerializer(serializers.ModelSerializer):
     """ Сериализатор для отображения деталей заявки. """
@@ -130,7 +240,143 @@ class BookingAttemptDetailSerializer(serializers.ModelSerializer):
         model = BookingAttempt
         fields = [
             'id', 'initiator', 'room', 'start_slot', 'end_slot',
-            'total_bid', 'funding_group', 'status',
+            'total_bid', 'max_bid', 'funding_group', 'status',
             'created_at', 'updated_at'
         ]
-        read_only_fields = fields # Все поля только для чтения
\ No newline at end of file
+        read_only_fields = fields # Все поля только для чтения
+
+
+# --- Сериализаторы для мониторинга аукционов ---
+class OverdueAuctionSerializer(serializers.Serializer):
+    auction_id = serializers.IntegerField()
+    room = serializers.CharField()
+    date = serializers.DateField()
+    start_slot_number = serializers.IntegerField()
+    end_slot_number = serializers.IntegerField()
+    close_at = serializers.DateTimeField()
+    hard_deadline = serializers.DateTimeField()
+    leading_attempt_id = serializers.IntegerField(allow_null=True)
+    overdue_seconds = serializers.FloatField()
+
+
+class AuctionBacklogSerializer(serializers.Serializer):
+    """ Состояние хвоста просроченных аукционов. """
+    overdue_slots = serializers.IntegerField()
+    overdue_auctions = serializers.IntegerField()
+    oldest_overdue_seconds = serializers.FloatField()
+    is_lagging = serializers.BooleanField()
+    oldest_auctions = OverdueAuctionSerializer(many=True)
+
+
+# --- Поиск ближайших свободных окон ---
+class FreeWindowQuerySerializer(serializers.Serializer):
+    """Параметры поиска ближайших свободных окон по всем аудиториям и датам."""
+    duration = serializers.IntegerField(min_value=1, max_value=14, help_text="Длина окна в слотах.")
+    date_from = serializers.DateField(input_formats=['%Y-%m-%d'], required=False, help_text="Начало диапазона дат (по умолчанию сегодня).")
+    date_to = serializers.DateField(input_formats=['%Y-%m-%d'], required=False, help_text="Конец диапазона дат включительно (по умолчанию +6 дней).")
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=10, help_text="Сколько окон вернуть (K).")
+    building = serializers.ChoiceField(choices=BuildingChoices.choices, required=False)
+    floor = serializers.ChoiceField(choices=FloorChoices.choices, required=False)
+    min_capacity = serializers.IntegerField(min_value=1, required=False)
+    room_type = serializers.ChoiceField(choices=RoomType.choices, required=False)
+    features = serializers.CharField(required=False, help_text="Требуемые признаки аудитории через запятую, например 'projector,board'.")
+    include_auction = serializers.BooleanField(default=False, help_text="Включать окна, которые можно перебить ставкой (IN_AUCTION).")
+
+    def validate_features(self, value):
+        return [feature.strip() for feature in value.split(',') if feature.strip()]
+
+    def validate(self, data):
+        date_from = data.get('date_from') or timezone.now().date()
+        date_to = data.get('date_to') or date_from + datetime.timedelta(days=6)
+        if date_from < timezone.now().date():
+            raise serializers.ValidationError({"date_from": "Нельзя искать в прошедших датах."})
+        if date_to < date_from:
+            raise serializers.ValidationError({"date_to": "Конец диапазона не может быть раньше начала."})
+        max_days = settings.FREE_WINDOW_SEARCH_MAX_DAYS
+        if (date_to - date_from).days + 1 > max_days:
+            raise serializers.ValidationError({"date_to": f"Диапазон поиска не может превышать {max_days} дней."})
+        data['date_from'] = date_from
+        data['date_to'] = date_to
+        return data
+
+
+class OccupancyQuerySerializer(serializers.Serializer):
+    """Параметры матрицы занятости (аудитория × слот)."""
+    date_from = serializers.DateField(input_formats=['%Y-%m-%d'], help_text="Первая дата.")
+    date_to = serializers.DateField(input_formats=['%Y-%m-%d'], required=False, help_text="Последняя дата включительно (по умолчанию = date_from).")
+    building = serializers.ChoiceField(choices=BuildingChoices.choices, required=False)
+    floor = serializers.ChoiceField(choices=FloorChoices.choices, required=False)
+
+    def validate(self, data):
+        data['date_to'] = data.get('date_to') or data['date_from']
+        if data['date_to'] < data['date_from']:
+            raise serializers.ValidationError({"date_to": "Конец диапазона не может быть раньше начала."})
+        max_days = settings.OCCUPANCY_MAX_DAYS
+        if (data['date_to'] - data['date_from']).days + 1 > max_days:
+            raise serializers.ValidationError({"date_to": f"Диапазон не может превышать {max_days} дней."})
+        return data
+
+
+class OccupancyRoomsSerializer(serializers.Serializer):
+    """Аудитории матрицы по колонкам: i-й элемент каждого списка относится к i-й аудитории."""
+    id = serializers.ListField(child=serializers.IntegerField())
+    name = serializers.ListField(child=serializers.CharField())
+    floor = serializers.ListField(child=serializers.IntegerField(allow_null=True))
+
+
+class OccupancyMatrixSerializer(serializers.Serializer):
+    """Матрица занятости (только для схемы OpenAPI: ответ собирается в booking.occupancy)."""
+    date_from = serializers.DateField()
+    date_to = serializers.DateField()
+    slots_per_day = serializers.IntegerField()
+    codes = serializers.ListField(child=serializers.CharField(), help_text="Статус по коду: codes[int(символ)].")
+    rooms = OccupancyRoomsSerializer()
+    dates = serializers.ListField(child=serializers.DateField())
+    matrix = serializers.ListField(
+        child=serializers.CharField(),
+        help_text="Для каждой даты строка из len(rooms.id) * slots_per_day кодов; аудитория i - символы [i*slots_per_day, (i+1)*slots_per_day).",
+    )
+
+
+class FreeWindowSerializer(serializers.Serializer):
+    """Найденное окно: аудитория, дата и диапазон слотов."""
+    room_id = serializers.IntegerField(source='room.id')
+    room_name = serializers.CharField(source='room.name')
+    building = serializers.CharField(source='room.building')
+    floor = serializers.IntegerField(source='room.floor', allow_null=True)
+    capacity = serializers.IntegerField(source='room.capacity')
+    room_type = serializers.CharField(source='room.room_type')
+    date = serializers.DateField()
+    start_slot = serializers.IntegerField()
+    end_slot = serializers.IntegerField()
+    start_time = serializers.SerializerMethodField()
+    end_time = serializers.SerializerMethodField()
+    kind = serializers.CharField(help_text="'AVAILABLE' - окно свободно, 'IN_AUCTION' - окно можно перебить ставкой.")
+
+    def get_start_time(self, obj):
+        return TIME_SLOTS_DETAILS[obj['start_slot']]['start'].strftime('%H:%M')
+
+    def get_end_time(self, obj):
+        return TIME_SLOTS_DETAILS[obj['end_slot']]['end'].strftime('%H:%M')
+
+
+class InstantSlotSerializer(serializers.Serializer):
+    """Слот, который можно мгновенно забронировать прямо сейчас (начинается в ближайший час)."""
+    room_id = serializers.IntegerField(source='room.id')
+    room_name = serializers.CharField(source='room.name')
+    building = serializers.CharField(source='room.building')
+    floor = serializers.IntegerField(source='room.floor', allow_null=True)
+    capacity = serializers.IntegerField(source='room.capacity')
+    date = serializers.DateField()
+    slot_number = serializers.IntegerField()
+    starts_at = serializers.DateTimeField()
+    ends_at = serializers.DateTimeField()
+    price = serializers.IntegerField(help_text="Цена мгновенной брони, ББ.")
+
+
+class BidTicketSerializer(serializers.Serializer):
+    """Билет ставки, принятой в очередь (режим BOOKING_SEQUENCER_ENABLED)."""
+    ticket = serializers.CharField()
+    status = serializers.CharField(help_text="queued - в очереди, done - обработана.")
+    status_code = serializers.IntegerField(required=False, help_text="HTTP-статус, который вернул бы синхронный запрос.")
+    result = serializers.JSONField(required=False, help_text="Созданная заявка или ошибка.")
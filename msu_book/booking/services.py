@@ -0,0 +1,411 @@
+"""
+Связка ядра аукциона (booking.engine) с ORM: загрузка состояния дня аудитории,
+вызов ядра и запись его решений в БД.
+
+Слоты одиночной ставки читаются без блокировки: непересечение активных заявок
+гарантирует ограничение исключения booking_attempts_no_overlap в БД, а его
+нарушение при вставке заявки превращается в ответ 409. Слоты записываются одним
+UPDATE с условием на прочитанное состояние (write_slots_checked).
+
+Стратегия задается BOOKING_BID_STRATEGY: 'orm' (по умолчанию, описано выше), 'lock' -
+слоты читаются с SELECT ... FOR UPDATE (пессимистичный вариант для сравнения), 'sql' (один вызов функции
+PostgreSQL, см. booking.bid_sql) или 'advisory' - 'orm' плюс транзакционная advisory-блокировка дня аудитории:
+ставки на один день идут по очереди, и гонка заканчивается ожиданием, а не ответом 409.
+"""
+import logging
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import connection, transaction, IntegrityError
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+from rest_framework import status
+
+from main import versions
+from main.models import (
+    BookingSlot, BookingAttempt, User, GroupContribution, PointTransaction, Auction,
+    BookingSlotStatus, BookingAttemptStatus, AuctionStatus, slot_bounds
+)
+from . import engine, bid_sql
+
+logger = logging.getLogger(__name__)
+
+# Отказ ядра -> (поле ответа, HTTP-статус)
+REJECT_RESPONSES = {
+    engine.SLOT_TAKEN: ('error', status.HTTP_409_CONFLICT),
+    engine.AUCTION_RUNNING: ('error', status.HTTP_409_CONFLICT),
+    engine.RANGE_INTEGRITY: ('error', status.HTTP_409_CONFLICT),
+    engine.AUCTION_CLOSED: ('error', status.HTTP_409_CONFLICT),
+    engine.SLOT_STARTED: ('error', status.HTTP_400_BAD_REQUEST),
+    engine.LOW_BID: ('total_bid', status.HTTP_400_BAD_REQUEST),
+    engine.OUTBID_BY_PROXY: ('total_bid', status.HTTP_409_CONFLICT),
+    engine.BELOW_MINIMUM: ('total_bid', status.HTTP_400_BAD_REQUEST),
+}
+
+CONFLICT_MESSAGE = "Диапазон только что заняла другая заявка, попробуйте еще раз."
+
+
+class RangeChanged(Exception):
+    """ Слоты диапазона изменились между чтением и записью (оптимистичная проверка не прошла). """
+
+
+def aware_slot_start(date, slot_number):
+    return slot_bounds(date, slot_number)[0]
+
+
+class BidResult:
+    """ Результат обработки одиночной ставки: созданная заявка или ошибка для ответа API. """
+    __slots__ = ('attempt', 'decision', 'error', 'status_code')
+
+    def __init__(self, attempt=None, decision=None, error=None, status_code=status.HTTP_201_CREATED):
+        self.attempt = attempt
+        self.decision = decision
+        self.error = error
+        self.status_code = status_code
+
+    @property
+    def ok(self):
+        return self.attempt is not None
+
+    @classmethod
+    def rejected(cls, decision):
+        field, status_code = REJECT_RESPONSES.get(decision.reason, ('error', status.HTTP_409_CONFLICT))
+        return cls(decision=decision, error={field: decision.message}, status_code=status_code)
+
+    @classmethod
+    def conflict(cls):
+        """ Параллельная заявка заняла диапазон раньше (нарушено ограничение в БД). """
+        return cls(error={'error': CONFLICT_MESSAGE}, status_code=status.HTTP_409_CONFLICT)
+
+
+def build_room_day(slots, auctions, proxy_caps=None):
+    """
+    Строит engine.RoomDay по строкам BookingSlot одного дня аудитории.
+    auctions - {leader_id: Auction} открытых аукционов, которые ведут заявки на этих слотах,
+    proxy_caps - {leader_id: максимум автоставки} из load_proxy_caps.
+    """
+    proxy_caps = proxy_caps or {}
+    day = engine.RoomDay()
+    for slot in slots:
+        leader_id = slot.current_highest_attempt_id if slot.status == BookingSlotStatus.IN_AUCTION else 0
+        day.set_slot(slot.slot_number, engine.STATUS_CODES.get(slot.status, engine.UNAVAILABLE), leader_id)
+        auction = auctions.get(leader_id) if leader_id else None
+        if auction is not None and leader_id not in day.leaders:
+            day.leaders[leader_id] = engine.Leader(
+                leader_id, auction.start_slot_number, auction.end_slot_number, auction.amount,
+                last_bid_at=auction.last_bid_at, close_at=auction.close_at, deadline=auction.hard_deadline,
+                max_amount=proxy_caps.get(leader_id),
+            )
+    return day
+
+
+def load_auctions(leader_ids):
+    """ Блокирует открытые аукционы лидеров (в порядке id, чтобы не было взаимоблокировок). """
+    if not leader_ids:
+        return {}
+    return {
+        auction.leader_id: auction
+        for auction in Auction.objects.select_for_update().filter(
+            leader_id__in=leader_ids, status=AuctionStatus.OPEN
+        ).order_by('id')
+    }
+
+
+def load_proxy_caps(auctions):
+    """
+    Максимумы автоставок лидеров, ограниченные их доступными баллами: {leader_id: максимум}.
+    Баланс проверяется в момент автоповышения, а не только при ставке: с тех пор лидер мог
+    заморозить баллы в других ставках. Запросы выполняются, только если у лидеров есть автоставки.
+    """
+    proxies = {auction.leader_id: auction for auction in auctions.values() if auction.max_amount}
+    if not proxies:
+        return {}
+    leaders = list(BookingAttempt.objects.filter(id__in=proxies, funding_group__isnull=True).values_list(
+        'id', 'initiator_id', 'initiator__booking_points'
+    ))
+    frozen = dict(BookingAttempt.objects.filter(
+        initiator_id__in={initiator_id for _, initiator_id, _ in leaders},
+        status=BookingAttemptStatus.BIDDING, funding_group__isnull=True,
+    ).values('initiator_id').annotate(total=Sum('total_bid')).values_list('initiator_id', 'total'))
+    caps = {}
+    for leader_id, initiator_id, booking_points in leaders:
+        auction = proxies[leader_id]
+        # Баллы, уже замороженные в самой лидирующей ставке, идут и на ее повышение
+        available = booking_points - (frozen.get(initiator_id) or 0) + auction.amount
+        caps[leader_id] = min(auction.max_amount, available)
+    return caps
+
+
+def raise_proxy_leader(decision, auctions):
+    """ Автоставка лидера отбила ставку: поднимает сумму лидирующей заявки и аукциона. """
+    leader_id, amount = decision.raised
+    BookingAttempt.objects.filter(id=leader_id, status=BookingAttemptStatus.BIDDING).update(total_bid=amount, updated_at=decision.now)
+    auction = auctions[leader_id]
+    auction.amount = amount
+    auction.last_bid_at = decision.now # Повышение - тоже ставка: в овертайме продлевает аукцион
+    auction.close_at = engine.effective_close(auction.close_at, decision.now, auction.hard_deadline)
+    auction.save(update_fields=['amount', 'last_bid_at', 'close_at'])
+    logger.info(f"Автоставка заявки {leader_id} поднята до {amount} ББ.")
+
+
+def fetch_range(room, date, slot_numbers, lock=False):
+    """
+    Читает слоты диапазона (создавая недостающие) и возвращает их по порядку номеров.
+    По умолчанию без блокировки; lock=True - SELECT ... FOR UPDATE в порядке номеров (стратегия 'lock').
+    """
+    def fetch():
+        queryset = BookingSlot.objects.filter(room=room, date=date, slot_number__in=slot_numbers)
+        if lock:
+            queryset = queryset.select_for_update().order_by('slot_number')
+        return {slot.slot_number: slot for slot in queryset}
+
+    existing = fetch()
+    missing = [
+        BookingSlot(room=room, date=date, slot_number=n, status=BookingSlotStatus.AVAILABLE).fill_times()
+        for n in slot_numbers if n not in existing
+    ]
+    if missing:
+        # ignore_conflicts: слот мог быть создан параллельным запросом (при lock=True он будет заблокирован повторным чтением)
+        BookingSlot.objects.bulk_create(missing, ignore_conflicts=True)
+        existing = fetch()
+    return [existing[n] for n in slot_numbers]
+
+
+def demote_leaders(leader_ids):
+    """ Перебитые лидеры переходят в LOST одним запросом. """
+    if not leader_ids:
+        return 0
+    count = BookingAttempt.objects.filter(id__in=leader_ids, status=BookingAttemptStatus.BIDDING).update(status=BookingAttemptStatus.LOST)
+    logger.info(f"Заявки {list(leader_ids)} перебиты новой ставкой и установлены в LOST.")
+    # !!! TODO: Логика разблокировки группы (если перебитая заявка была групповой) !!!
+    return count
+
+
+def apply_decision_to_slots(decision, slots, attempt):
+    """ Переносит решение ядра на объекты слотов (без сохранения). """
+    for slot in slots:
+        if decision.kind == engine.INSTANT:
+            slot.status = BookingSlotStatus.BOOKED
+            slot.final_booking_attempt = attempt
+            slot.current_highest_attempt = None
+        else:
+            slot.status = BookingSlotStatus.IN_AUCTION
+            slot.current_highest_attempt = attempt
+            slot.final_booking_attempt = None
+
+
+def lock_room_day(room_id, date):
+    """
+    Транзакционная advisory-блокировка дня аудитории (стратегия 'advisory', только PostgreSQL).
+    Одиночная ставка слоты не блокирует и без нее; блокировка выстраивает ставки на день в очередь,
+    чтобы параллельная ставка дождалась предыдущей вместо 409. Пакетная бронь берет ее вместо FOR UPDATE
+    на каждый слот пакета.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [room_id, date.toordinal()])
+
+
+def write_slots_checked(decision, slots, attempt):
+    """
+    Записывает решение ядра в слоты одним UPDATE. Условие - прочитанные статус и лидер каждого слота
+    (оптимистичная проверка): если слот успели изменить (забронировать, закрыть, отметить недоступным
+    по расписанию), обновится меньше строк и ставка будет отменена.
+    """
+    read_state = reduce(or_, (
+        Q(id=s.id, status=s.status, current_highest_attempt_id=s.current_highest_attempt_id) for s in slots
+    ))
+    apply_decision_to_slots(decision, slots, attempt)
+    slot = slots[0]
+    updated = BookingSlot.objects.filter(read_state).update(
+        status=slot.status,
+        current_highest_attempt=slot.current_highest_attempt,
+        final_booking_attempt=slot.final_booking_attempt,
+    )
+    if updated != len(slots):
+        raise RangeChanged(f"Обновлено {updated} из {len(slots)} слотов.")
+
+
+def record_auctions(entries, auctions):
+    """
+    Записывает аукционы по принятым ставкам: entries - пары (decision, attempt), auctions - {leader_id: Auction}.
+    Новый диапазон - новая строка; перебитие - обновление строки перебитого аукциона
+    (если диапазон покрыл несколько аукционов, остальные помечаются MERGED).
+    """
+    new_auctions = []
+    for decision, attempt in entries:
+        if decision.kind == engine.INSTANT:
+            continue
+        previous = [auctions[leader_id] for leader_id in decision.demoted if leader_id in auctions]
+        if not previous:
+            new_auctions.append(Auction(
+                room=attempt.room, date=attempt.start_slot.date,
+                start_slot_number=decision.start, end_slot_number=decision.end,
+                leader=attempt, amount=decision.amount, max_amount=attempt.max_bid, last_bid_at=decision.now,
+                close_at=decision.close_at, hard_deadline=decision.deadline,
+            ))
+            continue
+        previous.sort(key=lambda auction: auction.id)
+        for merged in previous[1:]:
+            merged.status = AuctionStatus.MERGED
+            merged.save(update_fields=['status'])
+        auction = previous[0]
+        auction.start_slot_number = decision.start
+        auction.end_slot_number = decision.end
+        auction.leader = attempt
+        auction.amount = decision.amount
+        auction.max_amount = attempt.max_bid
+        auction.last_bid_at = decision.now
+        auction.close_at = decision.close_at
+        auction.hard_deadline = decision.deadline
+        auction.save(update_fields=[
+            'start_slot_number', 'end_slot_number', 'leader', 'amount', 'max_amount', 'last_bid_at', 'close_at', 'hard_deadline'
+        ])
+    if new_auctions:
+        Auction.objects.bulk_create(new_auctions)
+
+
+def place_bid(user, room, date, start_slot, end_slot, amount, funding_group=None, now=None, max_bid=None):
+    """
+    Обрабатывает одиночную ставку: читает диапазон, спрашивает решение у ядра и записывает его.
+    Проверки прав и баланса выполняет вызывающий код; amount - итоговая сумма ставки,
+    max_bid - максимум автоставки. Спор двух автоставок разрешается в этой же транзакции:
+    если ставку отбила автоставка лидера, сумма лидера поднимается, а ставка отклоняется.
+
+    Слоты не блокируются: если параллельная заявка успела занять пересекающийся диапазон,
+    вставка нарушит ограничение исключения, а если слоты изменил кто-то еще (например, импорт
+    расписания), условная запись слотов не пройдет - ставка получит 409. Блокируются только
+    строки перебиваемых аукционов. В стратегии 'lock' слоты диапазона читаются с FOR UPDATE,
+    в стратегии 'advisory' ставки на один день аудитории выстраиваются в очередь advisory-блокировкой.
+    """
+    now = now or timezone.now()
+    slot_numbers = list(range(start_slot, end_slot + 1))
+    range_start_at = aware_slot_start(date, start_slot)
+    strategy = settings.BOOKING_BID_STRATEGY
+    advisory = strategy == 'advisory' and connection.vendor == 'postgresql'
+
+    try:
+        with transaction.atomic():
+            if advisory:
+                lock_room_day(room.pk, date)
+            slots = fetch_range(room, date, slot_numbers, lock=strategy == 'lock')
+            leader_ids = {slot.current_highest_attempt_id for slot in slots if slot.status == BookingSlotStatus.IN_AUCTION and slot.current_highest_attempt_id}
+            auctions = load_auctions(leader_ids)
+            day = build_room_day(slots, auctions, load_proxy_caps(auctions))
+
+            decision = engine.evaluate_bid(day, start_slot, end_slot, amount, now, range_start_at, max_amount=max_bid)
+            if not decision.accepted:
+                logger.info(f"Ставка пользователя {user.id} на {room} {date} слоты {start_slot}-{end_slot} отклонена: {decision.reason}.")
+                if decision.raised is not None:
+                    raise_proxy_leader(decision, auctions)
+                return BidResult.rejected(decision)
+
+            is_instant = decision.kind == engine.INSTANT
+            # Групповая ставка (и мгновенная бронь) расходует весь банк группы; автоставка могла поднять
+            # индивидуальную ставку до минимально выигрывающей
+            total_bid = amount if funding_group is not None else decision.amount
+
+            # Перебитые лидеры должны выйти из BIDDING до вставки, иначе сработает ограничение
+            demote_leaders(decision.demoted)
+            attempt = BookingAttempt.objects.create(
+                initiator=user, room=room, start_slot=slots[0], end_slot=slots[-1],
+                date=date, start_slot_number=start_slot, end_slot_number=end_slot,
+                total_bid=total_bid, max_bid=decision.max_amount, funding_group=funding_group,
+                status=BookingAttemptStatus.INSTANT_BOOKED if is_instant else BookingAttemptStatus.BIDDING,
+                booking_date=range_start_at,
+            )
+            # Слоты читались без блокировки: запись условная, чтобы не затереть параллельные изменения
+            write_slots_checked(decision, slots, attempt)
+            record_auctions([(decision, attempt)], auctions)
+
+            if is_instant:
+                if funding_group is not None:
+                    GroupContribution.objects.filter(group=funding_group).delete()
+                else:
+                    User.objects.filter(pk=user.pk).update(booking_points=F('booking_points') - total_bid)
+                    PointTransaction.objects.create(
+                        user=user, amount=-total_bid,
+                        transaction_type=PointTransaction.TransactionType.BOOKING_SPEND_INDIVIDUAL,
+                        related_attempt=attempt,
+                        description=f"Мгновенная бронь {len(slot_numbers)} слотов."
+                    )
+                logger.info(f"Мгновенная бронь {attempt.id} создана пользователем {user.id}.")
+            else:
+                logger.info(f"Новая ставка {attempt.id} ({'групповая' if funding_group else 'индивидуальная'}) принята. Слоты {slot_numbers} теперь IN_AUCTION.")
+                # !!! TODO: Логика блокировки группы (если ставка групповая) !!!
+    except (IntegrityError, RangeChanged) as e:
+        logger.info(f"Ставка пользователя {user.id} на {room} {date} слоты {start_slot}-{end_slot} проиграла гонку: {e}")
+        return BidResult.conflict()
+
+    return BidResult(attempt=attempt, decision=decision)
+
+
+def check_funds(user, funding_group, total_bid, num_slots, in_instant_window, max_bid=None):
+    """
+    Проверки прав и баланса перед ставкой. Максимум автоставки должен быть обеспечен
+    баллами целиком, хотя замораживается только фактическая ставка.
+    Возвращает (итоговая сумма ставки, None) или (None, BidResult с ошибкой).
+    """
+    if funding_group is not None:
+        if funding_group.initiator_id != user.pk:
+            return None, BidResult(error={"funding_group": "Вы не являетесь администратором этой группы."}, status_code=status.HTTP_403_FORBIDDEN)
+        if not in_instant_window and BookingAttempt.objects.filter(funding_group=funding_group, status=BookingAttemptStatus.BIDDING).exists():
+            return None, BidResult(error={"funding_group": "Группа уже участвует в другом активном аукционе."}, status_code=status.HTTP_409_CONFLICT)
+        # Группа всегда ставит весь свой банк
+        group_balance = funding_group.current_balance
+        if group_balance < num_slots:
+            return None, BidResult(error={"funding_group": f"Недостаточно средств ({group_balance} ББ). Минимум {num_slots} ББ."}, status_code=status.HTTP_400_BAD_REQUEST)
+        return group_balance, None
+
+    if in_instant_window and not max_bid:
+        # Мгновенная бронь всегда по минимальной цене (цену назначает ядро);
+        # ставка учитывается, только если диапазон в овертайме аукциона.
+        # Автоставку (она работает только в овертайме) проверяем как обычную ставку ниже
+        instant_price = num_slots * engine.POINTS_PER_SLOT
+        if user.booking_points < instant_price:
+            return None, BidResult(error={"total_bid": f"Недостаточно баллов ({user.booking_points} ББ) для мгновенной брони ({instant_price} ББ)."}, status_code=status.HTTP_400_BAD_REQUEST)
+        return total_bid, None
+
+    frozen_bids_sum = user.initiated_attempts.filter(
+        status=BookingAttemptStatus.BIDDING,
+        funding_group__isnull=True
+    ).aggregate(total=Sum('total_bid'))['total'] or 0
+    required_bid = max(total_bid, max_bid or 0)
+    required_total = required_bid + frozen_bids_sum
+    if user.booking_points < required_total:
+        field = "max_bid" if required_bid != total_bid else "total_bid"
+        return None, BidResult(error={
+            field: f"Недостаточно баллов. Ваши баллы: {user.booking_points}. "
+                         f"Требуется для этой ставки: {required_bid}. "
+                         f"Уже заморожено в других ставках: {frozen_bids_sum}. "
+                         f"Всего нужно: {required_total}."
+        }, status_code=status.HTTP_400_BAD_REQUEST)
+    return total_bid, None
+
+
+def submit_bid(user, room, date, start_slot, end_slot, total_bid=None, funding_group=None, now=None, max_bid=None):
+    """
+    Полная обработка ставки: проверки прав и баланса, затем place_bid.
+    Используется представлением создания заявки и обработчиком очереди ставок (booking.sequencer).
+    max_bid - максимум автоставки (только индивидуальные ставки).
+    """
+    now = now or timezone.now()
+    range_start_at = aware_slot_start(date, start_slot)
+    in_instant_window = (range_start_at - now) < engine.INSTANT_BOOKING_WINDOW
+    if funding_group is not None:
+        max_bid = None
+    result = None
+    if settings.BOOKING_BID_STRATEGY == 'sql' and max_bid is None and bid_sql.supports(funding_group, in_instant_window):
+        # Баланс проверяется в той же функции БД
+        result = bid_sql.place_bid_sql(user, room, date, start_slot, end_slot, total_bid, range_start_at, now)
+    if result is None:
+        amount, error = check_funds(user, funding_group, total_bid, end_slot - start_slot + 1, in_instant_window, max_bid=max_bid)
+        if error is not None:
+            return error
+        result = place_bid(user, room, date, start_slot, end_slot, amount, funding_group=funding_group, now=now, max_bid=max_bid)
+    if result.ok:
+        # Слоты, аукционы и статусы перебитых заявок пишутся массово - версии ресурсов повышаем явно
+        versions.bump_attempts([result.attempt.id, *result.decision.demoted])
+    elif result.decision is not None and result.decision.raised is not None:
+        versions.bump_attempts([result.decision.raised[0]])
+    return result
@@ -1,152 +1,227 @@
 from celery import shared_task
+from django.conf import settings
 from django.utils import timezone
-from django.db import transaction, F # F object для атомарных обновлений
+from django.db import transaction
+from django.db.models import F # F object для атомарных обновлений
+from django.db.models.functions import Mod
 from main.models import (
-    BookingSlot, BookingAttempt, User, GroupContribution, PointTransaction,
-    BookingSlotStatus, BookingAttemptStatus
+    BookingSlot, BookingAttempt, User, GroupContribution, PointTransaction, Auction,
+    BookingSlotStatus, BookingAttemptStatus, AuctionStatus
 )
-import datetime
+from main import versions
+from . import engine, metrics
+from .retention import run_retention
 import logging # Используем logging вместо print
+import time
 
 logger = logging.getLogger(__name__) # Настраиваем логгер
 
+def _claim_due_auctions(now, batch_size, shard=None, shards=1, seen=()):
+    """
+    Забирает пачку открытых аукционов, время закрытия которых наступило.
+    FOR UPDATE SKIP LOCKED: аукционы, уже взятые другим закрывателем, пропускаются, а не ждутся,
+    поэтому закрыватели можно запускать параллельно без двойного закрытия.
+    shard/shards - необязательное разбиение по аудиториям (room_id % shards).
+    seen - id аукционов, уже обработанных этим запуском (ошибка оставляет аукцион открытым).
+    """
+    # Range scan по частичному индексу (status='open', close_at)
+    queryset = Auction.objects.select_for_update(skip_locked=True).filter(status=AuctionStatus.OPEN, close_at__lte=now)
+    if seen:
+        queryset = queryset.exclude(id__in=seen)
+    if shard is not None and shards > 1:
+        queryset = queryset.annotate(shard=Mod('room_id', shards)).filter(shard=shard)
+    return list(queryset.order_by('close_at')[:batch_size])
+
+
+def _settle_auction(auction, attempt, now, lock_started):
+    """
+    Обрабатывает один заблокированный аукцион: продлевает (овертайм), отменяет или закрывает.
+    attempt - заблокированная лидирующая заявка или None. Возвращает исход: 'skipped', 'extended' или 'settled'.
+    """
+    # --- Проверка Овертайма: решение принимает ядро аукциона ---
+    decision, new_close_time = engine.evaluate_close(now, auction.close_at, auction.last_bid_at, auction.hard_deadline)
+
+    if decision == engine.CLOSE_WAIT:
+        logger.info(f"Аукцион {auction.id} еще не завершен (закрытие в {new_close_time}). Пропускаем.")
+        return 'skipped'
+
+    # Если ставка была в последние 3 минуты (и жесткий дедлайн не наступил), аукцион продлевается
+    if decision == engine.CLOSE_EXTEND:
+        metrics.SETTLEMENT_LOCK_WAIT.observe(time.perf_counter() - lock_started)
+        auction.close_at = new_close_time
+        auction.save(update_fields=['close_at'])
+        metrics.OVERTIME_EXTENSIONS.inc()
+        logger.info(f"ПРОДЛЕН аукцион {auction.id} до {new_close_time}.")
+        return 'extended'
+
+    if attempt is None or attempt.status != BookingAttemptStatus.BIDDING:
+        logger.warning(f"Лидирующая заявка аукциона {auction.id} отсутствует или уже не в торге. Аукцион отменен.")
+        auction.status = AuctionStatus.CANCELLED
+        auction.save(update_fields=['status'])
+        return 'skipped'
+
+    # Получаем слоты, где эта заявка ЛИДИРУЕТ и которые В АУКЦИОНЕ
+    slots_led_by_attempt = BookingSlot.objects.select_for_update().filter(
+        current_highest_attempt=attempt,
+        status=BookingSlotStatus.IN_AUCTION
+    )
+    # Вычисляем queryset сразу, чтобы взять блокировки и измерить их ожидание
+    locked_slots = list(slots_led_by_attempt)
+    metrics.SETTLEMENT_LOCK_WAIT.observe(time.perf_counter() - lock_started)
+
+    if not locked_slots:
+        # Это может случиться, если слоты были отменены/изменены другим процессом: закрывать нечего,
+        # а открытый аукцион забирался бы каждым проходом закрывателя
+        logger.warning(f"Не найдено слотов IN_AUCTION для лидирующей заявки {attempt.id}. Возможно, они были изменены. Аукцион {auction.id} отменен.")
+        auction.status = AuctionStatus.CANCELLED
+        auction.save(update_fields=['status'])
+        return 'skipped'
+
+    # --- Закрываем Аукцион ---
+    logger.info(f"ЗАКРЫВАЕМ аукцион {auction.id} для заявки {attempt.id} (победитель).")
+
+    # 1. Обновляем статус Аукциона и Заявки-Победителя
+    auction.status = AuctionStatus.SETTLED
+    auction.settled_at = timezone.now()
+    auction.save(update_fields=['status', 'settled_at'])
+    attempt.status = BookingAttemptStatus.WON
+    attempt.save(update_fields=['status'])
+
+    # 2. Обновляем Слоты
+    # Используем queryset `slots_led_by_attempt`, который уже заблокирован
+    updated_slot_count = slots_led_by_attempt.update(
+        status=BookingSlotStatus.BOOKED,
+        final_booking_attempt=attempt,   # Указываем победителя
+        current_highest_attempt=None, # Очищаем лидера
+    )
+    logger.info(f"Установлен статус BOOKED для {updated_slot_count} слотов, выигранных заявкой {attempt.id}.")
+    versions.bump_availability(auction.date)
+
+    # 3. Списываем Баллы/Взносы
+    if attempt.funding_group_id:
+        # Групповая победа - обнуляем банк группы
+        deleted_count, _ = GroupContribution.objects.filter(group_id=attempt.funding_group_id).delete()
+        logger.info(f"Обнулен банк группы {attempt.funding_group_id} (удалено {deleted_count} записей взносов) после выигрыша заявки {attempt.id}.")
+        # !!! TODO: Разблокировать группу, если реализован механизм блокировки !!!
+        return 'settled'
+
+    # Индивидуальная победа - списываем личные баллы (пользователь уже заблокирован вызывающим кодом)
+    try:
+        user = User.objects.select_for_update().get(id=attempt.initiator_id)
+    except User.DoesNotExist:
+        logger.error(f"Пользователь {attempt.initiator_id} не найден при списании баллов за выигрыш заявки {attempt.id}.")
+        return 'settled'
+    bid_amount = attempt.total_bid
+
+    # Проверяем достаточность баллов (на всякий случай)
+    if user.booking_points >= bid_amount:
+        # Атомарно вычитаем баллы
+        user.booking_points = F('booking_points') - bid_amount
+        user.save(update_fields=['booking_points']) # Сохраняем только баллы
+
+        # Создаем запись транзакции
+        PointTransaction.objects.create(
+            user=user,
+            amount=-bid_amount,
+            transaction_type=PointTransaction.TransactionType.BOOKING_SPEND_INDIVIDUAL,
+            related_attempt=attempt,
+            description=f"Списание за выигрыш аукциона {attempt.id} на {attempt.room.name}."
+        )
+        logger.info(f"Списано {bid_amount} ББ с пользователя {user.id} за выигрыш заявки {attempt.id}.")
+    else:
+        # Эта ситуация не должна возникать при правильной проверке ставок, но логируем ее
+        logger.error(f"Недостаточно баллов ({user.booking_points}) у пользователя {user.id} для списания выигранной ставки {bid_amount} (заявка {attempt.id}). Списание НЕ произведено!")
+        # Рассмотрите, как обрабатывать этот крайний случай (возможно, отменять выигрыш?)
+    return 'settled'
+
+
 @shared_task(bind=True, name='booking.close_auctions')
-def close_completed_auctions(self):
+def close_completed_auctions(self, shard=None, shards=None):
     """
     Проверяет аукционы, которые должны быть закрыты, обрабатывает овертайм,
     обновляет статусы и списывает баллы. Запускается периодически (например, каждую минуту).
+
+    Аукционы забираются пачками с SKIP LOCKED, поэтому любое число воркеров может
+    выполнять задачу одновременно. При AUCTION_CLOSER_SHARDS > 1 запуск без shard
+    только раздает задачи по шардам (room_id % shards) и завершается.
     """
+    shards = shards or settings.AUCTION_CLOSER_SHARDS
+    if shard is None and shards > 1:
+        for i in range(shards):
+            close_completed_auctions.apply_async(kwargs={'shard': i, 'shards': shards}, expires=settings.AUCTION_CLOSER_TIME_BUDGET)
+        logger.info(f"Закрытие аукционов разослано по {shards} шардам.")
+        return
+
     now = timezone.now()
-    logger.info(f"----- Запуск задачи close_completed_auctions: {now} -----")
-
-    # Находим ЗАЯВКИ, которые лидируют в аукционах,
-    # где время закрытия УЖЕ ПРОШЛО ИЛИ НАСТУПИЛО.
-    # Группируем по заявкам, чтобы обработать каждый потенциальный аукцион один раз.
-    # distinct() нужен, т.к. одна заявка может лидировать на нескольких слотах.
-    attempts_to_check_qs = BookingAttempt.objects.filter(
-        status=BookingAttemptStatus.BIDDING,
-        currently_leading_slots__status=BookingSlotStatus.IN_AUCTION,
-        currently_leading_slots__auction_close_time__lte=now
-    ).distinct()
-
-    attempts_to_check_ids = list(attempts_to_check_qs.values_list('id', flat=True))
-    logger.info(f"Найдено {len(attempts_to_check_ids)} активных заявок (attempts) для проверки закрытия аукциона.")
-
-    processed_attempt_ids = set() # Отслеживаем уже обработанные заявки в этом запуске
-
-    # Итерируемся по ID, чтобы избежать проблем с изменением QuerySet во время итерации
-    for attempt_id in attempts_to_check_ids:
-        if attempt_id in processed_attempt_ids:
-            logger.debug(f"Заявка {attempt_id} уже обработана в этом запуске, пропускаем.")
-            continue
-
-        try:
-            # Начинаем транзакцию для обработки одной заявки/аукциона
-            with transaction.atomic():
-                # Блокируем заявку и связанные слоты для предотвращения гонок
-                # Перезапрашиваем заявку внутри транзакции с блокировкой
-                attempt = BookingAttempt.objects.select_for_update().get(pk=attempt_id)
-
-                # Дополнительная проверка статуса, т.к. он мог измениться
-                if attempt.status != BookingAttemptStatus.BIDDING:
-                    logger.warning(f"Статус заявки {attempt.id} изменился на {attempt.status} перед обработкой. Пропускаем.")
-                    processed_attempt_ids.add(attempt.id)
-                    continue
-
-                # Получаем слоты, где эта заявка ЛИДИРУЕТ и которые В АУКЦИОНЕ
-                slots_led_by_attempt = BookingSlot.objects.select_for_update().filter(
-                    current_highest_attempt=attempt,
-                    status=BookingSlotStatus.IN_AUCTION
-                )
-
-                if not slots_led_by_attempt.exists():
-                    # Это может случиться, если слоты были отменены/изменены другим процессом
-                    logger.warning(f"Не найдено слотов IN_AUCTION для лидирующей заявки {attempt.id}. Возможно, они были изменены. Пропускаем.")
-                    processed_attempt_ids.add(attempt.id)
-                    continue
-
-                # --- Проверка Овертайма ---
-                last_bid_time = attempt.updated_at # Время последнего обновления заявки = время последней ставки
-                overtime_period = datetime.timedelta(minutes=3)
-                # Время, до которого продлевается аукцион из-за недавней ставки
-                overtime_end_time = last_bid_time + overtime_period
-
-                # Если текущее время МЕНЬШЕ, чем конец овертайма, значит, аукцион продлевается
-                if now < overtime_end_time:
-                    # Продлеваем аукцион: обновляем auction_close_time у слотов
-                    new_close_time = overtime_end_time
-                    # Обновляем только те слоты, у которых текущее время закрытия раньше нового
-                    # (на случай, если задача запустится несколько раз до фактического закрытия)
-                    updated_count = slots_led_by_attempt.filter(auction_close_time__lt=new_close_time).update(auction_close_time=new_close_time)
-                    if updated_count > 0:
-                         logger.info(f"ПРОДЛЕН аукцион для заявки {attempt.id} до {new_close_time}. Обновлено {updated_count} слотов.")
-                    else:
-                         logger.info(f"Аукцион для заявки {attempt.id} уже продлен до {new_close_time} или позже. Не требуется обновление.")
-
-                else:
-                    # --- Закрываем Аукцион ---
-                    logger.info(f"ЗАКРЫВАЕМ аукцион для заявки {attempt.id} (победитель).")
-
-                    # 1. Обновляем статус Заявки-Победителя
-                    attempt.status = BookingAttemptStatus.WON
-                    attempt.save() # Сохраняем только статус
-
-                    # 2. Обновляем Слоты
-                    # Используем queryset `slots_led_by_attempt`, который уже заблокирован
-                    updated_slot_count = slots_led_by_attempt.update(
-                        status=BookingSlotStatus.BOOKED,
-                        final_booking_attempt=attempt,   # Указываем победителя
-                        current_highest_attempt=None, # Очищаем лидера
-                        auction_close_time=None        # Очищаем время закрытия
-                    )
-                    logger.info(f"Установлен статус BOOKED для {updated_slot_count} слотов, выигранных заявкой {attempt.id}.")
-
-                    # 3. Списываем Баллы/Взносы
-                    if attempt.funding_group:
-                        # Групповая победа - обнуляем банк группы
-                        group = attempt.funding_group # Получаем связанную группу
-                        deleted_count, _ = GroupContribution.objects.filter(group=group).delete()
-                        logger.info(f"Обнулен банк группы {group.id} (удалено {deleted_count} записей взносов) после выигрыша заявки {attempt.id}.")
-                        # !!! TODO: Разблокировать группу, если реализован механизм блокировки !!!
-                    else:
-                        # Индивидуальная победа - списываем личные баллы
-                        try:
-                            # Блокируем пользователя для обновления баллов
-                            user = User.objects.select_for_update().get(id=attempt.initiator.id)
-                            bid_amount = attempt.total_bid
-
-                            # Проверяем достаточность баллов (на всякий случай)
-                            if user.booking_points >= bid_amount:
-                                # Атомарно вычитаем баллы
-                                user.booking_points = F('booking_points') - bid_amount
-                                user.save(update_fields=['booking_points']) # Сохраняем только баллы
-
-                                # Создаем запись транзакции
-                                PointTransaction.objects.create(
-                                    user=user,
-                                    amount=-bid_amount,
-                                    transaction_type=PointTransaction.TransactionType.BOOKING_SPEND_INDIVIDUAL,
-                                    related_attempt=attempt,
-                                    description=f"Списание за выигрыш аукциона {attempt.id} на {attempt.room.name}."
-                                )
-                                logger.info(f"Списано {bid_amount} ББ с пользователя {user.id} за выигрыш заявки {attempt.id}.")
-                            else:
-                                # Эта ситуация не должна возникать при правильной проверке ставок, но логируем ее
-                                logger.error(f"Недостаточно баллов ({user.booking_points}) у пользователя {user.id} для списания выигранной ставки {bid_amount} (заявка {attempt.id}). Списание НЕ произведено!")
-                                # Рассмотрите, как обрабатывать этот крайний случай (возможно, отменять выигрыш?)
-
-                        except User.DoesNotExist:
-                            logger.error(f"Пользователь {attempt.initiator.id} не найден при списании баллов за выигрыш заявки {attempt.id}.")
-
-                    # Помечаем заявку как обработанную в этом запуске
-                    processed_attempt_ids.add(attempt.id)
-
-        except BookingAttempt.DoesNotExist:
-             logger.warning(f"Заявка {attempt_id} была удалена перед обработкой. Пропускаем.")
-             processed_attempt_ids.add(attempt_id) # Все равно помечаем, чтобы не искать снова
-        except Exception as e:
-            # Логируем любую другую ошибку при обработке одной заявки, но не прерываем всю задачу
-            logger.error(f"Ошибка при обработке закрытия аукциона для заявки {attempt_id}: {e}", exc_info=True)
-            # Не добавляем в processed_attempt_ids, чтобы попытаться снова в след. раз
-
-    logger.info(f"----- Завершение задачи close_completed_auctions -----")
+    shard_label = f" (шард {shard}/{shards})" if shard is not None else ""
+    logger.info(f"----- Запуск задачи close_completed_auctions{shard_label}: {now} -----")
+
+    run_counts = {'due': 0, 'extended': 0, 'settled': 0, 'skipped': 0, 'failed': 0}
+    # Укладываемся в бюджет времени (меньше expires в расписании); остаток заберет следующий запуск
+    stop_at = time.monotonic() + settings.AUCTION_CLOSER_TIME_BUDGET
+    # Каждый аукцион забирается не больше одного раза за запуск: иначе аукцион с ошибкой
+    # забирался бы снова каждым проходом до конца бюджета времени
+    seen = set()
+
+    while time.monotonic() < stop_at:
+        with transaction.atomic():
+            lock_started = time.perf_counter()
+            batch = _claim_due_auctions(now, settings.AUCTION_CLOSER_BATCH_SIZE, shard, shards, seen)
+            if not batch:
+                break
+            seen.update(auction.id for auction in batch)
+            run_counts['due'] += len(batch)
+
+            # Лидеров и пользователей блокируем сразу для всей пачки в порядке id,
+            # чтобы параллельные закрыватели не взаимоблокировались
+            leader_ids = sorted({auction.leader_id for auction in batch if auction.leader_id})
+            attempts = {
+                attempt.id: attempt
+                for attempt in BookingAttempt.objects.select_for_update().filter(id__in=leader_ids).order_by('id')
+            }
+            user_ids = sorted({
+                attempt.initiator_id for attempt in attempts.values()
+                if attempt.status == BookingAttemptStatus.BIDDING and not attempt.funding_group_id
+            })
+            list(User.objects.select_for_update().filter(id__in=user_ids).order_by('id').values_list('id', flat=True))
+
+            for auction in batch:
+                transaction_started = time.perf_counter()
+                scheduled_close_time = auction.close_at
+                try:
+                    # Точка сохранения: ошибка одного аукциона не откатывает остальные в пачке
+                    with transaction.atomic():
+                        outcome = _settle_auction(auction, attempts.get(auction.leader_id), now, lock_started)
+                except Exception as e:
+                    # Логируем любую другую ошибку при обработке одного аукциона, но не прерываем всю задачу
+                    logger.error(f"Ошибка при обработке закрытия аукциона {auction.id}: {e}", exc_info=True)
+                    outcome = 'failed'
+                run_counts[outcome] += 1
+                if outcome == 'settled':
+                    metrics.SETTLEMENT_DURATION.observe(time.perf_counter() - transaction_started)
+                    if scheduled_close_time:
+                        lag = (timezone.now() - scheduled_close_time).total_seconds()
+                        metrics.SETTLEMENT_LAG.observe(max(lag, 0))
+                lock_started = time.perf_counter()
+
+    for outcome, count in run_counts.items():
+        metrics.RUN_AUCTIONS.observe(count, outcome=outcome)
+        if count:
+            metrics.AUCTIONS_TOTAL.inc(count, outcome=outcome)
+    metrics.LAST_RUN_TIMESTAMP.set(time.time())
+
+    logger.info(
+        f"----- Завершение задачи close_completed_auctions{shard_label}: к закрытию {run_counts['due']}, "
+        f"продлено {run_counts['extended']}, закрыто {run_counts['settled']}, "
+        f"пропущено {run_counts['skipped']}, ошибок {run_counts['failed']} -----"
+    )
+    return run_counts
+
+
+@shared_task(bind=True, name='booking.archive_past_bookings')
+def archive_past_bookings(self):
+    """
+    Переносит прошедшие слоты и завершенные заявки из горячих таблиц в архив/сводки
+    (см. booking.retention). Запускается периодически, работает ограниченными пачками.
+    """
+    return run_retention()
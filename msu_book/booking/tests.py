@@ -1,3 +1,459 @@
-from django.test import TestCase
+import datetime
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from main.models import (
+    Room, User, BookingSlot, BookingAttempt, Auction,
+    BookingSlotStatus, BookingAttemptStatus, AuctionStatus, slot_bounds
+)
+from msu_book import idempotency
+from my_auth.identity import RequestUser
+from . import engine, tasks
+from .batch import place_batch, ITEM_CREATED, ITEM_FAILED
+from .services import place_bid, submit_bid
+
+# Начало первого слота диапазона во всех тестах ядра
+START = datetime.datetime(2030, 1, 10, 9, 0, tzinfo=datetime.timezone.utc)
+CLOSE = engine.initial_close_time(START)
+DEADLINE = engine.hard_deadline(START)
+EARLY = START - datetime.timedelta(days=1)
+
+
+def room_day(*leaders):
+    day = engine.RoomDay()
+    for leader in leaders:
+        day.add_leader(leader)
+    return day
+
+
+def leader(attempt_id=1, start=3, end=4, amount=5, last_bid_at=EARLY, close_at=CLOSE, max_amount=None):
+    return engine.Leader(attempt_id, start, end, amount, last_bid_at=last_bid_at, close_at=close_at,
+                         deadline=DEADLINE, max_amount=max_amount)
+
+
+class EffectiveCloseTests(SimpleTestCase):
+    """ Общее правило овертайма: min(max(close_at, last_bid_at + 3 мин), дедлайн). """
+
+    def test_bid_before_overtime_keeps_close(self):
+        self.assertEqual(engine.effective_close(CLOSE, CLOSE - datetime.timedelta(minutes=10), DEADLINE), CLOSE)
+
+    def test_bid_in_overtime_extends_close(self):
+        bid_at = CLOSE - datetime.timedelta(minutes=1)
+        self.assertEqual(engine.effective_close(CLOSE, bid_at, DEADLINE), bid_at + engine.OVERTIME)
+
+    def test_extension_is_capped_by_deadline(self):
+        bid_at = DEADLINE - datetime.timedelta(minutes=1)
+        self.assertEqual(engine.effective_close(CLOSE, bid_at, DEADLINE), DEADLINE)
+
+    def test_without_close_time_last_bid_decides(self):
+        self.assertEqual(engine.effective_close(None, EARLY), EARLY + engine.OVERTIME)
+        self.assertIsNone(engine.effective_close(None))
+
+
+class EvaluateBidTests(SimpleTestCase):
+
+    def test_free_range_opens_auction(self):
+        decision = engine.evaluate_bid(room_day(), 3, 4, 5, EARLY, START)
+        self.assertEqual(decision.kind, engine.AUCTION_OPEN)
+        self.assertEqual(decision.close_at, CLOSE)
+        self.assertEqual(decision.deadline, DEADLINE)
+
+    def test_free_range_in_last_hour_is_instant_at_minimum_price(self):
+        decision = engine.evaluate_bid(room_day(), 3, 5, 20, START - datetime.timedelta(minutes=30), START)
+        self.assertEqual(decision.kind, engine.INSTANT)
+        self.assertEqual(decision.amount, engine.minimum_bid(3, 5))
+
+    def test_started_range_is_rejected(self):
+        decision = engine.evaluate_bid(room_day(), 3, 4, 5, START, START)
+        self.assertEqual(decision.reason, engine.SLOT_STARTED)
+
+    def test_booked_slot_is_rejected(self):
+        day = room_day()
+        day.set_slot(4, engine.BOOKED)
+        self.assertEqual(engine.evaluate_bid(day, 3, 4, 5, EARLY, START).reason, engine.SLOT_TAKEN)
+
+    def test_tie_with_leader_is_rejected(self):
+        decision = engine.evaluate_bid(room_day(leader(amount=5)), 3, 4, 5, EARLY, START)
+        self.assertEqual(decision.reason, engine.LOW_BID)
+
+    def test_overbid_must_cover_leader_range(self):
+        decision = engine.evaluate_bid(room_day(leader(start=3, end=5)), 3, 4, 10, EARLY, START)
+        self.assertEqual(decision.reason, engine.RANGE_INTEGRITY)
+
+    def test_longer_range_overbids_and_demotes_leaders(self):
+        day = room_day(leader(1, 3, 4, amount=5), leader(2, 6, 6, amount=7))
+        decision = engine.evaluate_bid(day, 2, 6, 8, EARLY, START)
+        self.assertEqual(decision.kind, engine.OVERBID)
+        self.assertEqual(sorted(decision.demoted), [1, 2])
+
+    def test_overtime_bid_extends_close(self):
+        now = CLOSE - datetime.timedelta(minutes=1)
+        decision = engine.evaluate_bid(room_day(leader()), 3, 4, 6, now, START)
+        self.assertEqual(decision.close_at, now + engine.OVERTIME)
+
+    def test_overbid_keeps_extended_close(self):
+        extended = CLOSE + datetime.timedelta(minutes=10)
+        decision = engine.evaluate_bid(room_day(leader(close_at=extended)), 3, 4, 6, EARLY, START)
+        self.assertEqual(decision.close_at, extended)
+
+    def test_overtime_never_passes_deadline(self):
+        now = DEADLINE - datetime.timedelta(minutes=1)
+        extended = DEADLINE - datetime.timedelta(minutes=2)
+        decision = engine.evaluate_bid(room_day(leader(last_bid_at=extended, close_at=extended)), 3, 4, 6, now, START)
+        self.assertEqual(decision.kind, engine.OVERBID)
+        self.assertEqual(decision.close_at, DEADLINE)
+        self.assertEqual(engine.evaluate_bid(room_day(leader()), 3, 4, 6, DEADLINE, START).reason, engine.AUCTION_RUNNING)
+
+    def test_last_hour_overbid_only_while_in_overtime(self):
+        now = CLOSE + datetime.timedelta(minutes=1)
+        closed = room_day(leader())
+        self.assertEqual(engine.evaluate_bid(closed, 3, 4, 6, now, START).reason, engine.AUCTION_RUNNING)
+        in_overtime = room_day(leader(last_bid_at=now - datetime.timedelta(minutes=1)))
+        self.assertEqual(engine.evaluate_bid(in_overtime, 3, 4, 6, now, START).kind, engine.OVERBID)
+
+
+class ProxyBidTests(SimpleTestCase):
+    """ Автоставки: лидер с максимумом отбивает ставку, соперник с максимумом берет лидерство по минимальной цене. """
+
+    def test_proxy_leader_raises_to_bid_plus_increment(self):
+        decision = engine.evaluate_bid(room_day(leader(amount=5, max_amount=10)), 3, 4, 7, EARLY, START)
+        self.assertEqual(decision.reason, engine.OUTBID_BY_PROXY)
+        self.assertEqual(decision.raised, (1, 7 + engine.MIN_INCREMENT))
+
+    def test_equal_maximums_keep_earlier_leader(self):
+        decision = engine.evaluate_bid(room_day(leader(amount=5, max_amount=10)), 3, 4, 2, EARLY, START, max_amount=10)
+        self.assertEqual(decision.reason, engine.OUTBID_BY_PROXY)
+        self.assertEqual(decision.raised, (1, 10))
+
+    def test_bid_above_proxy_maximum_wins(self):
+        decision = engine.evaluate_bid(room_day(leader(amount=5, max_amount=10)), 3, 4, 11, EARLY, START)
+        self.assertEqual(decision.kind, engine.OVERBID)
+        self.assertIsNone(decision.raised)
+
+    def test_challenger_proxy_takes_lead_at_minimum_winning_price(self):
+        decision = engine.evaluate_bid(room_day(leader(amount=5, max_amount=8)), 3, 4, 2, EARLY, START, max_amount=12)
+        self.assertEqual(decision.kind, engine.OVERBID)
+        self.assertEqual(decision.amount, 8 + engine.MIN_INCREMENT)
+        self.assertEqual(decision.max_amount, 12)
+
+    def test_proxy_does_not_defend_against_longer_range(self):
+        decision = engine.evaluate_bid(room_day(leader(amount=5, max_amount=10)), 3, 5, 6, EARLY, START)
+        self.assertEqual(decision.kind, engine.OVERBID)
+
+    def test_proxy_raise_in_overtime_extends_leader_close(self):
+        day = room_day(leader(amount=5, max_amount=10))
+        now = CLOSE - datetime.timedelta(minutes=1)
+        decision = engine.evaluate_bid(day, 3, 4, 7, now, START)
+        day.apply(decision, None)
+        self.assertEqual(day.leaders[1].amount, 8)
+        self.assertEqual(day.leaders[1].close_at, now + engine.OVERTIME)
+
+
+class EvaluateCloseTests(SimpleTestCase):
+
+    def test_wait_until_close(self):
+        self.assertEqual(engine.evaluate_close(CLOSE - datetime.timedelta(seconds=1), CLOSE, EARLY, DEADLINE), (engine.CLOSE_WAIT, CLOSE))
+
+    def test_extend_after_late_bid(self):
+        last_bid_at = CLOSE - datetime.timedelta(minutes=1)
+        self.assertEqual(
+            engine.evaluate_close(CLOSE, CLOSE, last_bid_at, DEADLINE),
+            (engine.CLOSE_EXTEND, last_bid_at + engine.OVERTIME),
+        )
+
+    def test_settle_after_close(self):
+        self.assertEqual(engine.evaluate_close(CLOSE, CLOSE, EARLY, DEADLINE), (engine.CLOSE_SETTLE, None))
+
+    def test_settle_at_deadline_despite_late_bid(self):
+        last_bid_at = DEADLINE - datetime.timedelta(minutes=1)
+        self.assertEqual(engine.evaluate_close(DEADLINE, CLOSE, last_bid_at, DEADLINE), (engine.CLOSE_SETTLE, None))
+
+
+class BookingTestCase(TestCase):
+    """ Аудитория и пользователь с баллами; диапазоны - послезавтра, вне часа до начала. """
+    points = 20
+
+    def setUp(self):
+        self.room = Room.objects.create(name='r1', capacity=10, building='PHYS', floor=1, room_type='seminar')
+        self.user = User.objects.create(user_id=1, email='a@example.com', first_name='a', second_name='b', booking_points=self.points)
+        self.date = timezone.localdate() + datetime.timedelta(days=2)
+
+    def item(self, start, end, total_bid=None, date=None):
+        return {'room': self.room, 'date': date or self.date, 'start_slot_number': start, 'end_slot_number': end, 'total_bid': total_bid}
+
+    def slots(self, start, end):
+        return BookingSlot.objects.filter(room=self.room, date=self.date, slot_number__range=(start, end)).order_by('slot_number')
+
+
+class BatchBookingTests(BookingTestCase):
+
+    def test_all_or_nothing_rolls_back_whole_batch(self):
+        BookingSlot.objects.create(room=self.room, date=self.date, slot_number=8, status=BookingSlotStatus.BOOKED)
+
+        ok, results = place_batch(self.user, [self.item(3, 4, 5), self.item(8, 8)], all_or_nothing=True)
+
+        self.assertFalse(ok)
+        self.assertEqual([result['status'] for result in results], [ITEM_FAILED, ITEM_FAILED])
+        self.assertFalse(BookingAttempt.objects.exists())
+        self.assertFalse(Auction.objects.exists())
+        self.assertFalse(self.slots(3, 4).exists()) # Слоты, созданные пакетом, откатились вместе с ним
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.booking_points, self.points)
+
+    def test_partial_batch_keeps_valid_items(self):
+        BookingSlot.objects.create(room=self.room, date=self.date, slot_number=8, status=BookingSlotStatus.BOOKED)
+
+        ok, results = place_batch(self.user, [self.item(3, 4, 5), self.item(8, 8)], all_or_nothing=False)
+
+        self.assertTrue(ok)
+        self.assertEqual([result['status'] for result in results], [ITEM_CREATED, ITEM_FAILED])
+        attempt = BookingAttempt.objects.get()
+        self.assertEqual(attempt.status, BookingAttemptStatus.BIDDING)
+        self.assertEqual(list(self.slots(3, 4).values_list('current_highest_attempt_id', flat=True)), [attempt.id, attempt.id])
+
+    def test_later_item_supersedes_earlier_item_of_same_batch(self):
+        # Второй элемент перебивает первый по временному отрицательному id: первый сразу LOST
+        ok, results = place_batch(self.user, [self.item(3, 4, 5), self.item(3, 5, 6)], all_or_nothing=True)
+
+        self.assertTrue(ok)
+        first, second = (BookingAttempt.objects.get(pk=result['attempt_id']) for result in results)
+        self.assertEqual(first.status, BookingAttemptStatus.LOST)
+        self.assertEqual(second.status, BookingAttemptStatus.BIDDING)
+        self.assertEqual(set(self.slots(3, 5).values_list('status', 'current_highest_attempt_id')),
+                         {(BookingSlotStatus.IN_AUCTION, second.id)})
+        auction = Auction.objects.get()
+        self.assertEqual((auction.leader_id, auction.status, auction.amount), (second.id, AuctionStatus.OPEN, 6))
+
+    def test_superseded_item_hands_over_previous_leader_auction(self):
+        other = User.objects.create(user_id=2, email='b@example.com', first_name='c', second_name='d', booking_points=self.points)
+        self.assertTrue(place_bid(other, self.room, self.date, 3, 4, 5).ok)
+        previous = BookingAttempt.objects.get()
+        auction_id = Auction.objects.get().id
+
+        # Первый элемент перебивает лидера, второй - первый элемент: открытый аукцион остается один
+        ok, results = place_batch(self.user, [self.item(3, 4, 6), self.item(3, 5, 7)], all_or_nothing=True)
+
+        self.assertTrue(ok)
+        first, second = (BookingAttempt.objects.get(pk=result['attempt_id']) for result in results)
+        previous.refresh_from_db()
+        self.assertEqual((previous.status, first.status, second.status),
+                         (BookingAttemptStatus.LOST, BookingAttemptStatus.LOST, BookingAttemptStatus.BIDDING))
+        auction = Auction.objects.get()
+        self.assertEqual((auction.id, auction.leader_id, auction.status, auction.end_slot_number, auction.amount),
+                         (auction_id, second.id, AuctionStatus.OPEN, 5, 7))
+
+    def test_budget_counts_frozen_bids_and_earlier_items(self):
+        place_batch(self.user, [self.item(1, 1, 14)])  # Заморожено 14 из 20
+
+        ok, results = place_batch(self.user, [self.item(3, 4, 4), self.item(6, 7, 4)], all_or_nothing=False)
+
+        self.assertTrue(ok)
+        self.assertEqual([result['status'] for result in results], [ITEM_CREATED, ITEM_FAILED])
+        self.assertIn('Недостаточно баллов', results[1]['error'])
+
+    def test_budget_failure_rejects_all_or_nothing_batch(self):
+        ok, results = place_batch(self.user, [self.item(3, 4, 15), self.item(6, 7, 6)], all_or_nothing=True)
+
+        self.assertFalse(ok)
+        self.assertEqual([result['status'] for result in results], [ITEM_FAILED, ITEM_FAILED])
+        self.assertFalse(BookingAttempt.objects.exists())
+
+
+class BidStrategyTests(BookingTestCase):
+    """ Стратегии одиночной ставки дают одинаковый результат. """
+
+    def outbid(self, bid=place_bid):
+        other = User.objects.create(user_id=2, email='b@example.com', first_name='c', second_name='d', booking_points=self.points)
+        self.assertTrue(bid(self.user, self.room, self.date, 3, 4, 5).ok)
+        self.assertTrue(bid(other, self.room, self.date, 3, 5, 7).ok)
+
+        first, second = BookingAttempt.objects.order_by('id')
+        self.assertEqual((first.status, second.status), (BookingAttemptStatus.LOST, BookingAttemptStatus.BIDDING))
+        self.assertEqual(set(self.slots(3, 5).values_list('current_highest_attempt_id', flat=True)), {second.id})
+        self.assertEqual(Auction.objects.get(status=AuctionStatus.OPEN).leader_id, second.id)
+
+    @override_settings(BOOKING_BID_STRATEGY='lock')
+    def test_lock(self):
+        self.outbid()
+
+    @override_settings(BOOKING_BID_STRATEGY='advisory')
+    def test_advisory(self):
+        self.outbid()
+
+    @skipUnless(connection.vendor == 'postgresql', "booking_place_bid есть только в PostgreSQL")
+    @override_settings(BOOKING_BID_STRATEGY='sql')
+    def test_sql_is_one_call(self):
+        # Путь 'sql' работает только по уже созданным слотам
+        BookingSlot.objects.bulk_create([
+            BookingSlot(room=self.room, date=self.date, slot_number=n, status=BookingSlotStatus.AVAILABLE).fill_times()
+            for n in range(3, 6)
+        ])
+        with CaptureQueriesContext(connection) as queries:
+            self.outbid(bid=submit_bid)
+
+        calls = [query['sql'] for query in queries.captured_queries if 'booking_place_bid' in query['sql']]
+        self.assertEqual(len(calls), 2)
+
+
+class AuctionCloserTests(BookingTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.assertTrue(place_bid(self.user, self.room, self.date, 3, 4, 5).ok)
+        past = timezone.now() - datetime.timedelta(minutes=10)
+        Auction.objects.update(close_at=past, last_bid_at=past)
+
+    def test_due_auction_is_settled(self):
+        run_counts = tasks.close_completed_auctions.run()
+
+        self.assertEqual((run_counts['due'], run_counts['settled']), (1, 1))
+        self.assertEqual(Auction.objects.get().status, AuctionStatus.SETTLED)
+        self.assertEqual(set(self.slots(3, 4).values_list('status', flat=True)), {BookingSlotStatus.BOOKED})
+
+    def test_auction_without_led_slots_is_cancelled(self):
+        self.slots(3, 4).update(status=BookingSlotStatus.AVAILABLE, current_highest_attempt=None)
+
+        run_counts = tasks.close_completed_auctions.run()
+
+        self.assertEqual((run_counts['due'], run_counts['skipped']), (1, 1))
+        self.assertEqual(Auction.objects.get().status, AuctionStatus.CANCELLED)
+
+    @override_settings(AUCTION_CLOSER_TIME_BUDGET=5)
+    def test_failed_auction_is_claimed_once_per_run(self):
+        with mock.patch.object(tasks, '_settle_auction', side_effect=RuntimeError('boom')) as settle:
+            run_counts = tasks.close_completed_auctions.run()
+
+        self.assertEqual(settle.call_count, 1)
+        self.assertEqual((run_counts['due'], run_counts['failed']), (1, 1))
+        self.assertEqual(Auction.objects.get().status, AuctionStatus.OPEN)
+
+
+class BackfillAuctionsTests(BookingTestCase):
+    """ Торги, начатые до таблицы auctions: лидер есть у слотов, строки Auction нет. """
+
+    def setUp(self):
+        super().setUp()
+        self.assertTrue(place_bid(self.user, self.room, self.date, 3, 4, 5).ok)
+        self.attempt = BookingAttempt.objects.get()
+        Auction.objects.all().delete()
+
+    def test_open_auction_is_built_from_led_slots(self):
+        call_command('backfill_auctions', stdout=StringIO())
+
+        auction = Auction.objects.get()
+        self.assertEqual(
+            (auction.leader_id, auction.status, auction.start_slot_number, auction.end_slot_number, auction.amount),
+            (self.attempt.id, AuctionStatus.OPEN, 3, 4, 5),
+        )
+        self.assertLessEqual(auction.close_at, auction.hard_deadline)
+
+        call_command('backfill_auctions', stdout=StringIO()) # Повторный запуск ничего не добавляет
+        self.assertEqual(Auction.objects.count(), 1)
+
+    def test_backfilled_auction_can_be_outbid(self):
+        call_command('backfill_auctions', stdout=StringIO())
+        other = User.objects.create(user_id=2, email='b@example.com', first_name='c', second_name='d', booking_points=self.points)
+
+        self.assertTrue(place_bid(other, self.room, self.date, 3, 4, 7).ok)
+
+        self.attempt.refresh_from_db()
+        self.assertEqual(self.attempt.status, BookingAttemptStatus.LOST)
+        self.assertEqual(Auction.objects.get(status=AuctionStatus.OPEN).amount, 7)
+
+
+@override_settings(THROTTLE_ENABLED=False, INSTANT_BOOKING_WINDOW_MINUTES=60)
+class InstantBookableTests(BookingTestCase):
+    """ Окно мгновенной брони за 30 минут до начала слота 3: в окне только этот слот. """
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('booking:instant-bookable')
+        self.client = APIClient()
+        self.client.force_authenticate(RequestUser.for_profile(self.user))
+        self.now = slot_bounds(self.date, 3)[0] - datetime.timedelta(minutes=30)
+
+    def get(self, queries):
+        with mock.patch('booking.views.timezone.now', return_value=self.now), self.assertNumQueries(queries):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return sorted((slot['room_name'], slot['slot_number']) for slot in response.json()['slots'])
+
+    def test_rooms_without_slot_row_are_listed_in_one_query(self):
+        other = Room.objects.create(name='r2', capacity=10, building='PHYS', floor=1, room_type='seminar')
+        Room.objects.create(name='r3', capacity=10, building='PHYS', floor=1, room_type='seminar', is_active=False)
+        # Слот 3 у r1 есть только на другую дату, а на эту дату есть другой слот - r1 все равно без строки слота 3
+        BookingSlot.objects.bulk_create([
+            BookingSlot(room=self.room, date=self.date + datetime.timedelta(days=1), slot_number=3).fill_times(),
+            BookingSlot(room=self.room, date=self.date, slot_number=5).fill_times(),
+            BookingSlot(room=other, date=self.date, slot_number=3, status=BookingSlotStatus.BOOKED).fill_times(),
+        ])
+
+        self.assertEqual(self.get(queries=2), [('r1', 3)])
+
+    def test_available_slot_row_is_listed_once(self):
+        BookingSlot.objects.create(room=self.room, date=self.date, slot_number=3)
+
+        self.assertEqual(self.get(queries=2), [('r1', 3)])
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    IDEMPOTENCY_ENABLED=True, THROTTLE_ENABLED=False, BOOKING_SEQUENCER_ENABLED=False,
+)
+class IdempotencyTests(BookingTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('booking:booking-attempt-create')
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(RequestUser.for_profile(self.user))
+
+    def body(self, total_bid=5):
+        return {'room': self.room.id, 'date': str(self.date), 'start_slot_number': 3, 'end_slot_number': 4, 'total_bid': total_bid}
+
+    def bid(self, total_bid=5, key='key-1'):
+        return self.client.post(self.url, self.body(total_bid), format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_replay_returns_first_response_without_new_attempt(self):
+        first = self.bid()
+        replay = self.bid()
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(replay.status_code, 201)
+        self.assertEqual(replay.json(), first.json())
+        self.assertEqual(replay[idempotency.REPLAYED_HEADER], 'true')
+        self.assertEqual(BookingAttempt.objects.count(), 1)
+
+    def test_key_reused_with_other_body_is_rejected(self):
+        self.bid()
+        response = self.bid(total_bid=6)
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(BookingAttempt.objects.get().total_bid, 5)
+
+    def test_request_in_flight_gets_conflict(self):
+        # Метка выполнения без ответа - как у параллельного первого запроса с тем же ключом
+        request = SimpleNamespace(user=SimpleNamespace(id=self.user.user_id), method='POST', path=self.url, data=self.body())
+        cache.add(idempotency.cache_key(request, 'key-1'), {'fingerprint': idempotency.fingerprint(request)})
+
+        response = self.bid()
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertFalse(BookingAttempt.objects.exists())
+
+    def test_different_keys_are_independent(self):
+        self.assertEqual(self.bid(key='key-1').status_code, 201)
+        self.assertEqual(self.bid(total_bid=6, key='key-2').status_code, 201)
+        self.assertEqual(BookingAttempt.objects.count(), 2)
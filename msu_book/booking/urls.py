@@ -2,7 +2,11 @@ from django.urls import path
 # Убираем общий импорт views, т.к. импортируем конкретные представления ниже
 # from . import views
 # Импортируем нужные представления и классы APIView
-from .views import FindRoomsForBookingAPIView, booking_finder_page, booking_attempt_form, BookingAttemptCreateAPIView, BookingHistoryAPIView
+from .views import (
+    FindRoomsForBookingAPIView, booking_finder_page, booking_attempt_form, BookingAttemptCreateAPIView,
+    BookingHistoryAPIView, AuctionBacklogAPIView, FreeWindowSearchAPIView, BatchBookingCreateAPIView,
+    InstantBookableAPIView, BidTicketAPIView, OccupancyMatrixAPIView
+)
 app_name = 'booking' # Хорошая практика - задать пространство имен для URL
 
 urlpatterns = [
@@ -12,12 +16,22 @@ urlpatterns = [
     # Новая ссылка на DRF APIView (оставляем или модифицируем)
     # Используем путь 'find/' и имя 'find_rooms_for_booking_api' как было предложено
     path('find/', FindRoomsForBookingAPIView.as_view(), name='find_rooms_for_booking_api'),
+    # Поиск ближайших свободных окон по всем аудиториям и датам одним запросом
+    path('windows/', FreeWindowSearchAPIView.as_view(), name='free-window-search'),
+    # Матрица занятости (аудитория × слот) для тепловой карты корпуса/этажа
+    path('occupancy/', OccupancyMatrixAPIView.as_view(), name='occupancy-matrix'),
+    # Слоты, доступные для мгновенной брони прямо сейчас
+    path('instant/', InstantBookableAPIView.as_view(), name='instant-bookable'),
 
     # Оставляем другие рабочие URL
     path('find-page/', booking_finder_page, name='booking_finder_page'),
     path('book-form/', booking_attempt_form, name='booking_attempt_form'),
     path('booking-attempt-create/', BookingAttemptCreateAPIView.as_view(), name='booking-attempt-create'),
+    # Результат ставки, принятой в очередь (BOOKING_SEQUENCER_ENABLED)
+    path('tickets/<str:ticket>/', BidTicketAPIView.as_view(), name='bid-ticket'),
+    path('booking-attempt-batch/', BatchBookingCreateAPIView.as_view(), name='booking-attempt-batch'),
     path('history/', BookingHistoryAPIView.as_view(), name='booking-history'),
+    path('auctions/backlog/', AuctionBacklogAPIView.as_view(), name='auction-backlog'),
     # --- Добавьте сюда другие URL вашего приложения booking, если нужно ---
 ]
 
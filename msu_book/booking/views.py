@@ -3,15 +3,19 @@ from django.shortcuts import render, get_object_or_404
 from main.models import ( # Импортируем все нужные модели
     Room, BookingSlot, BookingGroup, User, BookingAttempt, BookingSlotStatus,
     FloorChoices, TimeSlotNumberChoices, BookingAttemptStatus, PointTransaction,
-    GroupContribution, TIME_SLOTS_DETAILS # Добавили GroupContribution и TIME_SLOTS_DETAILS
+    GroupContribution, TIME_SLOTS_DETAILS, # Добавили GroupContribution и TIME_SLOTS_DETAILS
+    Auction, AuctionStatus, slot_bounds
 )
+from main import versions, rows
+from my_auth.identity import current_user
 import datetime
 from django.utils import timezone
 from django.db import transaction, models
-from django.db.models import Sum, Q, F # Добавили Q для сложных запросов И F для атомарных обновлений
+from django.db.models import Sum, Q, F, Exists, OuterRef # Добавили Q для сложных запросов И F для атомарных обновлений
 from rest_framework import generics, status, views
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from django.conf import settings
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
 import traceback # Для логирования
 import logging # Используем logging
@@ -19,9 +23,22 @@ import logging # Используем logging
 # Импортируем созданные сериализаторы
 from .serializers import (
     RoomAvailabilitySerializer, FindRoomsQuerySerializer,
-    BookingAttemptCreateSerializer, BookingAttemptDetailSerializer
+    BookingAttemptCreateSerializer, BookingAttemptDetailSerializer,
+    AuctionBacklogSerializer, FreeWindowQuerySerializer, FreeWindowSerializer,
+    BatchBookingCreateSerializer, BatchBookingItemResultSerializer, InstantSlotSerializer, BidTicketSerializer,
+    OccupancyQuerySerializer, OccupancyMatrixSerializer
 )
+from .batch import place_batch
+from .services import submit_bid
+from . import sequencer
+from .metrics import overdue_auction_backlog
+from .availability import find_earliest_windows
+from .occupancy import occupancy_matrix
 from rest_framework.views import APIView
+from rest_framework.settings import api_settings
+from msu_book.renderers import BINARY_RENDERERS, BinaryContentNegotiation
+from msu_book.throttling import BidThrottle
+from msu_book.idempotency import idempotent, HEADER as IDEMPOTENCY_HEADER
 
 # --- Новые импорты для drf-spectacular ---
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiResponse
@@ -29,6 +46,13 @@ from drf_spectacular.types import OpenApiTypes
 
 logger = logging.getLogger(__name__) # Настраиваем логгер
 
+# Заголовок для безопасного повтора ставок и отмены (msu_book.idempotency)
+IDEMPOTENCY_KEY_PARAMETER = OpenApiParameter(
+    name=IDEMPOTENCY_HEADER, type=OpenApiTypes.STR, location=OpenApiParameter.HEADER, required=False,
+    description='Уникальный ключ запроса (например, UUID). Повтор с тем же ключом возвращает сохраненный первый ответ '
+                '(заголовок Idempotent-Replayed) без повторной обработки; тот же ключ с другим телом - 422.',
+)
+
 # --- Предыдущие представления ---
 def booking_attempt_form(request):
     rooms = Room.objects.filter(is_active=True)  # Только активные аудитории
@@ -37,9 +61,7 @@ def booking_attempt_form(request):
     available_slots = BookingSlot.objects.filter(date=today, status='available')
     # Получаем кастомного пользователя
     try:
-        # Предполагаем, что request.user аутентифицирован и имеет user_id
-        current_user = User.objects.get(user_id=request.user.id) # или request.user.user_id, зависит от вашей настройки
-        user_groups = BookingGroup.objects.filter(members=current_user)
+        user_groups = BookingGroup.objects.filter(members=current_user(request))
     except (User.DoesNotExist, AttributeError): # Обработка если юзер не найден или не аутентифицирован
         user_groups = BookingGroup.objects.none()
 
@@ -56,6 +78,9 @@ class FindRoomsForBookingAPIView(APIView):
     Находит аудитории, доступные или занятые в указанный диапазон времени,
     возвращая детальный статус для диапазона.
     """
+    replica_safe = True # Только чтение - можно отдавать репликам (msu_book.db_router)
+    row_mapper = rows.RoomAvailabilityRows() # Быстрая сериализация (main.rows)
+    throttle_scope = 'search' # Лимиты THROTTLE_RATES (msu_book.throttling)
 
     @extend_schema(
         summary="Поиск аудиторий с детальным статусом",
@@ -74,6 +99,7 @@ class FindRoomsForBookingAPIView(APIView):
         },
         tags=['booking']
     )
+    @versions.versioned(versions.query_date(), versions.fixed(versions.ROOMS))
     def get(self, request, *args, **kwargs):
         query_serializer = FindRoomsQuerySerializer(data=request.GET)
         if not query_serializer.is_valid():
@@ -120,14 +146,12 @@ class FindRoomsForBookingAPIView(APIView):
                 slots_by_room[room_id] = {}
             slots_by_room[room_id][slot_data['slot_number']] = slot_data['status']
 
-        for room in rooms_to_check:
-            range_status = 'UNKNOWN' # Статус по умолчанию
-
-            if not room.is_active:
+        def range_status_for(room_id, is_active):
+            if not is_active:
                 range_status = 'INACTIVE'
             else:
                 # Анализируем статусы слотов для АКТИВНОЙ комнаты
-                room_slots_in_range = slots_by_room.get(room.id, {})
+                room_slots_in_range = slots_by_room.get(room_id, {})
                 has_booked = False
                 has_unavailable = False
                 has_in_auction = False
@@ -158,7 +182,19 @@ class FindRoomsForBookingAPIView(APIView):
                 else:
                     # Если не было BOOKED, UNAVAILABLE, IN_AUCTION, значит все AVAILABLE
                     range_status = BookingSlotStatus.AVAILABLE.upper()
+            return range_status
 
+        if rows.enabled(self):
+            # Быстрый путь: строки values() и готовые подписи choices вместо моделей и сериализатора
+            results_data = [
+                self.row_mapper.row(values, range_status_for(values['id'], values['is_active']))
+                for values in self.row_mapper.select(rooms_to_check)
+            ]
+            results_data.sort(key=lambda x: (status_order.get(x['range_status'], 99), x['name']))
+            return Response({'rooms': results_data})
+
+        for room in rooms_to_check:
+            range_status = range_status_for(room.id, room.is_active)
             room_data = {
                 'id': room.id,
                 'name': room.name,
@@ -180,24 +216,175 @@ class FindRoomsForBookingAPIView(APIView):
         output_serializer = RoomAvailabilitySerializer(sorted_results_data, many=True)
         return Response({'rooms': output_serializer.data})
 
+# --- Поиск ближайших свободных окон по всем аудиториям и датам ---
+class FreeWindowSearchAPIView(APIView):
+    """
+    Возвращает K самых ранних окон (аудитория, дата, начальный слот) заданной длины,
+    полностью свободных (или доступных для перебивания ставкой) в диапазоне дат.
+    Заменяет серию вызовов /booking/find/ по датам и диапазонам слотов одним запросом.
+    """
+    replica_safe = True
+    throttle_scope = 'search'
+
+    @extend_schema(
+        summary="Поиск ближайших свободных окон",
+        description="Ищет по всем активным аудиториям (с учетом фильтров) самые ранние окна из `duration` подряд идущих слотов. "
+                    "Доступность считается за один проход по компактным битовым маскам (аудитория, день), "
+                    "построенным одним запросом к слотам на весь диапазон дат.",
+        parameters=[FreeWindowQuerySerializer],
+        responses={
+            200: OpenApiResponse(response=FreeWindowSerializer(many=True), description='Найденные окна, от самых ранних.'),
+            400: OpenApiResponse(response=OpenApiTypes.OBJECT, description='Ошибка валидации параметров.'),
+        },
+        tags=['booking']
+    )
+    def get(self, request, *args, **kwargs):
+        query_serializer = FreeWindowQuerySerializer(data=request.GET)
+        if not query_serializer.is_valid():
+            return Response(query_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = query_serializer.validated_data
+
+        rooms = Room.objects.filter(is_active=True).only('id', 'name', 'building', 'floor', 'capacity', 'room_type')
+        if 'building' in params:
+            rooms = rooms.filter(building=params['building'])
+        if 'floor' in params:
+            rooms = rooms.filter(floor=params['floor'])
+        if 'min_capacity' in params:
+            rooms = rooms.filter(capacity__gte=params['min_capacity'])
+        if 'room_type' in params:
+            rooms = rooms.filter(room_type=params['room_type'])
+        for feature in params.get('features', []):
+            rooms = rooms.filter(features__has_key=feature)
+
+        windows = find_earliest_windows(
+            list(rooms),
+            date_from=params['date_from'],
+            date_to=params['date_to'],
+            duration=params['duration'],
+            limit=params['limit'],
+            include_auction=params['include_auction'],
+        )
+        return Response({'windows': FreeWindowSerializer(windows, many=True).data})
+
+# --- Матрица занятости аудиторий для тепловой карты ---
+class OccupancyMatrixAPIView(APIView):
+    """
+    Статусы всех слотов всех аудиторий корпуса/этажа за дату или диапазон дат одним ответом
+    в колоночном формате (booking.occupancy). Вместо 14 вызовов /booking/find/ на этаж.
+    """
+    replica_safe = True
+    throttle_scope = 'search'
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + BINARY_RENDERERS
+    content_negotiation_class = BinaryContentNegotiation
+
+    @extend_schema(
+        summary="Матрица занятости аудиторий",
+        description="Аудитории (id, названия, этажи) передаются один раз, затем для каждой даты - строка кодов статуса "
+                    "по слотам всех аудиторий подряд. Коды: 0 - свободен, 1 - аукцион, 2 - забронирован, 3 - недоступен, "
+                    "4 - аудитория неактивна. Ответ в msgpack - по Accept: application/msgpack или ?format=msgpack.",
+        parameters=[OccupancyQuerySerializer],
+        responses={
+            200: OpenApiResponse(response=OccupancyMatrixSerializer, description='Матрица занятости.'),
+            400: OpenApiResponse(response=OpenApiTypes.OBJECT, description='Ошибка валидации параметров.'),
+        },
+        tags=['booking']
+    )
+    @versions.versioned(
+        versions.query_date_range(max_days=settings.OCCUPANCY_MAX_DAYS), versions.fixed(versions.ROOMS),
+    )
+    def get(self, request, *args, **kwargs):
+        query_serializer = OccupancyQuerySerializer(data=request.GET)
+        if not query_serializer.is_valid():
+            return Response(query_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = query_serializer.validated_data
+        return Response(occupancy_matrix(
+            params['date_from'], params['date_to'],
+            building=params.get('building'), floor=params.get('floor'),
+        ))
+
+# --- Слоты для мгновенной брони прямо сейчас ---
+class InstantBookableAPIView(APIView):
+    """
+    Возвращает свободные слоты активных аудиторий, начинающиеся в ближайший час
+    (рынок мгновенной брони по минимальной цене).
+    """
+    throttle_scope = 'search'
+
+    @extend_schema(
+        summary="Слоты для мгновенной брони",
+        description="Свободные слоты, до начала которых осталось не больше INSTANT_BOOKING_WINDOW_MINUTES минут. "
+                    "Выбираются по индексу (status, starts_at); слоты, еще не созданные генератором, считаются свободными.",
+        responses={
+            200: OpenApiResponse(response=InstantSlotSerializer(many=True), description='Слоты по времени начала.'),
+        },
+        tags=['booking']
+    )
+    def get(self, request, *args, **kwargs):
+        now = timezone.now()
+        window_end = now + datetime.timedelta(minutes=settings.INSTANT_BOOKING_WINDOW_MINUTES)
+
+        slots = [
+            {'room': slot.room, 'date': slot.date, 'slot_number': slot.slot_number,
+             'starts_at': slot.starts_at, 'ends_at': slot.ends_at, 'price': 1}
+            for slot in BookingSlot.objects.filter(
+                status=BookingSlotStatus.AVAILABLE,
+                starts_at__gt=now,
+                starts_at__lte=window_end,
+                room__is_active=True,
+            ).select_related('room')
+        ]
+
+        # Слоты без строки в БД тоже свободны: одним запросом отмечаем у каждой активной аудитории,
+        # какие слоты окна уже созданы (по флагу Exists на номер слота)
+        today = timezone.localdate(now)
+        window = {}
+        for slot_number in TIME_SLOTS_DETAILS:
+            bounds = slot_bounds(today, slot_number)
+            if now < bounds[0] <= window_end:
+                window[slot_number] = bounds
+        if window:
+            rooms = Room.objects.filter(is_active=True).annotate(**{
+                f'has_slot_{slot_number}': Exists(BookingSlot.objects.filter(
+                    room=OuterRef('pk'), date=today, slot_number=slot_number,
+                ))
+                for slot_number in window
+            })
+            slots.extend(
+                {'room': room, 'date': today, 'slot_number': slot_number,
+                 'starts_at': starts_at, 'ends_at': ends_at, 'price': 1}
+                for room in rooms
+                for slot_number, (starts_at, ends_at) in window.items()
+                if not getattr(room, f'has_slot_{slot_number}')
+            )
+
+        slots.sort(key=lambda slot: (slot['starts_at'], slot['room'].name))
+        return Response({'slots': InstantSlotSerializer(slots, many=True).data})
+
 # --- Представление для создания/обработки заявки ---
 class BookingAttemptCreateAPIView(APIView):
     permission_classes = [IsAuthenticated]
+    throttle_classes = [BidThrottle] # Лимиты 'bid' и отдельный бюджет на день аудитории
 
     @extend_schema(
         summary="Создание/обработка заявки на бронирование",
-        description="Создает индивидуальную или групповую заявку. Обрабатывает мгновенное бронирование (< 1 часа до слота) или инициирует аукцион. Проверяет доступность, баланс/заморозку, права.",
+        description="Создает индивидуальную или групповую заявку. Обрабатывает мгновенное бронирование (< 1 часа до слота) или инициирует аукцион. Проверяет доступность, баланс/заморозку, права. "
+                    "С max_bid ставка становится автоставкой: при перебитии на тот же диапазон она сама поднимается до минимально выигрывающей, но не выше max_bid.",
         request=BookingAttemptCreateSerializer,
+        parameters=[IDEMPOTENCY_KEY_PARAMETER],
         responses={
             201: OpenApiResponse(response=BookingAttemptDetailSerializer, description='Заявка успешно создана (аукцион или мгновенная бронь).'),
+            202: OpenApiResponse(response=BidTicketSerializer, description='Ставка принята в очередь (BOOKING_SEQUENCER_ENABLED), результат - по билету.'),
             400: OpenApiResponse(description='Ошибка валидации данных.'),
             403: OpenApiResponse(description='Ошибка прав доступа.'),
             404: OpenApiResponse(description='Объект не найден.'),
-            409: OpenApiResponse(description='Конфликт (слоты заняты, группа заблокирована).'),
+            409: OpenApiResponse(description='Конфликт (слоты заняты, группа заблокирована, ставку отбила автоставка лидера) или запрос с тем же Idempotency-Key еще выполняется.'),
+            422: OpenApiResponse(description='Idempotency-Key уже использован для другого запроса.'),
+            429: OpenApiResponse(description='Превышен лимит ставок (THROTTLE_RATES, THROTTLE_BID_TARGET_RATE), см. Retry-After.'),
             500: OpenApiResponse(description='Внутренняя ошибка сервера.'),
         },
         tags=['booking']
     )
+    @idempotent
     def post(self, request, *args, **kwargs):
         serializer = BookingAttemptCreateSerializer(data=request.data, context={'request': request})
         if not serializer.is_valid():
@@ -205,7 +392,7 @@ class BookingAttemptCreateAPIView(APIView):
 
         validated_data = serializer.validated_data
         try:
-            user = User.objects.get(user_id=request.user.id)
+            user = current_user(request)
         except User.DoesNotExist:
              return Response({"error": "Связанный пользователь не найден."}, status=status.HTTP_404_NOT_FOUND)
         except AttributeError:
@@ -215,198 +402,32 @@ class BookingAttemptCreateAPIView(APIView):
         selected_date = validated_data['date']
         start_slot_num = validated_data['start_slot_number']
         end_slot_num = validated_data['end_slot_number']
-        total_bid_input = validated_data.get('total_bid')
-        funding_group = validated_data.get('funding_group')
-        is_group_bid = funding_group is not None
-
-        slot_numbers = list(range(start_slot_num, end_slot_num + 1))
-        num_slots = len(slot_numbers)
-        now = timezone.now()
 
-        first_slot_start_time_detail = TIME_SLOTS_DETAILS.get(start_slot_num, {}).get("start")
-        if not first_slot_start_time_detail:
+        if start_slot_num not in TIME_SLOTS_DETAILS:
              logger.error(f"Не найдено время начала для слота {start_slot_num}.")
              return Response({"error": "Внутренняя ошибка: не найдено время начала слота."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        naive_start_datetime = datetime.datetime.combine(selected_date, first_slot_start_time_detail)
-        if timezone.is_aware(now):
-            current_tz = timezone.get_current_timezone()
-            aware_start_datetime = timezone.make_aware(naive_start_datetime, current_tz)
-        else:
-            aware_start_datetime = naive_start_datetime
-        is_instant_booking_window = (aware_start_datetime - now) < datetime.timedelta(hours=1)
-
-        final_total_bid = 0
-        if is_group_bid:
-            if funding_group.initiator != user:
-                return Response({"funding_group": "Вы не являетесь администратором этой группы."}, status=status.HTTP_403_FORBIDDEN)
-            if not is_instant_booking_window and BookingAttempt.objects.filter(funding_group=funding_group, status=BookingAttemptStatus.BIDDING).exists():
-                 return Response({"funding_group": "Группа уже участвует в другом активном аукционе."}, status=status.HTTP_409_CONFLICT)
-            group_balance = funding_group.current_balance
-            final_total_bid = group_balance
-            min_required_balance = num_slots
-            if group_balance < min_required_balance:
-                 return Response({"funding_group": f"Недостаточно средств ({group_balance} ББ). Минимум {min_required_balance} ББ."}, status=status.HTTP_400_BAD_REQUEST)
-        else:
-            final_total_bid = total_bid_input
-            if is_instant_booking_window:
-                final_total_bid = num_slots
-                if user.booking_points < final_total_bid:
-                    return Response({"total_bid": f"Недостаточно баллов ({user.booking_points} ББ) для мгновенной брони ({final_total_bid} ББ)."}, status=status.HTTP_400_BAD_REQUEST)
-            else:
-                frozen_bids_sum = user.initiated_attempts.filter(
-                    status=BookingAttemptStatus.BIDDING,
-                    funding_group__isnull=True
-                ).aggregate(total=Sum('total_bid'))['total'] or 0
-                required_total = final_total_bid + frozen_bids_sum
-                if user.booking_points < required_total:
-                    return Response({
-                        "total_bid": f"Недостаточно баллов. Ваши баллы: {user.booking_points}. "
-                                     f"Требуется для этой ставки: {final_total_bid}. "
-                                     f"Уже заморожено в других ставках: {frozen_bids_sum}. "
-                                     f"Всего нужно: {required_total}."
-                    }, status=status.HTTP_400_BAD_REQUEST)
-
-        # --- Транзакция ---
-        try:
-            with transaction.atomic():
-                slots_to_process = []
-                existing_slots_map = {
-                    slot.slot_number: slot
-                    for slot in BookingSlot.objects.select_for_update().filter(
-                        room=room, date=selected_date, slot_number__in=slot_numbers
-                    )
-                }
-                for slot_num in slot_numbers:
-                    if slot_num in existing_slots_map:
-                        slots_to_process.append(existing_slots_map[slot_num])
-                    else:
-                        new_slot = BookingSlot.objects.create(
-                            room=room, date=selected_date, slot_number=slot_num,
-                            status=BookingSlotStatus.AVAILABLE
-                        )
-                        slots_to_process.append(new_slot)
-
-                start_slot_obj = next(s for s in slots_to_process if s.slot_number == start_slot_num)
-                end_slot_obj = next(s for s in slots_to_process if s.slot_number == end_slot_num)
-
-                # --- Определение состояния аукциона ---
-                current_leader_attempt = None
-                current_max_bid = 0
-                all_slots_available = True
-                found_in_auction_leader_ids = set()
-
-                for slot in slots_to_process:
-                    if slot.status == BookingSlotStatus.BOOKED or slot.status == BookingSlotStatus.UNAVAILABLE:
-                        logger.warning(f"Попытка ставки на занятый/недоступный слот: {slot}")
-                        return Response({"error": f"Слот {slot} уже забронирован или недоступен."}, status=status.HTTP_409_CONFLICT)
-                    elif slot.status == BookingSlotStatus.IN_AUCTION:
-                        all_slots_available = False
-                        if slot.current_highest_attempt:
-                            found_in_auction_leader_ids.add(slot.current_highest_attempt.id)
-                    elif slot.status == BookingSlotStatus.AVAILABLE:
-                        pass # Просто запоминаем, что не все в аукционе
-
-                # Проверяем консистентность лидера на слотах в аукционе
-                if len(found_in_auction_leader_ids) > 1:
-                    logger.error(f"Неконсистентное состояние аукциона для слотов {slot_numbers} на {selected_date} в {room}. Обнаружены разные лидеры: {found_in_auction_leader_ids}")
-                    return Response({"error": "Ошибка состояния аукциона. Пожалуйста, попробуйте позже или обратитесь к администратору."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-                elif len(found_in_auction_leader_ids) == 1:
-                    leader_id = found_in_auction_leader_ids.pop()
-                    try:
-                        # Загружаем лидера (может быть заблокирован, если надо будет менять)
-                        current_leader_attempt = BookingAttempt.objects.get(pk=leader_id)
-                        current_max_bid = current_leader_attempt.total_bid
-                    except BookingAttempt.DoesNotExist:
-                         logger.error(f"Не найдена лидирующая заявка с ID {leader_id}, хотя она указана в слотах.")
-                         return Response({"error": "Ошибка состояния аукциона (лидер не найден)."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-                # --- Логика для мгновенной брони ---
-                if is_instant_booking_window:
-                    # Проверяем, не занят ли слот, пока мы тут думали (хотя select_for_update должен помочь)
-                    if not all_slots_available:
-                         # Если хотя бы один слот УЖЕ В АУКЦИОНЕ, мгновенная бронь невозможна
-                         logger.warning(f"Попытка мгновенной брони на слоты, уже находящиеся в аукционе: {slots_to_process}")
-                         return Response({"error": "Невозможно мгновенно забронировать, так как аукцион уже идет."}, status=status.HTTP_409_CONFLICT)
-
-                    attempt_status = BookingAttemptStatus.INSTANT_BOOKED
-                    slot_status = BookingSlotStatus.BOOKED
-
-                    instant_attempt = BookingAttempt.objects.create(
-                        initiator=user, room=room, start_slot=start_slot_obj, end_slot=end_slot_obj,
-                        total_bid=final_total_bid, funding_group=funding_group, status=attempt_status,
-                        booking_date=aware_start_datetime
-                    )
-                    for slot in slots_to_process:
-                        slot.status = slot_status
-                        slot.final_booking_attempt = instant_attempt
-                        slot.current_highest_attempt = None
-                        slot.auction_close_time = None
-                        slot.save()
-
-                    if is_group_bid:
-                        GroupContribution.objects.filter(group=funding_group).delete()
-                    else:
-                        user_to_update = User.objects.select_for_update().get(pk=user.pk)
-                        user_to_update.booking_points = F('booking_points') - final_total_bid
-                        user_to_update.save()
-                        PointTransaction.objects.create(
-                            user=user, amount=-final_total_bid,
-                            transaction_type=PointTransaction.TransactionType.BOOKING_SPEND_INDIVIDUAL,
-                            related_attempt=instant_attempt,
-                            description=f"Мгновенная бронь {num_slots} слотов."
-                        )
-                    result_serializer = BookingAttemptDetailSerializer(instant_attempt)
-                    logger.info(f"Мгновенная бронь {instant_attempt.id} создана пользователем {user.id}.")
-                    return Response(result_serializer.data, status=status.HTTP_201_CREATED)
-
-                # --- Логика для аукциона ---
-                else:
-                    # Проверка величины ставки (только если перебиваем существующий аукцион)
-                    if current_leader_attempt and final_total_bid <= current_max_bid:
-                        logger.info(f"Неудачная ставка от {user.id}. Ставка ({final_total_bid}) <= текущей ({current_max_bid}).")
-                        return Response(
-                            {"total_bid": f"Ставка ({final_total_bid} ББ) должна быть > текущей ({current_max_bid} ББ)."},
-                            status=status.HTTP_400_BAD_REQUEST
-                        )
-
-                    # Отменяем предыдущую лидирующую заявку, если она была и активна
-                    if current_leader_attempt and current_leader_attempt.status == BookingAttemptStatus.BIDDING:
-                        # Блокируем предыдущего лидера перед изменением статуса
-                        leader_to_cancel = BookingAttempt.objects.select_for_update().get(pk=current_leader_attempt.pk)
-                        leader_to_cancel.status = BookingAttemptStatus.LOST
-                        leader_to_cancel.save(update_fields=['status'])
-                        logger.info(f"Заявка {leader_to_cancel.id} перебита новой ставкой и установлена в LOST.")
-                        # !!! TODO: Логика разблокировки группы (если leader_to_cancel был групповым) !!!
-
-                    # Создаем новую заявку
-                    new_attempt = BookingAttempt.objects.create(
-                        initiator=user, room=room, start_slot=start_slot_obj, end_slot=end_slot_obj,
-                        total_bid=final_total_bid, funding_group=funding_group,
-                        status=BookingAttemptStatus.BIDDING,
-                        booking_date=aware_start_datetime
-                    )
-
-                    # Обновление статуса слотов и времени закрытия
-                    # !!! TODO: Определить корректную логику auction_close_time и овертайма !!!
-                    # Оставляем пример: закрытие за час до начала, без овертайма
-                    # Овертайм будет обрабатываться в tasks.py
-                    auction_close_time = aware_start_datetime - datetime.timedelta(hours=1)
-
-                    for slot in slots_to_process:
-                        slot.status = BookingSlotStatus.IN_AUCTION
-                        slot.current_highest_attempt = new_attempt
-                        slot.final_booking_attempt = None # Убедимся, что очищено
-                        # Устанавливаем время закрытия, только если оно еще не установлено или раньше текущего
-                        if not slot.auction_close_time or auction_close_time < slot.auction_close_time:
-                             slot.auction_close_time = auction_close_time
-                        slot.save()
-
-                    logger.info(f"Новая ставка {new_attempt.id} ({'групповая' if is_group_bid else 'индивидуальная'}) принята. Слоты {slot_numbers} теперь IN_AUCTION.")
-                    # !!! TODO: Логика блокировки группы (если ставка групповая) !!!
+        if settings.BOOKING_SEQUENCER_ENABLED:
+            # Ставку проведет обработчик партиции этого дня аудитории, строго по порядку поступления
+            ticket = sequencer.enqueue_bid(
+                user, room, selected_date, start_slot_num, end_slot_num, validated_data.get('total_bid'),
+                funding_group=validated_data.get('funding_group'), max_bid=validated_data.get('max_bid'),
+            )
+            return Response(
+                BidTicketSerializer({'ticket': ticket, 'status': sequencer.TICKET_QUEUED}).data,
+                status=status.HTTP_202_ACCEPTED,
+            )
 
-                    result_serializer = BookingAttemptDetailSerializer(new_attempt)
-                    return Response(result_serializer.data, status=status.HTTP_201_CREATED)
+        # --- Проверки баланса и решение ядра аукциона (booking.services) ---
+        try:
+            result = submit_bid(
+                user, room, selected_date, start_slot_num, end_slot_num, validated_data.get('total_bid'),
+                funding_group=validated_data.get('funding_group'), max_bid=validated_data.get('max_bid'),
+            )
+            if not result.ok:
+                return Response(result.error, status=result.status_code)
+            result_serializer = BookingAttemptDetailSerializer(result.attempt)
+            return Response(result_serializer.data, status=status.HTTP_201_CREATED)
 
         except ObjectDoesNotExist as e:
              logger.warning(f"Объект не найден при обработке ставки: {e}")
@@ -421,6 +442,92 @@ class BookingAttemptCreateAPIView(APIView):
             return Response({"error": "Внутренняя ошибка сервера при обработке заявки."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+# --- Результат ставки из очереди (long-poll) ---
+class BidTicketAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    throttle_scope = 'poll'
+
+    @extend_schema(
+        summary="Результат ставки по билету",
+        description="Возвращает результат ставки, принятой в очередь. Если ставка еще не обработана, "
+                    "запрос ждет результат до wait секунд (не больше BOOKING_SEQUENCER_POLL_TIMEOUT) и отвечает 202 со status=queued.",
+        parameters=[
+            OpenApiParameter(name='wait', description='Сколько секунд ждать результат (0 - не ждать).', required=False, type=OpenApiTypes.INT),
+        ],
+        responses={
+            200: OpenApiResponse(response=BidTicketSerializer, description='Ставка обработана: status_code и result - ответ синхронного запроса.'),
+            202: OpenApiResponse(response=BidTicketSerializer, description='Ставка еще в очереди.'),
+            404: OpenApiResponse(description='Билет не найден или истек.'),
+        },
+        tags=['booking']
+    )
+    def get(self, request, ticket, *args, **kwargs):
+        try:
+            user = current_user(request)
+        except User.DoesNotExist:
+            return Response({"error": "Связанный пользователь не найден."}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            wait = int(request.query_params.get('wait', settings.BOOKING_SEQUENCER_POLL_TIMEOUT))
+        except ValueError:
+            return Response({"wait": "Ожидается целое число секунд."}, status=status.HTTP_400_BAD_REQUEST)
+        wait = max(0, min(wait, settings.BOOKING_SEQUENCER_POLL_TIMEOUT))
+
+        state = sequencer.wait_ticket(ticket, wait) if wait else sequencer.get_ticket(ticket)
+        # Чужой билет не отличаем от несуществующего
+        if state is None or state['user_id'] != user.pk:
+            return Response({"error": "Билет не найден или истек."}, status=status.HTTP_404_NOT_FOUND)
+        if state['status'] != sequencer.TICKET_DONE:
+            return Response(BidTicketSerializer({'ticket': ticket, 'status': state['status']}).data, status=status.HTTP_202_ACCEPTED)
+        return Response(BidTicketSerializer({
+            'ticket': ticket, 'status': state['status'], 'status_code': state['status_code'], 'result': state['body'],
+        }).data)
+
+
+# --- Пакетное (повторяющееся) бронирование одним запросом ---
+class BatchBookingCreateAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [BidThrottle]
+
+    @extend_schema(
+        summary="Пакетное бронирование нескольких диапазонов",
+        description="Принимает список диапазонов (аудитория, дата, слоты) или правило повторения (например, каждый вторник семестра) "
+                    "и обрабатывает их в одной транзакции: баллы проверяются один раз, все слоты блокируются одним запросом, "
+                    "заявки создаются bulk-операциями. При all_or_nothing=true ошибка в любом элементе отменяет весь пакет.",
+        request=BatchBookingCreateSerializer,
+        parameters=[IDEMPOTENCY_KEY_PARAMETER],
+        responses={
+            201: OpenApiResponse(response=BatchBookingItemResultSerializer(many=True), description='Все элементы пакета обработаны успешно.'),
+            207: OpenApiResponse(response=BatchBookingItemResultSerializer(many=True), description='Часть элементов не создана (all_or_nothing=false).'),
+            400: OpenApiResponse(description='Ошибка валидации данных.'),
+            404: OpenApiResponse(description='Пользователь не найден.'),
+            409: OpenApiResponse(response=BatchBookingItemResultSerializer(many=True), description='Пакет отклонен (конфликт или нехватка баллов).'),
+            422: OpenApiResponse(description='Idempotency-Key уже использован для другого запроса.'),
+        },
+        tags=['booking']
+    )
+    @idempotent
+    def post(self, request, *args, **kwargs):
+        serializer = BatchBookingCreateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            user = current_user(request)
+        except User.DoesNotExist:
+            return Response({"error": "Связанный пользователь не найден."}, status=status.HTTP_404_NOT_FOUND)
+
+        validated_data = serializer.validated_data
+        any_created, results = place_batch(user, validated_data['items'], validated_data['all_or_nothing'])
+
+        all_created = all(result['status'] == 'created' for result in results)
+        if all_created:
+            response_status = status.HTTP_201_CREATED
+        elif any_created:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_409_CONFLICT
+        return Response({'results': BatchBookingItemResultSerializer(results, many=True).data}, status=response_status)
+
+
 def booking_finder_page(request):
     context = {
         'today_date': timezone.now().date()
@@ -436,20 +543,23 @@ class BookingAttemptCancelAPIView(APIView):
         summary="Отмена заявки на бронирование",
         description="Позволяет инициатору отменить активную ставку (status='bidding') или уже выигранную бронь (status='won'). При отмене активной индивидуальной ставки возвращается 50% баллов (округление вниз, до лимита 28). При отмене выигранной брони баллы не возвращаются.",
         request=None, # ID передается в URL
+        parameters=[IDEMPOTENCY_KEY_PARAMETER],
         responses={
             200: OpenApiResponse(description='Заявка успешно отменена.'),
             400: OpenApiResponse(description='Неверный статус заявки (можно отменить только BIDDING или WON) или слишком поздно для отмены (для WON).'),
             403: OpenApiResponse(description='Вы не являетесь инициатором этой заявки.'),
             404: OpenApiResponse(description='Заявка не найдена.'),
+            422: OpenApiResponse(description='Idempotency-Key уже использован для другого запроса.'),
             500: OpenApiResponse(description='Внутренняя ошибка сервера.'),
         },
         tags=['booking']
     )
+    @idempotent
     def post(self, request, attempt_id, *args, **kwargs):
         # --- Получаем кастомного пользователя ---
         try:
             # Аналогично CreateAPIView
-            user = User.objects.get(user_id=request.user.id) # или request.user.pk, или request.user.user_id
+            user = current_user(request)
         except User.DoesNotExist:
              return Response({"error": "Связанный пользователь не найден."}, status=status.HTTP_404_NOT_FOUND)
         except AttributeError:
@@ -473,17 +583,9 @@ class BookingAttemptCancelAPIView(APIView):
                 # --- Логика для отмены ВЫИГРАННОЙ брони ---
                 if original_status == BookingAttemptStatus.WON:
                     # Проверка времени (нельзя отменить после начала)
-                    start_datetime = attempt.start_slot.start_datetime
-                    # Сделаем datetime aware, если необходимо, для сравнения
-                    if start_datetime:
-                        if timezone.is_aware(now) and not timezone.is_aware(start_datetime):
-                           current_tz = timezone.get_current_timezone()
-                           start_datetime = timezone.make_aware(start_datetime, current_tz)
-                        elif not timezone.is_aware(now) and timezone.is_aware(start_datetime):
-                            start_datetime = timezone.make_naive(start_datetime)
-                        # Теперь можно сравнивать
-                        if now >= start_datetime:
-                            return Response({"detail": "Нельзя отменить бронирование после его начала."}, status=status.HTTP_400_BAD_REQUEST)
+                    start_datetime = attempt.start_slot.start_datetime # С таймзоной (BookingSlot.starts_at)
+                    if start_datetime and now >= start_datetime:
+                        return Response({"detail": "Нельзя отменить бронирование после его начала."}, status=status.HTTP_400_BAD_REQUEST)
 
                     # Обновление заявки
                     attempt.status = BookingAttemptStatus.CANCELLED
@@ -495,9 +597,9 @@ class BookingAttemptCancelAPIView(APIView):
                         status=BookingSlotStatus.AVAILABLE,
                         final_booking_attempt=None,
                         current_highest_attempt=None,
-                        auction_close_time=None
                     )
                     print(f"Updated {updated_count} slots to AVAILABLE for cancelled WON attempt {attempt.id}")
+                    versions.bump_availability(attempt.start_slot.date)
 
                     # Баллы НЕ возвращаются
                     refund_message = "Бронь отменена. Баллы за выигранную бронь не возвращаются."
@@ -515,10 +617,12 @@ class BookingAttemptCancelAPIView(APIView):
                     updated_count = slots_to_update.update(
                         status=BookingSlotStatus.AVAILABLE, # Слот снова доступен
                         current_highest_attempt=None,    # Больше нет лидера
-                        auction_close_time=None         # Аукцион на нем прекращен (если не было других ставок)
                         # final_booking_attempt остается None
                     )
+                    # Аукцион, который вела эта заявка, прекращен
+                    Auction.objects.filter(leader=attempt, status=AuctionStatus.OPEN).update(status=AuctionStatus.CANCELLED)
                     print(f"Updated {updated_count} slots to AVAILABLE for cancelled BIDDING attempt {attempt.id}")
+                    versions.bump_availability(attempt.start_slot.date)
 
                     # Возврат баллов (только для индивидуальной ставки)
                     if attempt.funding_group is None:
@@ -566,13 +670,15 @@ class BookingAttemptCancelAPIView(APIView):
             return Response({"error": "Внутренняя ошибка сервера при отмене заявки."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 # --- Представление для истории бронирований ---
-class BookingHistoryAPIView(generics.ListAPIView):
+class BookingHistoryAPIView(rows.RowMapperListMixin, generics.ListAPIView):
     """
     Возвращает историю заявок на бронирование для текущего пользователя.
     Позволяет фильтровать по статусу заявки.
     """
     serializer_class = BookingAttemptDetailSerializer
     permission_classes = [IsAuthenticated]
+    replica_safe = True
+    row_mapper = rows.BookingAttemptRows()
 
     @extend_schema(
         summary="Получение истории бронирований пользователя",
@@ -598,7 +704,7 @@ class BookingHistoryAPIView(generics.ListAPIView):
     def get_queryset(self):
         try:
             # Получаем кастомного пользователя, связанного с request.user
-            user = User.objects.get(user_id=self.request.user.id) # Используйте правильный способ связи request.user с вашей моделью User
+            user = current_user(self.request)
         except User.DoesNotExist:
             # Если пользователь не найден, возвращаем пустой queryset или можно возбудить исключение
             # logger.warning(f"Пользователь Django с id {self.request.user.id} не найден в модели User.")
@@ -629,10 +735,11 @@ class BookingHistoryAPIView(generics.ListAPIView):
 
         return queryset
 
+    @versions.versioned(versions.user_history, versions.fixed(versions.ROOMS))
     def list(self, request, *args, **kwargs):
         # Небольшая кастомизация для обработки случая, когда User не найден до вызова get_queryset
         try:
-            User.objects.get(user_id=request.user.id)
+            current_user(request)
         except User.DoesNotExist:
              return Response({"error": "Связанный пользователь не найден."}, status=status.HTTP_404_NOT_FOUND)
         except AttributeError:
@@ -644,6 +751,9 @@ class BookingHistoryAPIView(generics.ListAPIView):
         if status_filter and status_filter not in BookingAttemptStatus.values:
             return Response({'status': f"Недопустимое значение статуса. Допустимые: {', '.join(BookingAttemptStatus.values)}."}, status=status.HTTP_400_BAD_REQUEST)
 
+        if rows.enabled(self):
+            return self.list_rows(queryset)
+
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -651,3 +761,47 @@ class BookingHistoryAPIView(generics.ListAPIView):
 
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
+
+
+# --- Представление для мониторинга отставания закрытия аукционов ---
+class AuctionBacklogAPIView(APIView):
+    """
+    Показывает текущий хвост просроченных аукционов (открытые Auction с прошедшим close_at).
+    Доступно только администраторам.
+    """
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(
+        summary="Отставание закрытия аукционов",
+        description="Количество просроченных аукционов, возраст самого старого и список самых старых аукционов. "
+                    "Флаг is_lagging выставляется, если самый старый аукцион просрочен больше AUCTION_CLOSER_LAG_ALERT_SECONDS.",
+        responses={
+            200: OpenApiResponse(response=AuctionBacklogSerializer, description='Состояние хвоста аукционов.'),
+            403: OpenApiResponse(description='Доступно только администраторам.'),
+        },
+        tags=['booking']
+    )
+    def get(self, request, *args, **kwargs):
+        now = timezone.now()
+        backlog = overdue_auction_backlog(now)
+        oldest_auctions = Auction.objects.filter(
+            status=AuctionStatus.OPEN,
+            close_at__lte=now,
+        ).select_related('room').order_by('close_at')[:50]
+
+        backlog['is_lagging'] = backlog['oldest_overdue_seconds'] > settings.AUCTION_CLOSER_LAG_ALERT_SECONDS
+        backlog['oldest_auctions'] = [
+            {
+                'auction_id': auction.id,
+                'room': auction.room.name,
+                'date': auction.date,
+                'start_slot_number': auction.start_slot_number,
+                'end_slot_number': auction.end_slot_number,
+                'close_at': auction.close_at,
+                'hard_deadline': auction.hard_deadline,
+                'leading_attempt_id': auction.leader_id,
+                'overdue_seconds': (now - auction.close_at).total_seconds(),
+            }
+            for auction in oldest_auctions
+        ]
+        return Response(AuctionBacklogSerializer(backlog).data)
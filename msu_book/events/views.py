@@ -9,22 +9,27 @@ from .serializers import EventSerializer, SubjectSerializer
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
-from main.models import User
+from my_auth.identity import current_user
+from main import versions, rows
+from msu_book.db_router import replica_safe
 class EventCreateView(generics.CreateAPIView):
     queryset = Event.objects.all()
     serializer_class = EventSerializer
     permission_classes = [IsAuthenticated]  # Example: Require authentication
     def perform_create(self, serializer):
-        serializer.save(initiator=User.objects.get(user_id=self.request.user.id))  # Set initiator to the logged-in user
+        serializer.save(initiator=current_user(self.request))  # Set initiator to the logged-in user
 
 
-class EventListView(generics.ListAPIView):
+@versions.versioned(versions.fixed(versions.EVENTS), name='list')  # ETag / 304 while no event changed
+class EventListView(rows.RowMapperListMixin, generics.ListAPIView):
     queryset = Event.objects.all()
     serializer_class = EventSerializer
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['date', 'room', 'initiator']  # Exact matches
     search_fields = ['subject', 'description']  # Partial matches
     ordering_fields = ['date', 'start_slot', 'end_slot'] #ordering
+    replica_safe = True  # Read-only: may be served by a read replica (msu_book.db_router)
+    row_mapper = rows.EventRows()  # values()-based fast path (main.rows)
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -33,6 +38,7 @@ class EventListView(generics.ListAPIView):
             queryset = queryset.filter(subject__icontains=subject) # case-insensitive contains
         return queryset
 
+@replica_safe
 @api_view(['GET'])
 def list_subjects(request):
     """
@@ -0,0 +1,9 @@
+from rest_framework.pagination import CursorPagination
+
+
+class GroupMemberCursorPagination(CursorPagination):
+    """ Cursor pagination for group rosters: stable pages without COUNT(*) over large groups. """
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = 'page_size'
+    ordering = 'id'
@@ -45,6 +45,19 @@ class BookingGroupSerializer(serializers.ModelSerializer):
         # Initiator is added to members automatically by model's save method
         return group
 
+class BookingGroupListSerializer(serializers.ModelSerializer):
+    """ Compact group representation for the list endpoint (no nested member list). """
+    initiator = GroupMemberSerializer(read_only=True)
+    # Annotated in BookingGroupViewSet.get_queryset, so no per-group queries
+    member_count = serializers.IntegerField(read_only=True)
+    current_balance = serializers.IntegerField(source='balance', read_only=True)
+    has_active_bid = serializers.BooleanField(read_only=True)
+
+    class Meta:
+        model = BookingGroup
+        fields = ['id', 'name', 'initiator', 'member_count', 'current_balance', 'has_active_bid', 'created_at']
+        read_only_fields = fields
+
 class AddContributionSerializer(serializers.Serializer):
     """ Сериализатор для валидации данных при добавлении вклада """
     amount = serializers.IntegerField(min_value=1) # Сумма для добавления
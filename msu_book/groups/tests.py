@@ -1,3 +1,99 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from main import rows
+from main.models import User, BookingGroup, GroupContribution
+from my_auth.identity import RequestUser
+
+
+def make_user(n):
+    return User.objects.create(user_id=n, email=f'u{n}@example.com', first_name=f'f{n}', second_name=f's{n}', booking_points=10)
+
+
+TEST_SETTINGS = dict(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    THROTTLE_ENABLED=False,
+)
+
+
+@override_settings(**TEST_SETTINGS)
+class GroupListTests(TestCase):
+
+    def setUp(self):
+        self.owner = make_user(1)
+        self.client = APIClient()
+        self.client.force_authenticate(RequestUser.for_profile(self.owner))
+
+    def make_group(self, name, size):
+        group = BookingGroup.objects.create(name=name, initiator=self.owner)
+        others = [make_user(100 * len(name) + i) for i in range(size - 1)]
+        group.members.add(*others)
+        for user in others:
+            GroupContribution.objects.create(group=group, user=user, amount=2)
+        return group
+
+    def list_groups(self):
+        response = self.client.get('/api/groups/')
+        self.assertEqual(response.status_code, 200)
+        return {group['name']: group for group in response.json()['results']}
+
+    def test_query_count_does_not_grow_with_group_size(self):
+        self.make_group('a', 1)
+        with self.assertNumQueries(2):  # COUNT for the page + one annotated SELECT
+            self.list_groups()
+
+        self.make_group('bb', 5)
+        self.make_group('ccc', 20)
+        with self.assertNumQueries(2):
+            groups = self.list_groups()
+
+        self.assertEqual(
+            {name: (group['member_count'], group['current_balance']) for name, group in groups.items()},
+            {'a': (1, 0), 'bb': (5, 8), 'ccc': (20, 38)},
+        )
+
+    def test_row_mapper_matches_serializer(self):
+        self.make_group('a', 3)
+        fast = self.list_groups()
+        with override_settings(FAST_ROW_MAPPERS=False):
+            self.assertEqual(self.list_groups(), fast)
+
+    def test_row_mapper_without_initiator(self):
+        row = rows.BookingGroupListRows().row({
+            'id': 1, 'name': 'a', 'initiator_id': None, 'initiator__email': None,
+            'initiator__first_name': None, 'initiator__second_name': None,
+            'member_count': 0, 'balance': 0, 'has_active_bid': False, 'created_at': None,
+        })
+        self.assertIsNone(row['initiator'])
+
+
+@override_settings(**TEST_SETTINGS)
+class GroupMembersTests(TestCase):
+
+    def setUp(self):
+        self.owner = make_user(1)
+        self.group = BookingGroup.objects.create(name='g', initiator=self.owner)
+        self.group.members.add(*[make_user(n) for n in range(2, 6)])
+        self.url = f'/api/groups/{self.group.id}/members/'
+        self.client = APIClient()
+
+    def test_roster_is_cursor_paginated(self):
+        self.client.force_authenticate(RequestUser.for_profile(self.owner))
+
+        seen, url = [], f'{self.url}?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            self.assertLessEqual(len(page['results']), 2)
+            seen.extend(member['id'] for member in page['results'])
+            url = page['next']
+
+        self.assertEqual(seen, sorted(self.group.members.values_list('id', flat=True)))
+
+    def test_roster_is_hidden_from_non_members(self):
+        self.client.force_authenticate(RequestUser.for_profile(make_user(99)))
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 404)
@@ -1,5 +1,7 @@
 from django.shortcuts import get_object_or_404
 from django.db import transaction, IntegrityError
+from django.db.models import Count, Exists, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.http import Http404
 from rest_framework import viewsets, status, permissions, serializers
 from rest_framework.decorators import action
@@ -7,9 +9,15 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from drf_spectacular.utils import extend_schema
 
+from main import versions, rows
+from msu_book.idempotency import idempotent
+from my_auth.identity import current_user
 from main.models import User, BookingGroup, GroupContribution, PointTransaction, BookingAttempt, BookingAttemptStatus
+from .pagination import GroupMemberCursorPagination
 from .serializers import (
     BookingGroupSerializer,
+    BookingGroupListSerializer,
+    GroupMemberSerializer,
     GroupContributionSerializer,
     AddContributionSerializer,
     WithdrawContributionSerializer,
@@ -27,7 +35,7 @@ class IsInitiatorOrReadOnly(permissions.BasePermission):
         if request.method in permissions.SAFE_METHODS:
             return True # Allow GET, HEAD, OPTIONS
         # Write permissions only allowed to the group initiator.
-        return obj.initiator == User.objects.get(user_id=request.user.id)
+        return obj.initiator == current_user(request)
 
 class IsGroupMember(permissions.BasePermission):
      """
@@ -42,8 +50,9 @@ class IsGroupMember(permissions.BasePermission):
              group = obj
          else: # Should not happen with nested routes, but good practice
              return False
-         
-         return User.objects.get(user_id=request.user.id) in group.members.all()
+
+         # Single EXISTS query instead of loading the whole member list
+         return group.members.filter(user_id=request.user.id).exists()
 
 class IsInitiator(permissions.BasePermission):
     """ Allows access only to the group initiator. """
@@ -51,12 +60,13 @@ class IsInitiator(permissions.BasePermission):
         # Ensure the object is a BookingGroup before accessing initiator
         if isinstance(obj, BookingGroup):
             # Compare initiator with the requesting user
-            return obj.initiator == User.objects.get(user_id=request.user.id)
+            return obj.initiator == current_user(request)
         return False # Or handle other object types if necessary
 
 # --- ViewSets ---
 
-class BookingGroupViewSet(viewsets.ModelViewSet):
+@versions.versioned(versions.user_groups, name='list')  # ETag / 304 until one of the user's groups changes
+class BookingGroupViewSet(rows.RowMapperListMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing Booking Groups.
     Includes actions for initiator to add/remove members,
@@ -64,6 +74,7 @@ class BookingGroupViewSet(viewsets.ModelViewSet):
     """
     serializer_class = BookingGroupSerializer
     permission_classes = [IsAuthenticated, IsInitiatorOrReadOnly]
+    row_mapper = rows.BookingGroupListRows()  # values()-based fast path for the list action (main.rows)
     http_method_names = ['get', 'post', 'delete', 'head', 'options']
 
     def get_queryset(self):
@@ -71,16 +82,47 @@ class BookingGroupViewSet(viewsets.ModelViewSet):
         Users can only see groups they are members of.
         (Reverted to previous version)
         """
-        user = self.request.user
-        # Re-added the lookup for the User instance based on request.user.id
-        # Ensure this lookup is correct based on your User model structure
-        user = User.objects.get(user_id=user.id)
+        user = current_user(self.request)
         # Reverted the check back to `if user:`
         if user:
             # Assuming 'booking_groups' is the correct related name
+            if self.action == 'list':
+                return self._annotate_summary(user.booking_groups.all())
+            if self.action == 'members':
+                # Roster is paginated separately, do not prefetch the whole member list
+                return user.booking_groups.all()
             return user.booking_groups.all().prefetch_related('members', 'initiator')
         return BookingGroup.objects.none()
 
+    @staticmethod
+    def _annotate_summary(queryset):
+        """
+        Adds member count, bank balance and active-bid flag as subqueries,
+        so the list stays a constant number of queries regardless of group size.
+        """
+        member_count = BookingGroup.members.through.objects.filter(
+            bookinggroup_id=OuterRef('pk')
+        ).order_by().values('bookinggroup_id').annotate(c=Count('*')).values('c')
+        balance = GroupContribution.objects.filter(
+            group=OuterRef('pk')
+        ).order_by().values('group').annotate(total=Sum('amount')).values('total')
+        active_bids = BookingAttempt.objects.filter(
+            funding_group=OuterRef('pk'),
+            status=BookingAttemptStatus.BIDDING,
+        )
+        return queryset.select_related('initiator').annotate(
+            member_count=Coalesce(Subquery(member_count, output_field=IntegerField()), Value(0)),
+            balance=Coalesce(Subquery(balance, output_field=IntegerField()), Value(0)),
+            has_active_bid=Exists(active_bids),
+        )
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return BookingGroupListSerializer
+        if self.action == 'members':
+            return GroupMemberSerializer
+        return BookingGroupSerializer
+
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context.update({"request": self.request})
@@ -88,6 +130,16 @@ class BookingGroupViewSet(viewsets.ModelViewSet):
 
     # --- Member Management Actions ---
 
+    @extend_schema(responses={200: GroupMemberSerializer(many=True)})
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated, IsGroupMember],
+            url_path='members', pagination_class=GroupMemberCursorPagination)
+    def members(self, request, pk=None):
+        """ Cursor-paginated full roster of the group (members only). """
+        group = self.get_object()
+        page = self.paginate_queryset(group.members.all().only('id', 'email', 'first_name', 'second_name'))
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
     @extend_schema(
         request=MemberActionSerializer,
         responses={200: serializers.Serializer}
@@ -207,9 +259,8 @@ class BookingGroupViewSet(viewsets.ModelViewSet):
         group = self.get_object() # Get the BookingGroup instance
 
         try:
-            # Explicitly get the User instance corresponding to the request user
-            # Assuming 'user_id' is the field linking auth user to your User model
-            user_leaving = User.objects.get(user_id=request.user.id)
+            # main.User of the request user (resolved once per request by authentication)
+            user_leaving = current_user(request)
         except User.DoesNotExist:
             # Should not happen if IsAuthenticated worked, but good practice
             return Response({"detail": "Не удалось найти данные пользователя."}, status=status.HTTP_404_NOT_FOUND)
@@ -321,11 +372,12 @@ class GroupContributionViewSet(viewsets.GenericViewSet): # Use GenericViewSet fo
     def my_contribution(self, request, group_pk=None):
         """ Get the current user's contribution to the group """
         group = self.get_group()
-        contribution = get_object_or_404(GroupContribution, group=group, user=User.objects.get(user_id=request.user.id))
+        contribution = get_object_or_404(GroupContribution, group=group, user=current_user(request))
         serializer = self.get_serializer(contribution)
         return Response(serializer.data)
 
     @action(detail=False, methods=['post'], url_path='add')
+    @idempotent # Retried contributions replay the first response instead of moving points twice
     def add_contribution(self, request, group_pk=None):
         """ Add points from user's balance to the group """
         group = self.get_group()
@@ -334,7 +386,7 @@ class GroupContributionViewSet(viewsets.GenericViewSet): # Use GenericViewSet fo
         serializer = AddContributionSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         amount_to_add = serializer.validated_data['amount']
-        user = User.objects.get(user_id=request.user.id)
+        user = current_user(request)
 
         try:
             with transaction.atomic():
@@ -390,7 +442,7 @@ class GroupContributionViewSet(viewsets.GenericViewSet): # Use GenericViewSet fo
         serializer = WithdrawContributionSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         amount_to_withdraw = serializer.validated_data['amount']
-        user = User.objects.get(user_id=request.user.id)
+        user = current_user(request)
 
         try:
             with transaction.atomic():
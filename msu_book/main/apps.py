@@ -1,8 +1,21 @@
-from django.apps import AppConfig
+from django.apps import AppConfig, apps
+from django.db.models.signals import pre_migrate
+
+
+def create_btree_gist(using, **kwargs):
+    """ Ограничению исключения заявок (room WITH =) нужно расширение btree_gist. """
+    from django.db import connections
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
 
 
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
     def ready(self):
-        import main.schema
\ No newline at end of file
+        if apps.is_installed('drf_spectacular'): # В облегченном реестре (воркеры, команды) схема API не нужна
+            import main.schema
+        import main.versions # Сигналы версий ресурсов для ETag
+        pre_migrate.connect(create_btree_gist, sender=self)
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, transaction
+from django.db.models import OuterRef, Subquery
+
+from main.models import BookingAttempt, BookingSlot
+
+
+class Command(BaseCommand):
+    help = ('Заполняет date/start_slot_number/end_slot_number у старых заявок по их слотам. Пока поля пустые, '
+            'ограничение booking_attempts_no_overlap не видит такие заявки. Запускать после обновления схемы')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать заявки без диапазона.')
+
+    def handle(self, *args, **options):
+        pending = BookingAttempt.objects.filter(date__isnull=True)
+        if options['dry_run']:
+            self.stdout.write(f"Заявок без диапазона: {pending.count()}.")
+            return
+
+        batch_size = options['batch_size']
+        updated, conflicts, last_id = 0, [], 0
+        while True:
+            ids = list(pending.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            last_id = ids[-1]
+            try:
+                with transaction.atomic():
+                    updated += self.fill(BookingAttempt.objects.filter(id__in=ids))
+            except IntegrityError:
+                # В пачке есть активные заявки, пересекающиеся с другими: заполняем по одной и показываем конфликты
+                for attempt_id in ids:
+                    try:
+                        with transaction.atomic():
+                            updated += self.fill(BookingAttempt.objects.filter(id=attempt_id))
+                    except IntegrityError:
+                        conflicts.append(attempt_id)
+
+        self.stdout.write(self.style.SUCCESS(f"Заполнен диапазон у {updated} заявок."))
+        if conflicts:
+            self.stdout.write(self.style.WARNING(
+                f"Пересекаются с другими активными заявками (диапазон не заполнен, нужно разобрать вручную): {conflicts[:50]}"
+            ))
+
+    @staticmethod
+    def fill(queryset):
+        def slot_field(fk, field):
+            return Subquery(BookingSlot.objects.filter(pk=OuterRef(fk)).values(field)[:1])
+
+        return queryset.update(
+            date=slot_field('start_slot_id', 'date'),
+            start_slot_number=slot_field('start_slot_id', 'slot_number'),
+            end_slot_number=slot_field('end_slot_id', 'slot_number'),
+        )
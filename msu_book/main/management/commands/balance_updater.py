@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from main.models import User, GroupContribution, BookingAttempt, BookingAttemptStatus
 from django.utils import timezone
+from booking.retention import archive_attempts
 
 
 class Command(BaseCommand):
@@ -25,6 +26,5 @@ class Command(BaseCommand):
             balance += 4
             balance = min(balance, 28)
             obj.save()  # Сохраняем изменения в базе данных
-        bookings = BookingAttempt.objects.filter(status=BookingAttemptStatus.LOST)
-        for booking in bookings:
-            booking.delete()
\ No newline at end of file
+        # Проигранные заявки не удаляем, а переносим в архив, чтобы сохранить историю
+        archive_attempts(BookingAttempt.objects.filter(status=BookingAttemptStatus.LOST))
\ No newline at end of file
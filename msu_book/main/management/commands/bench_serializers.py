@@ -0,0 +1,90 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from main import rows
+from main.models import Room, BookingAttempt, BookingGroup, Event
+from msu_book.renderers import ORJSONRenderer
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает сериализаторы DRF + JSONRenderer с мапперами строк (main.rows) + ORJSONRenderer '
+            'на данных из БД: проверяет, что ответы совпадают побайтно, и измеряет время')
+
+    RESOURCES = ('rooms', 'attempts', 'events', 'groups')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--resource', choices=self.RESOURCES, help='Только один ресурс (по умолчанию - все).')
+        parser.add_argument('--limit', type=int, default=5000, help='Максимум строк на ресурс.')
+        parser.add_argument('--repeat', type=int, default=5, help='Количество прогонов (берется лучший).')
+
+    def handle(self, *args, **options):
+        mismatched = []
+        for resource in [options['resource']] if options['resource'] else self.RESOURCES:
+            queryset, serialize, mapper = getattr(self, f'case_{resource}')(options['limit'])
+            slow = lambda: JSONRenderer().render(serialize(queryset))
+            fast = lambda: ORJSONRenderer().render(mapper.many(mapper.select(queryset)))
+            slow_time, slow_body = self.measure(slow, options['repeat'])
+            fast_time, fast_body = self.measure(fast, options['repeat'])
+            same = slow_body == fast_body
+            if not same:
+                mismatched.append(resource)
+            self.stdout.write(
+                f"{resource}: строк {queryset.count()}, сериализатор {slow_time * 1000:.1f} мс, "
+                f"маппер {fast_time * 1000:.1f} мс (x{slow_time / max(fast_time, 1e-9):.1f}), "
+                f"{'ответы совпадают' if same else 'ОТВЕТЫ РАЗЛИЧАЮТСЯ'}"
+            )
+        if mismatched:
+            raise CommandError(f"Вывод маппера отличается от сериализатора: {', '.join(mismatched)}.")
+
+    @staticmethod
+    def measure(render, repeat):
+        best, body = None, None
+        for _ in range(max(repeat, 1)):
+            started = time.perf_counter()
+            body = render()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, body
+
+    @staticmethod
+    def case_rooms(limit):
+        from booking.serializers import RoomAvailabilitySerializer
+        queryset = Room.objects.order_by('id')[:limit]
+        mapper = rows.RoomAvailabilityRows()
+
+        class Mapper(rows.RowMapper):
+            # Статус диапазона в сравнении не участвует - у обоих путей одинаковый
+            fields = mapper.fields
+            row = staticmethod(lambda values: mapper.row(values, 'AVAILABLE'))
+
+        def serialize(rooms):
+            # Как FindRoomsForBookingAPIView: словари со связанными методами get_FOO_display
+            return RoomAvailabilitySerializer([{
+                'id': room.id, 'name': room.name, 'capacity': room.capacity,
+                'get_room_type_display': room.get_room_type_display,
+                'get_building_display': room.get_building_display,
+                'get_floor_display': room.get_floor_display,
+                'features': room.features, 'range_status': 'AVAILABLE',
+            } for room in rooms], many=True).data
+        return queryset, serialize, Mapper()
+
+    @staticmethod
+    def case_attempts(limit):
+        from booking.serializers import BookingAttemptDetailSerializer
+        queryset = BookingAttempt.objects.select_related('room', 'start_slot', 'end_slot', 'funding_group').order_by('-created_at', 'id')[:limit]
+        return queryset, lambda attempts: BookingAttemptDetailSerializer(attempts, many=True).data, rows.BookingAttemptRows()
+
+    @staticmethod
+    def case_events(limit):
+        from events.serializers import EventSerializer
+        queryset = Event.objects.order_by('id')[:limit]
+        return queryset, lambda events: EventSerializer(events, many=True).data, rows.EventRows()
+
+    @staticmethod
+    def case_groups(limit):
+        from groups.serializers import BookingGroupListSerializer
+        from groups.views import BookingGroupViewSet
+        queryset = BookingGroupViewSet._annotate_summary(BookingGroup.objects.all()).order_by('id')[:limit]
+        return queryset, lambda groups: BookingGroupListSerializer(groups, many=True).data, rows.BookingGroupListRows()
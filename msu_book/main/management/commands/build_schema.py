@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from msu_book import openapi
+
+
+class Command(BaseCommand):
+    help = ('Собирает схему OpenAPI (YAML, JSON и их gzip-копии) в OPENAPI_SCHEMA_DIR для текущей версии кода. '
+            'Запускать при сборке/деплое; без нее схема собирается при первом запросе каждой новой версии')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help='Каталог для файлов схемы (по умолчанию - OPENAPI_SCHEMA_DIR).')
+        parser.add_argument('--force', action='store_true', help='Пересобрать, даже если схема для этой версии кода уже есть.')
+        parser.add_argument('--check', action='store_true',
+                            help='Только проверить, что собранная схема соответствует текущей версии кода (код выхода 1, если нет).')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            if openapi.is_current(options['dir']):
+                self.stdout.write(f"Схема актуальна (версия кода {openapi.code_version()}).")
+                return
+            self.stderr.write(f"Схема не собрана или устарела (версия кода {openapi.code_version()}).")
+            raise SystemExit(1)
+        if openapi.is_current(options['dir']) and not options['force']:
+            self.stdout.write(f"Схема для версии кода {openapi.code_version()} уже собрана - пропускаем.")
+            return
+        directory = openapi.write(openapi.generate(), options['dir'])
+        self.stdout.write(self.style.SUCCESS(f"Схема OpenAPI для версии кода {openapi.code_version()} записана в {directory}."))
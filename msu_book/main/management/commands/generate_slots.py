@@ -0,0 +1,49 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from main.models import Room, BookingSlot, BookingSlotStatus, TIME_SLOTS_DETAILS, slot_bounds
+
+
+class Command(BaseCommand):
+    help = 'Создаем слоты бронирования (со starts_at/ends_at) для активных аудиторий на N дней вперед'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.SLOT_GENERATION_DAYS_AHEAD, help='Количество дней вперед, включая сегодня.')
+        parser.add_argument('--backfill', action='store_true', help='Заполнить starts_at/ends_at у существующих слотов, где они пустые.')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if options['backfill']:
+            self.stdout.write(f"Заполнено время у {self.backfill(batch_size)} слотов.")
+
+        today = timezone.localdate()
+        dates = [today + datetime.timedelta(days=d) for d in range(options['days'])]
+        room_ids = list(Room.objects.filter(is_active=True).values_list('id', flat=True))
+
+        slots = []
+        for date in dates:
+            bounds = {n: slot_bounds(date, n) for n in TIME_SLOTS_DETAILS}
+            for room_id in room_ids:
+                for slot_number, (starts_at, ends_at) in bounds.items():
+                    slots.append(BookingSlot(
+                        room_id=room_id, date=date, slot_number=slot_number,
+                        status=BookingSlotStatus.AVAILABLE, starts_at=starts_at, ends_at=ends_at,
+                    ))
+        # Уже существующие слоты (room, date, slot_number) пропускаются
+        BookingSlot.objects.bulk_create(slots, batch_size=batch_size, ignore_conflicts=True)
+        self.stdout.write(f"Проверено {len(slots)} слотов для {len(room_ids)} аудиторий на {len(dates)} дней.")
+
+    @staticmethod
+    def backfill(batch_size):
+        updated = 0
+        while True:
+            batch = list(BookingSlot.objects.filter(starts_at__isnull=True).only('id', 'date', 'slot_number')[:batch_size])
+            if not batch:
+                return updated
+            for slot in batch:
+                slot.fill_times()
+            BookingSlot.objects.bulk_update(batch, ['starts_at', 'ends_at'])
+            updated += len(batch)
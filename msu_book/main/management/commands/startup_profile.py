@@ -0,0 +1,126 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+# Запускается в отдельном интерпретаторе с -X importtime: старт процесса указанной роли
+# (настройки, реестр приложений и то, что процесс грузит до первого запроса/задачи)
+PROBE = '''
+import json, resource, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+role, command = sys.argv[1], sys.argv[2]
+if role == 'web':
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.urls import get_resolver
+    from rest_framework.settings import api_settings
+    WSGIHandler()
+    get_resolver().url_patterns
+    api_settings.DEFAULT_AUTHENTICATION_CLASSES
+elif role == 'worker':
+    from booking.celery import app
+    app.loader.import_default_modules()
+else:
+    from django.core.management import get_commands, load_command_class
+    load_command_class(get_commands()[command], command)
+elapsed = time.perf_counter() - started
+print(json.dumps({
+    'seconds': elapsed,
+    'rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'modules': len(sys.modules),
+    'apps': len(__import__('django.apps', fromlist=['apps']).apps.get_app_configs()),
+}))
+'''
+
+
+def parse_importtime(stderr):
+    """ Строки 'import time: self | cumulative | module' -> список (глубина, модуль, self_us, cumulative_us). """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((depth, name.strip(), int(own), int(cumulative)))
+    return entries
+
+
+class Command(BaseCommand):
+    help = ('Профиль старта процесса: время импорта по модулям (python -X importtime), '
+            'время до готовности, RSS и число модулей для ролей web, worker и command')
+
+    ROLES = ('web', 'worker', 'command')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--role', choices=self.ROLES + ('all',), default='all',
+                            help='Роль процесса (PROCESS_ROLE) для замера; all - сводка по всем ролям.')
+        parser.add_argument('--command', default='balance_updater',
+                            help='Команда, чей старт меряется для роли command.')
+        parser.add_argument('--top', type=int, default=25, help='Сколько самых медленных модулей показать.')
+        parser.add_argument('--repeat', type=int, default=3, help='Количество запусков (берется лучший).')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON.')
+
+    def handle(self, *args, **options):
+        roles = self.ROLES if options['role'] == 'all' else (options['role'],)
+        results = {role: self.profile(role, options['command'], options['repeat']) for role in roles}
+
+        if options['json']:
+            self.stdout.write(json.dumps({
+                role: {**result['summary'], 'top_cumulative': result['top_cumulative'][:options['top']],
+                       'top_packages': result['top_packages'][:options['top']]}
+                for role, result in results.items()
+            }, ensure_ascii=False, indent=2))
+            return
+
+        for role, result in results.items():
+            summary = result['summary']
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{role}: старт {summary['seconds'] * 1000:.0f} мс, RSS {summary['rss_kb'] / 1024:.1f} МБ, "
+                f"модулей {summary['modules']}, приложений {summary['apps']}, импорт {summary['import_us'] / 1000:.0f} мс"
+            ))
+            if len(roles) > 1:
+                continue
+            self.stdout.write('  Модули верхнего уровня (кумулятивно, мс):')
+            for name, cumulative in result['top_cumulative'][:options['top']]:
+                self.stdout.write(f'    {cumulative / 1000:8.1f}  {name}')
+            self.stdout.write('  Пакеты (собственное время всех модулей, мс):')
+            for name, own in result['top_packages'][:options['top']]:
+                self.stdout.write(f'    {own / 1000:8.1f}  {name}')
+
+    def profile(self, role, command, repeat):
+        env = {
+            **os.environ,
+            'PROCESS_ROLE': role,
+            # Дочерний интерпретатор должен видеть те же пути, что и manage.py (каталог проекта)
+            'PYTHONPATH': os.pathsep.join(path for path in sys.path if path),
+        }
+        best = None
+        for _ in range(max(repeat, 1)):
+            completed = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c', PROBE, role, command],
+                env=env, capture_output=True, text=True,
+            )
+            if completed.returncode != 0:
+                raise CommandError(f"Процесс роли {role} не запустился:\n{completed.stderr[-2000:]}")
+            summary = json.loads(completed.stdout.strip().splitlines()[-1])
+            if best is None or summary['seconds'] < best[0]['seconds']:
+                best = (summary, completed.stderr)
+
+        summary, stderr = best
+        entries = parse_importtime(stderr)
+        summary['import_us'] = sum(own for _, _, own, _ in entries)
+        packages = defaultdict(int)
+        for _, name, own, _ in entries:
+            packages[name.split('.', 1)[0]] += own
+        return {
+            'summary': summary,
+            'top_cumulative': sorted(
+                ((name, cumulative) for depth, name, _, cumulative in entries if depth == 0),
+                key=lambda item: -item[1],
+            ),
+            'top_packages': sorted(packages.items(), key=lambda item: -item[1]),
+        }
@@ -1,5 +1,9 @@
 from django.db import models
+from django.db.models import Func, Q
 from django.core.exceptions import ValidationError
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.fields import IntegerRangeField, RangeOperators
+from django.utils import timezone
 import datetime
 
 
@@ -149,6 +153,16 @@ TIME_SLOTS_DETAILS = {
 }
 
 
+def slot_bounds(date, slot_number):
+    """ Абсолютные (с таймзоной) время начала и конца слота; TIME_SLOTS_DETAILS заданы в текущей таймзоне. """
+    details = TIME_SLOTS_DETAILS[slot_number]
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.datetime.combine(date, details['start']), tz),
+        timezone.make_aware(datetime.datetime.combine(date, details['end']), tz),
+    )
+
+
 class BookingSlotStatus(models.TextChoices):
     AVAILABLE = 'available', 'Доступен'     # Свободен, можно инициировать аукцион или мгновенно забронировать
     IN_AUCTION = 'in_auction', 'В аукционе' # Идет аукцион, можно делать ставки
@@ -172,8 +186,11 @@ class BookingSlot(models.Model):
         db_index=True
     ) # Текущее состояние слота
 
-    # --- Поля для аукциона ---
-    auction_close_time = models.DateTimeField(null=True, blank=True, db_index=True) # Расчетное время окончания аукциона (с учетом овертайма)
+    # Абсолютное время начала/конца слота (заполняется при создании), чтобы время можно было фильтровать в SQL
+    starts_at = models.DateTimeField(null=True, blank=True)
+    ends_at = models.DateTimeField(null=True, blank=True)
+
+    # --- Поля для аукциона (время закрытия и овертайм хранятся в Auction) ---
     current_highest_attempt = models.ForeignKey(
         'BookingAttempt',                     # Ссылка на ТЕКУЩУЮ лидирующую заявку
         on_delete=models.SET_NULL,            # Не удаляем слот, если заявка удалена, просто очищаем ссылку
@@ -195,8 +212,8 @@ class BookingSlot(models.Model):
         indexes = [
             models.Index(fields=['room', 'date', 'slot_number']),
             models.Index(fields=['status']),
+            models.Index(fields=['status', 'starts_at']), # Мгновенная бронь "в ближайший час", архивирование прошедших
             models.Index(fields=['date']),
-            models.Index(fields=['auction_close_time']),
             models.Index(fields=['current_highest_attempt']), # Индекс по лидирующей заявке
             models.Index(fields=['final_booking_attempt']),   # Индекс по выигравшей заявке
         ]
@@ -215,21 +232,30 @@ class BookingSlot(models.Model):
 
     @property
     def start_datetime(self):
-        start_t = self.start_time
-        if self.date and start_t:
-            # Используйте timezone.make_aware если таймзоны включены в settings.py
-            # return timezone.make_aware(datetime.datetime.combine(self.date, start_t))
-            return datetime.datetime.combine(self.date, start_t)
+        if self.starts_at:
+            return timezone.localtime(self.starts_at)
+        if self.date and self.slot_number in TIME_SLOTS_DETAILS:
+            return slot_bounds(self.date, self.slot_number)[0]
         return None
 
     @property
     def end_datetime(self):
-        end_t = self.end_time
-        if self.date and end_t:
-            # return timezone.make_aware(datetime.datetime.combine(self.date, end_t))
-             return datetime.datetime.combine(self.date, end_t)
+        if self.ends_at:
+            return timezone.localtime(self.ends_at)
+        if self.date and self.slot_number in TIME_SLOTS_DETAILS:
+            return slot_bounds(self.date, self.slot_number)[1]
         return None
 
+    def fill_times(self):
+        """ Заполняет starts_at/ends_at по date и slot_number (нужно перед bulk_create, который не вызывает save). """
+        self.starts_at, self.ends_at = slot_bounds(self.date, self.slot_number)
+        return self
+
+    def save(self, *args, **kwargs):
+        if self.starts_at is None and self.date and self.slot_number in TIME_SLOTS_DETAILS:
+            self.fill_times()
+        super().save(*args, **kwargs)
+
     def __str__(self):
         start_time_str = self.start_time.strftime('%H:%M') if self.start_time else '??:??'
         end_time_str = self.end_time.strftime('%H:%M') if self.end_time else '??:??'
@@ -292,14 +318,31 @@ class BookingAttemptStatus(models.TextChoices):
     INSTANT_BOOKED = 'instant_booked', 'Мгновенная бронь' # Заявка на успешную мгновенную бронь
 
 
+class SlotRange(Func):
+    """ int4range(start, end, '[]') - диапазон номеров слотов для ограничения исключения. """
+    function = 'INT4RANGE'
+    template = "%(function)s(%(expressions)s, '[]')"
+    output_field = IntegerRangeField()
+
+
+# Заявки, которые занимают слоты: лидер аукциона, победитель, мгновенная бронь
+ACTIVE_ATTEMPT_STATUSES = [BookingAttemptStatus.BIDDING, BookingAttemptStatus.WON, BookingAttemptStatus.INSTANT_BOOKED]
+
+
 class BookingAttempt(models.Model):
     """ Представляет одну заявку (попытку) на бронирование диапазона слотов, индивидуальную или групповую. """
     initiator = models.ForeignKey(User, on_delete=models.CASCADE, related_name='initiated_attempts') # Пользователь, сделавший ставку (админ группы для групповой)
     room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='booking_attempts')
     start_slot = models.ForeignKey(BookingSlot, on_delete=models.CASCADE, related_name='+') # Первый слот в диапазоне
     end_slot = models.ForeignKey(BookingSlot, on_delete=models.CASCADE, related_name='+')   # Последний слот в диапазоне
+    # Денормализованный диапазон (дата и номера слотов) - по нему работает ограничение исключения
+    date = models.DateField(null=True, blank=True)
+    start_slot_number = models.IntegerField(choices=TimeSlotNumberChoices.choices, null=True, blank=True)
+    end_slot_number = models.IntegerField(choices=TimeSlotNumberChoices.choices, null=True, blank=True)
 
     total_bid = models.IntegerField() # ОБЩАЯ ставка баллов за ВЕСЬ диапазон слотов.
+    # Максимум автоставки: при перебитии на тот же диапазон ставка сама поднимается до него (только индивидуальные)
+    max_bid = models.IntegerField(null=True, blank=True)
 
     # --- Финансирование ---
     funding_group = models.ForeignKey(
@@ -330,6 +373,18 @@ class BookingAttempt(models.Model):
             models.Index(fields=['start_slot']),
             models.Index(fields=['end_slot']),
         ]
+        constraints = [
+            # Активные заявки одной аудитории на одну дату не пересекаются по слотам (нужно расширение btree_gist)
+            ExclusionConstraint(
+                name='booking_attempts_no_overlap',
+                expressions=[
+                    ('room', RangeOperators.EQUAL),
+                    ('date', RangeOperators.EQUAL),
+                    (SlotRange('start_slot_number', 'end_slot_number'), RangeOperators.OVERLAPS),
+                ],
+                condition=Q(status__in=ACTIVE_ATTEMPT_STATUSES),
+            ),
+        ]
         db_table = 'booking_attempts'
         verbose_name = 'Заявка на бронирование'
         verbose_name_plural = 'Заявки на бронирование'
@@ -366,6 +421,17 @@ class BookingAttempt(models.Model):
         # if self.funding_group and self.total_bid != self.funding_group.current_balance:
         #     raise ValidationError('Групповая ставка должна быть равна текущему балансу группы.')
 
+    def fill_range(self):
+        """ Заполняет date/start_slot_number/end_slot_number по слотам (нужно перед bulk_create, который не вызывает save). """
+        self.date = self.start_slot.date
+        self.start_slot_number = self.start_slot.slot_number
+        self.end_slot_number = self.end_slot.slot_number
+        return self
+
+    def save(self, *args, **kwargs):
+        if self.start_slot_number is None and self.start_slot_id and self.end_slot_id:
+            self.fill_range()
+        super().save(*args, **kwargs)
 
     def __str__(self):
         funding_source = f"Группа: {self.funding_group.name or self.funding_group.id}" if self.funding_group else f"Лично: {self.initiator.email}"
@@ -377,6 +443,122 @@ class BookingAttempt(models.Model):
         return f"Заявка {self.id} ({funding_source}) - {self.get_status_display()}"
 
 
+class AuctionStatus(models.TextChoices):
+    OPEN = 'open', 'Идет'                   # Принимаются ставки, ждет закрытия
+    SETTLED = 'settled', 'Завершен'         # Закрыт, слоты отданы лидеру
+    MERGED = 'merged', 'Поглощен'           # Перебит более длинным диапазоном, состояние перенесено в другой аукцион
+    CANCELLED = 'cancelled', 'Отменен'      # Лидер отменил ставку, слоты освобождены
+
+
+class Auction(models.Model):
+    """
+    Аукцион за один непрерывный диапазон слотов аудитории на дату.
+    Одна строка на оспариваемый диапазон: ставка обновляет лидера и сумму в этой строке,
+    закрыватель выбирает открытые аукционы по close_at через частичный индекс.
+    """
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='auctions')
+    date = models.DateField()
+    start_slot_number = models.IntegerField(choices=TimeSlotNumberChoices.choices)
+    end_slot_number = models.IntegerField(choices=TimeSlotNumberChoices.choices)
+
+    leader = models.ForeignKey(
+        BookingAttempt,
+        on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='led_auctions'
+    ) # Текущая лидирующая заявка
+    amount = models.IntegerField(default=0) # Текущая лидирующая ставка
+    max_amount = models.IntegerField(null=True, blank=True) # Максимум автоставки лидера (копия BookingAttempt.max_bid)
+    last_bid_at = models.DateTimeField() # Время последней принятой ставки (для овертайма)
+    close_at = models.DateTimeField() # Плановое закрытие с учетом овертайма
+    hard_deadline = models.DateTimeField() # Жесткий дедлайн: за 20 минут до начала первого слота
+
+    status = models.CharField(max_length=20, choices=AuctionStatus.choices, default=AuctionStatus.OPEN)
+    created_at = models.DateTimeField(auto_now_add=True)
+    settled_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['close_at']
+        indexes = [
+            # Закрыватель: открытые аукционы с наступившим close_at - один range scan по частичному индексу
+            models.Index(fields=['close_at'], name='auctions_open_close_at_idx', condition=models.Q(status='open')),
+            models.Index(fields=['room', 'date']),
+            models.Index(fields=['leader']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['room', 'date', 'start_slot_number', 'end_slot_number'],
+                condition=models.Q(status='open'),
+                name='auctions_one_open_per_range',
+            ),
+        ]
+        db_table = 'auctions'
+        verbose_name = 'Аукцион'
+        verbose_name_plural = 'Аукционы'
+
+    @property
+    def number_of_slots(self):
+        return self.end_slot_number - self.start_slot_number + 1
+
+    def __str__(self):
+        return f"Аукцион {self.id} на {self.room.name} ({self.date}, слоты {self.start_slot_number}-{self.end_slot_number}) - {self.get_status_display()}"
+
+
+class ArchivedBookingAttempt(models.Model):
+    """
+    Архивная копия заявки, вынесенной из горячей таблицы booking_attempts задачей хранения.
+    Ссылки на слоты заменены номерами слотов и датой, т.к. прошедшие слоты тоже архивируются.
+    """
+    original_id = models.BigIntegerField(unique=True) # id исходной BookingAttempt
+    initiator = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='archived_attempts')
+    room = models.ForeignKey(Room, on_delete=models.SET_NULL, null=True, blank=True, related_name='archived_attempts')
+    date = models.DateField()
+    start_slot_number = models.IntegerField(choices=TimeSlotNumberChoices.choices)
+    end_slot_number = models.IntegerField(choices=TimeSlotNumberChoices.choices)
+    total_bid = models.IntegerField()
+    funding_group = models.ForeignKey(BookingGroup, on_delete=models.SET_NULL, null=True, blank=True, related_name='archived_attempts')
+    status = models.CharField(max_length=20, choices=BookingAttemptStatus.choices)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    booking_date = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['initiator', 'created_at']),
+            models.Index(fields=['room', 'date']),
+        ]
+        db_table = 'booking_attempts_archive'
+        verbose_name = 'Архивная заявка'
+        verbose_name_plural = 'Архивные заявки'
+
+    def __str__(self):
+        return f"Архивная заявка {self.original_id} ({self.date}, слоты {self.start_slot_number}-{self.end_slot_number}) - {self.get_status_display()}"
+
+
+class RoomDaySummary(models.Model):
+    """ Сводка по прошедшему дню аудитории, заменяющая 14 архивированных строк BookingSlot. """
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='day_summaries')
+    date = models.DateField()
+    booked_mask = models.IntegerField(default=0) # Бит i - слот i+1 был забронирован
+    booked_slots = models.IntegerField(default=0)
+    unavailable_slots = models.IntegerField(default=0)
+    won_attempts = models.IntegerField(default=0) # Выигранные аукционы
+    instant_attempts = models.IntegerField(default=0) # Мгновенные брони
+    points_spent = models.IntegerField(default=0) # Сумма ставок выигравших/мгновенных заявок
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['date', 'room']
+        unique_together = ('room', 'date')
+        db_table = 'room_day_summaries'
+        verbose_name = 'Сводка дня аудитории'
+        verbose_name_plural = 'Сводки дней аудиторий'
+
+    def __str__(self):
+        return f"{self.room.name} {self.date}: забронировано {self.booked_slots} слотов"
+
+
 class PointTransaction(models.Model):
     """ Журнал всех операций с ЛИЧНЫМИ баллами бронирования пользователей (User.booking_points). """
     user = models.ForeignKey(User, on_delete=models.PROTECT, related_name='point_transactions') # Пользователь, чей баланс меняется
@@ -0,0 +1,177 @@
+"""
+Быстрая сериализация списков для частых GET-запросов.
+
+Мапперы строк читают только нужные колонки через values() (без создания моделей
+и без запросов на связанные объекты) и собирают словари ответа напрямую, без
+полей DRF. Подписи choices берутся из заранее построенных таблиц, а не через
+get_FOO_display на каждую строку. Вывод совпадает с соответствующими сериализаторами
+(проверяется командой bench_serializers); представление включает маппер атрибутом
+row_mapper, глобально мапперы отключаются FAST_ROW_MAPPERS = False.
+"""
+from django.conf import settings
+from rest_framework import serializers
+from rest_framework.response import Response
+
+from .models import (
+    RoomType, BuildingChoices, FloorChoices, BookingSlotStatus, BookingAttemptStatus,
+    TIME_SLOTS_DETAILS,
+)
+
+ROOM_TYPE_LABELS = dict(RoomType.choices)
+BUILDING_LABELS = dict(BuildingChoices.choices)
+FLOOR_LABELS = dict(FloorChoices.choices)
+SLOT_STATUS_LABELS = dict(BookingSlotStatus.choices)
+ATTEMPT_STATUS_LABELS = dict(BookingAttemptStatus.choices)
+SLOT_TIMES = {
+    number: (details['start'].strftime('%H:%M'), details['end'].strftime('%H:%M'))
+    for number, details in TIME_SLOTS_DETAILS.items()
+}
+
+# Тот же формат дат, что у полей сериализаторов (DATETIME_FORMAT, часовой пояс, 'Z')
+_datetime_field = serializers.DateTimeField()
+
+
+def _label(labels, value):
+    """ Как get_FOO_display + CharField: подпись, иначе само значение строкой (None остается None). """
+    if value is None:
+        return None
+    return labels.get(value, str(value))
+
+
+def _datetime(value):
+    return None if value is None else _datetime_field.to_representation(value)
+
+
+def enabled(view):
+    """ Включен ли быстрый путь для представления. """
+    return settings.FAST_ROW_MAPPERS and getattr(view, 'row_mapper', None) is not None
+
+
+class RowMapper:
+    """ fields - колонки для values(); row() превращает строку values() в словарь ответа. """
+    fields = ()
+
+    def select(self, queryset):
+        return queryset.values(*self.fields)
+
+    def row(self, values):
+        raise NotImplementedError
+
+    def many(self, rows):
+        row = self.row
+        return [row(values) for values in rows]
+
+
+class RowMapperListMixin:
+    """ list() для ListModelMixin: при включенном маппере - values() и row_mapper вместо сериализатора. """
+    row_mapper = None
+
+    def list(self, request, *args, **kwargs):
+        if not enabled(self):
+            return super().list(request, *args, **kwargs)
+        return self.list_rows(self.filter_queryset(self.get_queryset()))
+
+    def list_rows(self, queryset):
+        queryset = self.row_mapper.select(queryset)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.row_mapper.many(page))
+        return Response(self.row_mapper.many(queryset))
+
+
+class RoomAvailabilityRows(RowMapper):
+    """ Как RoomAvailabilitySerializer; range_status вычисляет представление поиска. """
+    fields = ('id', 'name', 'capacity', 'room_type', 'building', 'floor', 'features', 'is_active')
+
+    def row(self, values, range_status=None):
+        return {
+            'id': values['id'],
+            'name': values['name'],
+            'capacity': values['capacity'],
+            'room_type': _label(ROOM_TYPE_LABELS, values['room_type']),
+            'building': _label(BUILDING_LABELS, values['building']),
+            'floor': _label(FLOOR_LABELS, values['floor']),
+            'features': values['features'],
+            'range_status': range_status,
+        }
+
+
+class BookingAttemptRows(RowMapper):
+    """ Как BookingAttemptDetailSerializer (строковые представления связанных объектов - как их __str__). """
+    fields = (
+        'id', 'total_bid', 'max_bid', 'status', 'created_at', 'updated_at',
+        'initiator__email', 'room__name', 'room__building',
+        'start_slot_id', 'start_slot__date', 'start_slot__slot_number', 'start_slot__status',
+        'end_slot_id', 'end_slot__date', 'end_slot__slot_number', 'end_slot__status',
+        'funding_group_id', 'funding_group__name', 'funding_group__initiator__email',
+    )
+
+    @staticmethod
+    def _slot(values, prefix):
+        if values[f'{prefix}_id'] is None:
+            return None
+        start, end = SLOT_TIMES.get(values[f'{prefix}__slot_number'], ('??:??', '??:??'))
+        date = values[f'{prefix}__date']
+        return f"{values['room__name']} ({date.strftime('%Y-%m-%d')} {start}-{end}) - {_label(SLOT_STATUS_LABELS, values[f'{prefix}__status'])}"
+
+    def row(self, values):
+        group_id = values['funding_group_id']
+        if group_id is None:
+            group = None
+        else:
+            group = values['funding_group__name'] or f"Группа {group_id} (Админ: {values['funding_group__initiator__email']})"
+        return {
+            'id': values['id'],
+            'initiator': values['initiator__email'],
+            'room': f"{values['room__name']} ({values['room__building']})",
+            'start_slot': self._slot(values, 'start_slot'),
+            'end_slot': self._slot(values, 'end_slot'),
+            'total_bid': values['total_bid'],
+            'max_bid': values['max_bid'],
+            'funding_group': group,
+            'status': _label(ATTEMPT_STATUS_LABELS, values['status']),
+            'created_at': _datetime(values['created_at']),
+            'updated_at': _datetime(values['updated_at']),
+        }
+
+
+class EventRows(RowMapper):
+    """ Как events.serializers.EventSerializer. """
+    fields = ('date', 'start_slot', 'end_slot', 'booking_attempt_id', 'group_id', 'room_id', 'subject', 'description', 'id')
+
+    def row(self, values):
+        return {
+            'date': values['date'].isoformat(),
+            'start_slot': values['start_slot'],
+            'end_slot': values['end_slot'],
+            'booking_attempt': values['booking_attempt_id'],
+            'group': values['group_id'],
+            'room': values['room_id'],
+            'subject': values['subject'],
+            'description': values['description'],
+            'id': values['id'],
+        }
+
+
+class BookingGroupListRows(RowMapper):
+    """ Как groups.serializers.BookingGroupListSerializer (queryset с аннотациями BookingGroupViewSet._annotate_summary). """
+    fields = (
+        'id', 'name', 'initiator_id', 'initiator__email', 'initiator__first_name', 'initiator__second_name',
+        'member_count', 'balance', 'has_active_bid', 'created_at',
+    )
+
+    def row(self, values):
+        return {
+            'id': values['id'],
+            'name': values['name'],
+            'initiator': {
+                'id': values['initiator_id'],
+                'email': values['initiator__email'],
+                'first_name': values['initiator__first_name'],
+                'second_name': values['initiator__second_name'],
+            } if values['initiator_id'] is not None else None,
+            'member_count': values['member_count'],
+            'current_balance': values['balance'],
+            'has_active_bid': values['has_active_bid'],
+            'created_at': _datetime(values['created_at']),
+        }
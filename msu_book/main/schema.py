@@ -11,3 +11,14 @@ class AuthScheme(OpenApiAuthenticationExtension):
             header_name='Authorization',
             token_prefix=''
         )
+
+
+class AppTokenScheme(OpenApiAuthenticationExtension):
+    target_class = "my_auth.authentication.AppTokenAuthentication"
+    name = "AppTokenAuthentication"
+
+    def get_security_definition(self, auto_schema):
+        return build_bearer_security_scheme_object(
+            header_name='Authorization',
+            token_prefix='App'
+        )
@@ -0,0 +1,269 @@
+"""
+Версии ресурсов для условных GET-запросов (ETag / Last-Modified).
+
+Версия - токен в кэше Django (CACHES['default'], Redis), который меняется при каждой
+записи в ресурс:
+- availability:<date> - слоты дня (статусы для /booking/find/);
+- rooms - каталог аудиторий;
+- events - список событий;
+- user:<user_id>:history и user:<user_id>:groups - история заявок и группы пользователя
+  (user_id - внешний id, тот же, что request.user.id).
+
+Записи через ORM (save/delete) повышают версии сигналами ниже. Массовые записи
+(bulk_create, update, сырые выражения ставки) повышают их явно через bump_* после коммита.
+Представление, обернутое в versioned(...), сверяет If-None-Match / If-Modified-Since
+с версиями и отвечает 304 до запросов к БД и сериализации.
+"""
+import hashlib
+import logging
+import secrets
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+from msu_book.db_router import replica_aliases
+from .models import Room, BookingSlot, BookingAttempt, BookingGroup, GroupContribution, Event, User
+
+logger = logging.getLogger(__name__)
+
+ROOMS = 'rooms'
+EVENTS = 'events'
+KEY_PREFIX = 'version:'
+
+
+def availability_key(date):
+    return f'availability:{date.isoformat()}'
+
+
+def history_key(user_id):
+    return f'user:{user_id}:history'
+
+
+def groups_key(user_id):
+    return f'user:{user_id}:groups'
+
+
+def _new_token():
+    # Время повышения в наносекундах (из него Last-Modified) + случайный хвост
+    return f'{time.time_ns()}.{secrets.token_hex(4)}'
+
+
+def _token_time(token):
+    return int(token.split('.', 1)[0]) / 1e9
+
+
+def current(keys):
+    """ Текущие версии ключей ({ключ: токен}); отсутствующие заводятся. None - кэш недоступен. """
+    try:
+        found = cache.get_many([KEY_PREFIX + key for key in keys])
+        versions = {}
+        for key in keys:
+            token = found.get(KEY_PREFIX + key)
+            if token is None:
+                # add, а не set: параллельный запрос мог уже завести версию
+                cache.add(KEY_PREFIX + key, _new_token(), timeout=None)
+                token = cache.get(KEY_PREFIX + key)
+            versions[key] = token
+        return versions
+    except Exception as e:
+        logger.warning(f"Не удалось прочитать версии ресурсов {keys}: {e}")
+        return None
+
+
+def bump(*keys):
+    """ Повышает версии ключей после коммита текущей транзакции. """
+    keys = {key for key in keys if key}
+    if not keys:
+        return
+
+    def _bump():
+        try:
+            cache.set_many({KEY_PREFIX + key: _new_token() for key in keys}, timeout=None)
+        except Exception as e:
+            # Старая версия останется - клиенты будут получать 304 до следующего повышения
+            logger.error(f"Не удалось повысить версии ресурсов {sorted(keys)}: {e}")
+
+    transaction.on_commit(_bump)
+
+
+def bump_availability(*dates):
+    """ Сетка доступности по датам (пустые даты старых заявок без диапазона пропускаются). """
+    bump(*(availability_key(date) for date in dates if date))
+
+
+def bump_group_members(*group_ids):
+    """ Группы пользователей-участников указанных групп. """
+    group_ids = [group_id for group_id in group_ids if group_id]
+    if group_ids:
+        members = BookingGroup.members.through.objects.filter(bookinggroup_id__in=group_ids).values_list('user__user_id', flat=True)
+        bump(*(groups_key(user_id) for user_id in set(members)))
+
+
+def bump_attempts(attempt_ids):
+    """ История инициаторов и группы участников для заявок (после массового изменения их статусов). """
+    attempt_ids = list(attempt_ids)
+    if not attempt_ids:
+        return
+    rows = BookingAttempt.objects.filter(id__in=attempt_ids).values_list('initiator__user_id', 'funding_group_id', 'date')
+    bump(*(history_key(user_id) for user_id, _, _ in rows))
+    bump_availability(*{date for _, _, date in rows})
+    bump_group_members(*{group_id for _, group_id, _ in rows})
+
+
+# --- Сигналы: записи через ORM ---
+
+def _room_changed(sender, **kwargs):
+    bump(ROOMS)
+
+
+def _event_changed(sender, **kwargs):
+    bump(EVENTS)
+
+
+def _slot_changed(sender, instance, **kwargs):
+    bump_availability(instance.date)
+
+
+def _attempt_changed(sender, instance, **kwargs):
+    if BookingAttempt.initiator.is_cached(instance):
+        user_id = instance.initiator.user_id
+    else:
+        user_id = User.objects.filter(pk=instance.initiator_id).values_list('user_id', flat=True).first()
+    bump(history_key(user_id))
+    bump_group_members(instance.funding_group_id)
+
+
+def _group_changed(sender, instance, **kwargs):
+    bump_group_members(instance.pk)
+
+
+def _contribution_changed(sender, instance, **kwargs):
+    bump_group_members(instance.group_id)
+
+
+def _members_changed(sender, instance, action, pk_set=None, **kwargs):
+    if action not in ('pre_remove', 'post_add', 'post_remove', 'pre_clear'):
+        return
+    if isinstance(instance, BookingGroup):
+        # До удаления - чтобы затронуть и уходящих участников
+        bump_group_members(instance.pk)
+        if pk_set:
+            bump(*(groups_key(user_id) for user_id in User.objects.filter(pk__in=pk_set).values_list('user_id', flat=True)))
+    else:
+        # Изменение со стороны пользователя (user.booking_groups.add/remove): pk_set - id групп
+        bump(groups_key(instance.user_id))
+        bump_group_members(*(pk_set or ()))
+
+
+for _model, _receiver in (
+    (Room, _room_changed), (Event, _event_changed), (BookingSlot, _slot_changed),
+    (BookingAttempt, _attempt_changed), (BookingGroup, _group_changed), (GroupContribution, _contribution_changed),
+):
+    post_save.connect(_receiver, sender=_model, dispatch_uid=f'versions_{_model.__name__}_save')
+    # Заявки и слоты удаляет пачками архивация (booking.retention) - она повышает версии сама,
+    # а обработчик post_delete отключил бы быстрое удаление
+    if _model not in (BookingAttempt, BookingSlot):
+        post_delete.connect(_receiver, sender=_model, dispatch_uid=f'versions_{_model.__name__}_delete')
+m2m_changed.connect(_members_changed, sender=BookingGroup.members.through, dispatch_uid='versions_group_members')
+
+
+# --- Условные GET ---
+
+def cacheable(versions):
+    """
+    Можно ли кэшировать ответ под этими версиями. При чтении с реплик свежая версия
+    могла еще не дойти до реплики, и под новой версией закэшировались бы старые данные.
+    """
+    if not versions:
+        return False
+    if replica_aliases():
+        newest = max(_token_time(token) for token in versions.values())
+        if time.time() - newest < settings.REPLICA_MAX_LAG_SECONDS:
+            return False
+    return True
+
+
+def _versions_for(request, resources, args, kwargs):
+    if not hasattr(request, '_resource_versions'):
+        keys = []
+        for resource in resources:
+            key = resource(request, *args, **kwargs)
+            keys.extend(key if isinstance(key, (list, tuple)) else [key])
+        # Ключ не определен (например, неверная дата в запросе) - отвечаем без ETag
+        request._resource_versions = None if None in keys or not keys else current(keys)
+    versions = request._resource_versions
+    return versions if cacheable(versions) else None
+
+
+def versioned(*resources, name=''):
+    """
+    Декоратор GET-метода APIView/ViewSet: ETag и Last-Modified по версиям ресурсов,
+    304 на If-None-Match / If-Modified-Since до выполнения самого метода.
+    resources - функции (request, *args, **kwargs) -> ключ версии или список ключей (None - без условной обработки).
+    name - имя метода, если декоратор применяется к классу (например, 'list').
+    """
+    def etag(request, *args, **kwargs):
+        versions = _versions_for(request, resources, args, kwargs)
+        if versions is None:
+            return None
+        # Accept - в ETag: разные представления (JSON, msgpack) одного URL
+        digest = hashlib.sha1(f"{request.get_full_path()}|{request.META.get('HTTP_ACCEPT', '')}".encode())
+        for key in sorted(versions):
+            digest.update(f'|{key}={versions[key]}'.encode())
+        return digest.hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        versions = _versions_for(request, resources, args, kwargs)
+        if versions is None:
+            return None
+        newest = max(_token_time(token) for token in versions.values())
+        # Last-Modified с точностью до секунды: пока секунда последней записи не закончилась,
+        # повторная запись в ту же секунду не была бы видна по If-Modified-Since
+        if time.time() - newest < 1:
+            return None
+        return datetime.fromtimestamp(int(newest), tz=dt_timezone.utc)
+
+    return method_decorator(condition(etag_func=etag, last_modified_func=last_modified), name=name)
+
+
+def query_date(param='date'):
+    """ Ключ availability по дате из query-параметра (None, если дата не указана или неверна). """
+    def resource(request, *args, **kwargs):
+        try:
+            return availability_key(datetime.strptime(request.GET.get(param, ''), '%Y-%m-%d').date())
+        except ValueError:
+            return None
+    return resource
+
+
+def query_date_range(from_param='date_from', to_param='date_to', max_days=31):
+    """ Ключи availability всех дат диапазона из query-параметров (to_param необязателен). """
+    def resource(request, *args, **kwargs):
+        try:
+            date_from = datetime.strptime(request.GET.get(from_param, ''), '%Y-%m-%d').date()
+            date_to = datetime.strptime(request.GET[to_param], '%Y-%m-%d').date() if request.GET.get(to_param) else date_from
+        except ValueError:
+            return None
+        days = (date_to - date_from).days + 1
+        if not 0 < days <= max_days:
+            return None
+        return [availability_key(date_from + timedelta(days=offset)) for offset in range(days)]
+    return resource
+
+
+def fixed(key):
+    return lambda request, *args, **kwargs: key
+
+
+def user_history(request, *args, **kwargs):
+    return history_key(request.user.id)
+
+
+def user_groups(request, *args, **kwargs):
+    return groups_key(request.user.id)
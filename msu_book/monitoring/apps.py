@@ -0,0 +1,15 @@
+from django.apps import AppConfig
+
+
+class MonitoringConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'monitoring'
+
+    def ready(self):
+        from django.conf import settings
+        # Сигналы Celery нужны только воркерам: веб-процессу и командам не нужен импорт celery при старте
+        if settings.PROCESS_ROLE == 'worker':
+            from . import signals
+        # Обертка над внешними HTTP-запросами
+        from .instrumentation import install_http_instrumentation
+        install_http_instrumentation()
@@ -0,0 +1,180 @@
+"""
+Сбор SQL- и HTTP-статистики в рамках одного запроса или одной задачи Celery.
+"""
+import contextvars
+import logging
+import re
+import time
+import traceback
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+
+from .registry import REGISTRY, DEFAULT_COUNT_BUCKETS
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = str(Path(__file__).resolve().parent.parent)
+MONITORING_DIR = str(Path(__file__).resolve().parent)
+
+# --- Метрики HTTP-запросов ---
+REQUEST_LATENCY = REGISTRY.histogram(
+    'http_request_duration_seconds', 'Время обработки запроса по представлениям.',
+    ('view', 'method', 'status'),
+)
+REQUEST_DB_QUERIES = REGISTRY.histogram(
+    'http_request_db_queries', 'Количество SQL-запросов за один HTTP-запрос.',
+    ('view', 'method'), buckets=DEFAULT_COUNT_BUCKETS,
+)
+REQUEST_DB_TIME = REGISTRY.histogram(
+    'http_request_db_duration_seconds', 'Суммарное время SQL за один HTTP-запрос.',
+    ('view', 'method'),
+)
+REQUEST_EXTERNAL_TIME = REGISTRY.histogram(
+    'http_request_external_http_duration_seconds', 'Суммарное время внешних HTTP-вызовов за один HTTP-запрос.',
+    ('view', 'method'),
+)
+
+# --- Метрики задач Celery (пишутся в воркерах, поэтому хранятся в Redis) ---
+TASK_LATENCY = REGISTRY.histogram(
+    'celery_task_duration_seconds', 'Время выполнения задачи Celery.',
+    ('task', 'state'), shared=True,
+)
+TASK_DB_QUERIES = REGISTRY.histogram(
+    'celery_task_db_queries', 'Количество SQL-запросов за одно выполнение задачи.',
+    ('task',), shared=True, buckets=DEFAULT_COUNT_BUCKETS,
+)
+TASK_DB_TIME = REGISTRY.histogram(
+    'celery_task_db_duration_seconds', 'Суммарное время SQL за одно выполнение задачи.',
+    ('task',), shared=True,
+)
+TASK_EXTERNAL_TIME = REGISTRY.histogram(
+    'celery_task_external_http_duration_seconds', 'Суммарное время внешних HTTP-вызовов за одно выполнение задачи.',
+    ('task',), shared=True,
+)
+
+# --- Внешние HTTP-вызовы и N+1 ---
+EXTERNAL_HTTP_LATENCY = REGISTRY.histogram(
+    'external_http_request_duration_seconds', 'Время внешних HTTP-вызовов (requests) по хостам.',
+    ('host',),
+)
+NPLUSONE_DETECTED = REGISTRY.counter(
+    'db_nplusone_detected', 'Количество обнаруженных повторов одной формы запроса (N+1).',
+    ('scope',), shared=True,
+)
+
+_current_collector = contextvars.ContextVar('monitoring_collector', default=None)
+
+_IN_LIST_RE = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+_NUMBER_RE = re.compile(r'\b\d+\b')
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+
+
+def query_shape(sql):
+    """ Нормализует SQL: убирает литералы и сворачивает списки IN (...), чтобы сравнивать "форму" запроса. """
+    shape = _STRING_RE.sub('?', sql)
+    shape = _NUMBER_RE.sub('?', shape)
+    return _IN_LIST_RE.sub('(...)', shape)
+
+
+def _call_site():
+    """ Возвращает ближайший к месту вызова кадр стека из кода проекта. """
+    for frame in reversed(traceback.extract_stack()[:-3]):
+        filename = frame.filename
+        if filename.startswith(PROJECT_DIR) and not filename.startswith(MONITORING_DIR):
+            return f"{frame.filename}:{frame.lineno} in {frame.name}"
+    return 'unknown'
+
+
+class QueryCollector:
+    """
+    Обертка над выполнением SQL (connection.execute_wrapper): считает запросы,
+    их суммарное время и повторы одинаковой формы запроса.
+    """
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.query_count = 0
+        self.db_time = 0.0
+        self.external_time = 0.0
+        self.nplusone_threshold = getattr(settings, 'METRICS_NPLUSONE_THRESHOLD', 0)
+        self._shapes = {}
+        self._token = None
+        self._connections = []
+        self._started_at = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.query_count += 1
+            if self.nplusone_threshold:
+                self._check_repeats(sql)
+
+    def _check_repeats(self, sql):
+        shape = query_shape(sql)
+        count = self._shapes.get(shape, 0) + 1
+        self._shapes[shape] = count
+        # Сообщаем один раз на форму запроса - в момент достижения порога
+        if count == self.nplusone_threshold:
+            NPLUSONE_DETECTED.inc(scope=self.scope)
+            logger.warning(
+                f"Возможная проблема N+1 в {self.scope}: запрос повторен {count} раз. "
+                f"Место вызова: {_call_site()}. Запрос: {shape[:300]}"
+            )
+
+    def start(self):
+        """ Подключает сборщик ко всем соединениям с БД и делает его текущим. """
+        self._token = _current_collector.set(self)
+        self._connections = list(connections.all())
+        for connection in self._connections:
+            connection.execute_wrappers.append(self)
+        self._started_at = time.perf_counter()
+        return self
+
+    def stop(self):
+        """ Отключает сборщик и возвращает общее время работы в секундах. """
+        elapsed = time.perf_counter() - self._started_at
+        for connection in self._connections:
+            try:
+                connection.execute_wrappers.remove(self)
+            except ValueError:
+                pass
+        self._connections = []
+        if self._token is not None:
+            try:
+                _current_collector.reset(self._token)
+            except ValueError:
+                # Остановка в другом контексте (например, сигналы Celery в другом потоке)
+                _current_collector.set(None)
+            self._token = None
+        return elapsed
+
+
+def install_http_instrumentation():
+    """ Оборачивает requests.Session.send для учета времени внешних HTTP-вызовов (auth, timetable и т.д.). """
+    if not getattr(settings, 'METRICS_TRACK_EXTERNAL_HTTP', True):
+        return
+    import requests
+    from urllib.parse import urlsplit
+
+    original_send = requests.Session.send
+    if getattr(original_send, '_monitoring_wrapped', False):
+        return
+
+    def send(session, request, **kwargs):
+        start = time.perf_counter()
+        try:
+            return original_send(session, request, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            EXTERNAL_HTTP_LATENCY.observe(elapsed, host=urlsplit(request.url).hostname or 'unknown')
+            collector = _current_collector.get()
+            if collector is not None:
+                collector.external_time += elapsed
+
+    send._monitoring_wrapped = True
+    requests.Session.send = send
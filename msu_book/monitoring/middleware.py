@@ -0,0 +1,52 @@
+from django.conf import settings
+
+from .instrumentation import (
+    QueryCollector, REQUEST_LATENCY, REQUEST_DB_QUERIES, REQUEST_DB_TIME, REQUEST_EXTERNAL_TIME,
+)
+
+
+class RequestMetricsMiddleware:
+    """
+    Считает для каждого представления время ответа, число и время SQL-запросов
+    и время внешних HTTP-вызовов. Результаты доступны на /metrics.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'METRICS_ENABLED', True)
+        self.excluded_paths = tuple(getattr(settings, 'METRICS_EXCLUDED_PATHS', ('/metrics',)))
+
+    def __call__(self, request):
+        if not self.enabled or request.path.startswith(self.excluded_paths):
+            return self.get_response(request)
+
+        collector = QueryCollector(scope=request.path).start()
+        request._metrics_collector = collector
+        status_code = 500
+        try:
+            response = self.get_response(request)
+            status_code = response.status_code
+            return response
+        finally:
+            elapsed = collector.stop()
+            view = self._view_label(request)
+            method = request.method
+            REQUEST_LATENCY.observe(elapsed, view=view, method=method, status=status_code)
+            REQUEST_DB_QUERIES.observe(collector.query_count, view=view, method=method)
+            REQUEST_DB_TIME.observe(collector.db_time, view=view, method=method)
+            REQUEST_EXTERNAL_TIME.observe(collector.external_time, view=view, method=method)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Уточняем scope для логов N+1, как только стало известно представление
+        collector = getattr(request, '_metrics_collector', None)
+        if collector is not None:
+            collector.scope = self._view_label(request)
+        return None
+
+    @staticmethod
+    def _view_label(request):
+        """ Метка представления: имя URL (с namespace) или шаблон маршрута; без совпадения - '<unmatched>'. """
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return '<unmatched>'
+        return match.view_name or match.route or '<unnamed>'
@@ -0,0 +1,364 @@
+"""
+Минимальный реестр метрик в формате Prometheus (text exposition 0.0.4).
+
+Метрики, которые пишутся в воркерах Celery, объявляются с shared=True и накапливаются
+в Redis (RedisStore), чтобы их мог отдать любой веб-процесс на /metrics.
+
+Метрики веб-запросов при METRICS_AGGREGATE_PROCESSES копятся в памяти процесса и раз в
+METRICS_FLUSH_INTERVAL секунд сбрасываются в тот же Redis фоновым потоком (BufferedStore):
+под gunicorn с несколькими воркерами /metrics показывает сумму по всем процессам, а запрос
+не ждет Redis ни на наблюдении, ни на сбросе. Без этой настройки они хранятся только в памяти процесса
+(LocalStore), и /metrics показывает метрики одного воркера - того, что ответил на scrape.
+"""
+import atexit
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Границы по умолчанию для длительностей (секунды)
+DEFAULT_TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Границы для количества SQL-запросов
+DEFAULT_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs.extend(f'{n}="{_escape(v)}"' for n, v in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class LocalStore:
+    """ Хранилище значений в памяти процесса. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}
+
+    def inc(self, metric, fields):
+        with self._lock:
+            values = self._data.setdefault(metric, {})
+            for field, amount in fields:
+                values[field] = values.get(field, 0) + amount
+
+    def set(self, metric, field, value):
+        with self._lock:
+            self._data.setdefault(metric, {})[field] = value
+
+    def items(self, metric):
+        with self._lock:
+            return dict(self._data.get(metric, {}))
+
+    def clear(self, metric):
+        with self._lock:
+            self._data.pop(metric, None)
+
+
+class RedisStore:
+    """ Хранилище значений в Redis: одна hash-структура на метрику, общая для всех процессов. """
+
+    def __init__(self, url_setting='METRICS_REDIS_URL', prefix='metrics:'):
+        self.url_setting = url_setting
+        self.prefix = prefix
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import redis
+            from django.conf import settings
+            url = getattr(settings, self.url_setting, None) or settings.CELERY_BROKER_URL
+            # Запись метрики синхронная: недоступный Redis не должен держать запрос или задачу
+            self._client = redis.Redis.from_url(
+                url, socket_timeout=settings.METRICS_REDIS_TIMEOUT, socket_connect_timeout=settings.METRICS_REDIS_TIMEOUT,
+            )
+        return self._client
+
+    def inc(self, metric, fields):
+        self.inc_many({metric: fields})
+
+    def inc_many(self, updates):
+        """
+        Приращения нескольких метрик ({метрика: [(поле, величина), ...]}) одним pipeline.
+        Возвращает False, если Redis недоступен (BufferedStore тогда оставляет приращения в буфере).
+        """
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for metric, fields in updates.items():
+                for field, amount in fields:
+                    pipe.hincrbyfloat(self.prefix + metric, field, amount)
+            pipe.execute()
+        except Exception as e:
+            # Метрики не должны ломать бизнес-логику
+            logger.warning(f"Не удалось записать метрики {sorted(updates)} в Redis: {e}")
+            return False
+        return True
+
+    def set(self, metric, field, value):
+        try:
+            self.client.hset(self.prefix + metric, field, value)
+        except Exception as e:
+            logger.warning(f"Не удалось записать метрику {metric} в Redis: {e}")
+
+    def items(self, metric):
+        try:
+            raw = self.client.hgetall(self.prefix + metric)
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать метрику {metric} из Redis: {e}")
+            return {}
+        return {k.decode(): float(v) for k, v in raw.items()}
+
+    def clear(self, metric):
+        try:
+            self.client.delete(self.prefix + metric)
+        except Exception as e:
+            logger.warning(f"Не удалось очистить метрику {metric} в Redis: {e}")
+
+
+class BufferedStore:
+    """
+    Приращения копятся в памяти процесса и раз в flush_interval секунд сбрасываются в общий
+    RedisStore фоновым потоком процесса (запускается при первом приращении, после fork -
+    заново). Если Redis недоступен, приращения возвращаются в буфер до следующего сброса:
+    буфер растет только с числом рядов метрик, а не со временем. Чтение сначала сбрасывает
+    свой буфер; приращения других процессов видны с задержкой до flush_interval.
+    """
+
+    def __init__(self, shared, flush_interval):
+        self.shared = shared
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._flusher_pid = None
+
+    def inc(self, metric, fields):
+        with self._lock:
+            self._merge(metric, fields)
+        if self._flusher_pid != os.getpid():
+            self._start_flusher()
+
+    def _merge(self, metric, fields):
+        values = self._pending.setdefault(metric, {})
+        for field, amount in fields:
+            values[field] = values.get(field, 0) + amount
+
+    def _start_flusher(self):
+        with self._lock:
+            pid = os.getpid()
+            if self._flusher_pid == pid:
+                return
+            if self._flusher_pid is not None:
+                # Дочерний процесс после fork: буфер родителя сбросит сам родитель
+                self._pending = {}
+            self._flusher_pid = pid
+        threading.Thread(target=self._run_flusher, name='metrics-flush', daemon=True).start()
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"Сброс метрик в Redis не удался: {e}")
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        if not self.shared.inc_many({metric: list(values.items()) for metric, values in pending.items()}):
+            with self._lock:
+                for metric, values in pending.items():
+                    self._merge(metric, values.items())
+
+    def set(self, metric, field, value):
+        self.shared.set(metric, field, value)
+
+    def items(self, metric):
+        self.flush()
+        return self.shared.items(metric)
+
+    def clear(self, metric):
+        with self._lock:
+            self._pending.pop(metric, None)
+        self.shared.clear(metric)
+
+
+def _field(labels, *suffix):
+    return json.dumps(list(labels) + list(suffix), ensure_ascii=False)
+
+
+def _unfield(field, n_labels):
+    parts = json.loads(field)
+    return tuple(parts[:n_labels]), parts[n_labels:]
+
+
+class Metric:
+    """ Базовый класс метрики с набором меток. """
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), store=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.store = store or LocalStore()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Метрика {self.name} ожидает метки {self.labelnames}, получено {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def clear(self):
+        self.store.clear(self.name)
+
+    def samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self.samples())
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self.store.inc(self.name, [(_field(self._key(labels)), amount)])
+
+    def samples(self):
+        lines = []
+        for field, value in self.store.items(self.name).items():
+            key, _ = _unfield(field, len(self.labelnames))
+            lines.append(f'{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class Gauge(Metric):
+    """
+    Gauge. Если передан collect_fn, значения вычисляются в момент выгрузки:
+    функция возвращает список пар (labels_dict, value).
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), store=None, collect_fn=None):
+        super().__init__(name, documentation, labelnames, store)
+        self.collect_fn = collect_fn
+
+    def set(self, value, **labels):
+        self.store.set(self.name, _field(self._key(labels)), value)
+
+    def samples(self):
+        if self.collect_fn is not None:
+            try:
+                items = [(self._key(labels), value) for labels, value in self.collect_fn()]
+            except Exception as e:
+                logger.warning(f"Не удалось вычислить метрику {self.name}: {e}")
+                items = []
+        else:
+            items = [
+                (_unfield(field, len(self.labelnames))[0], value)
+                for field, value in self.store.items(self.name).items()
+            ]
+        return [f'{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}' for k, v in items]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), store=None, buckets=DEFAULT_TIME_BUCKETS):
+        super().__init__(name, documentation, labelnames, store)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        bucket = bisect.bisect_left(self.buckets, value)
+        self.store.inc(self.name, [
+            (_field(key, 'bucket', bucket), 1),
+            (_field(key, 'sum'), value),
+            (_field(key, 'count'), 1),
+        ])
+
+    def samples(self):
+        series = {}
+        for field, value in self.store.items(self.name).items():
+            key, suffix = _unfield(field, len(self.labelnames))
+            state = series.setdefault(key, {'buckets': [0] * (len(self.buckets) + 1), 'sum': 0, 'count': 0})
+            if suffix[0] == 'bucket':
+                state['buckets'][int(suffix[1])] += value
+            else:
+                state[suffix[0]] = value
+
+        lines = []
+        for key, state in series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), state['buckets']):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, extra=(('le', _format_value(float(bound))),))
+                lines.append(f'{self.name}_bucket{labels} {_format_value(cumulative)}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(state["sum"])}')
+            lines.append(f'{self.name}_count{labels} {_format_value(state["count"])}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self.shared_store = RedisStore()
+        self._buffered_store = None
+
+    def register(self, metric):
+        with self._lock:
+            # Повторная регистрация (например, при перезагрузке модуля) возвращает существующую метрику
+            return self._metrics.setdefault(metric.name, metric)
+
+    def _store(self, shared):
+        if shared:
+            return self.shared_store
+        from django.conf import settings
+        if not getattr(settings, 'METRICS_AGGREGATE_PROCESSES', False):
+            return LocalStore()
+        with self._lock:
+            # Один буфер на процесс: все метрики запросов сбрасываются одним pipeline
+            if self._buffered_store is None:
+                self._buffered_store = BufferedStore(self.shared_store, settings.METRICS_FLUSH_INTERVAL)
+                atexit.register(self._buffered_store.flush)
+            return self._buffered_store
+
+    def counter(self, name, documentation, labelnames=(), shared=False):
+        return self.register(Counter(name, documentation, labelnames, store=self._store(shared)))
+
+    def gauge(self, name, documentation, labelnames=(), shared=False, collect_fn=None):
+        return self.register(Gauge(name, documentation, labelnames, store=self._store(shared), collect_fn=collect_fn))
+
+    def histogram(self, name, documentation, labelnames=(), shared=False, buckets=DEFAULT_TIME_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, store=self._store(shared), buckets=buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
@@ -0,0 +1,29 @@
+"""
+Метрики задач Celery (например, booking.close_auctions) через сигналы task_prerun/task_postrun.
+"""
+from celery.signals import task_prerun, task_postrun
+
+from .instrumentation import (
+    QueryCollector, TASK_LATENCY, TASK_DB_QUERIES, TASK_DB_TIME, TASK_EXTERNAL_TIME,
+)
+
+# task_id -> QueryCollector для выполняющихся задач текущего процесса
+_running = {}
+
+
+@task_prerun.connect
+def start_task_metrics(sender=None, task_id=None, task=None, **kwargs):
+    _running[task_id] = QueryCollector(scope=getattr(task, 'name', str(sender))).start()
+
+
+@task_postrun.connect
+def finish_task_metrics(sender=None, task_id=None, task=None, state=None, **kwargs):
+    collector = _running.pop(task_id, None)
+    if collector is None:
+        return
+    elapsed = collector.stop()
+    name = getattr(task, 'name', str(sender))
+    TASK_LATENCY.observe(elapsed, task=name, state=state or 'UNKNOWN')
+    TASK_DB_QUERIES.observe(collector.query_count, task=name)
+    TASK_DB_TIME.observe(collector.db_time, task=name)
+    TASK_EXTERNAL_TIME.observe(collector.external_time, task=name)
@@ -0,0 +1,6 @@
+from django.urls import path
+from .views import metrics_view
+
+urlpatterns = [
+    path('', metrics_view, name='metrics'),
+]
@@ -1,3 +1,10 @@
-from celery import app as celery_app
-
+# Приложение Celery загружается лениво: веб-процессы и команды задачи не запускают,
+# и импорт celery/kombu при загрузке настроек им только замедляет старт
 __all__ = ('celery_app',)
+
+
+def __getattr__(name):
+    if name == 'celery_app':
+        from booking.celery import app
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,149 @@
+"""
+Маршрутизация чтения на реплики PostgreSQL.
+
+Реплики описываются в DATABASES под именами replica_<n> (см. DB_REPLICA_HOSTS в settings).
+На реплику идут только чтения из представлений, помеченных как replica_safe, и только
+для GET/HEAD. Все остальное (записи, задачи Celery, команды) работает с default.
+
+- read-your-writes: после запроса с записью ответ ставит cookie, и следующие
+  READ_YOUR_WRITES_SECONDS секунд чтения этого клиента идут в default;
+- отставание реплик проверяется не чаще раза в REPLICA_LAG_CHECK_INTERVAL секунд на процесс,
+  реплики с отставанием больше REPLICA_MAX_LAG_SECONDS (или недоступные) пропускаются.
+"""
+import contextvars
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+REPLICA_PREFIX = 'replica_'
+PIN_COOKIE = 'db_pin_primary'
+SAFE_METHODS = ('GET', 'HEAD')
+
+LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+
+class _RoutingState:
+    """ Состояние маршрутизации текущего запроса. """
+    __slots__ = ('replica_allowed', 'pinned', 'wrote')
+
+    def __init__(self, pinned=False):
+        self.replica_allowed = False
+        self.pinned = pinned
+        self.wrote = False
+
+
+_state = contextvars.ContextVar('db_routing_state', default=None)
+
+_lag_lock = threading.Lock()
+_lag_checked = {}  # alias -> (monotonic-время проверки, реплика пригодна)
+
+
+def replica_safe(view):
+    """ Помечает представление (функцию или класс), чтения которого можно отдавать репликам. """
+    view.replica_safe = True
+    return view
+
+
+def _is_replica_safe(view_func):
+    if getattr(view_func, 'replica_safe', False):
+        return True
+    view_class = getattr(view_func, 'view_class', None) or getattr(view_func, 'cls', None)
+    return bool(getattr(view_class, 'replica_safe', False))
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith(REPLICA_PREFIX)]
+
+
+def replica_lag(alias):
+    """ Отставание реплики в секундах (0 - догнала мастер). """
+    with connections[alias].cursor() as cursor:
+        cursor.execute(LAG_SQL)
+        return float(cursor.fetchone()[0])
+
+
+def _replica_usable(alias, now):
+    with _lag_lock:
+        checked = _lag_checked.get(alias)
+    if checked is not None and now - checked[0] < settings.REPLICA_LAG_CHECK_INTERVAL:
+        return checked[1]
+    try:
+        lag = replica_lag(alias)
+        usable = lag <= settings.REPLICA_MAX_LAG_SECONDS
+        if not usable:
+            logger.warning(f"Реплика {alias} отстает на {lag:.1f} с - временно не используется.")
+    except Exception as e:
+        logger.warning(f"Реплика {alias} недоступна: {e}")
+        usable = False
+    with _lag_lock:
+        _lag_checked[alias] = (now, usable)
+    return usable
+
+
+def usable_replicas():
+    now = time.monotonic()
+    return [alias for alias in replica_aliases() if _replica_usable(alias, now)]
+
+
+class ReplicaRouter:
+    """ Чтения replica_safe-представлений - на случайную пригодную реплику, все остальное - в default. """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.replica_allowed or state.pinned or state.wrote:
+            return 'default'
+        replicas = usable_replicas()
+        return random.choice(replicas) if replicas else 'default'
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            # Дальнейшие чтения этого запроса и клиента - с мастера
+            state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и default
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return not db.startswith(REPLICA_PREFIX)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Включает чтение с реплик для GET/HEAD-запросов к replica_safe-представлениям
+    и закрепляет клиента за default на READ_YOUR_WRITES_SECONDS после записи.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = _RoutingState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote or request.method not in SAFE_METHODS:
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.READ_YOUR_WRITES_SECONDS, httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _state.get()
+        if state is not None and replica_aliases():
+            state.replica_allowed = request.method in SAFE_METHODS and _is_replica_safe(view_func)
+        return None
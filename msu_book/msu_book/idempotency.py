@@ -0,0 +1,98 @@
+"""
+Повтор запросов с заголовком Idempotency-Key (IDEMPOTENCY_*).
+
+Мобильные клиенты повторяют запрос при таймауте. Для ставок, отмены и взносов в группу
+повтор - это еще одна транзакция с блокировками (а повторная ставка может перебить
+собственную). Декоратор idempotent сохраняет первый ответ по (пользователь, метод, путь,
+ключ) в кэше (Redis, CACHES['default']) на IDEMPOTENCY_TTL, и повтор получает его
+копию с заголовком Idempotent-Replayed, не трогая таблицы бронирований.
+
+- Пока первый запрос выполняется, повтор получает 409 с Retry-After.
+- Тот же ключ с другим телом запроса - 422 (ключ нельзя переиспользовать).
+- Ответы 5xx, 409, 429 и исключения не сохраняются: клиент может повторить запрос с тем же ключом.
+- Без заголовка и при недоступном кэше запрос выполняется как обычно.
+"""
+import functools
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+KEY_PREFIX = 'idempotency:'
+MAX_KEY_LENGTH = 255
+NOT_STORED_STATUSES = (status.HTTP_409_CONFLICT, status.HTTP_429_TOO_MANY_REQUESTS)
+
+
+def fingerprint(request):
+    """ Отпечаток запроса: повтор с тем же ключом должен совпадать по телу. """
+    body = json.dumps(request.data, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def cache_key(request, key):
+    scope = f'{request.user.id}\n{request.method}\n{request.path}\n{key}'
+    return KEY_PREFIX + hashlib.sha256(scope.encode()).hexdigest()
+
+
+def replay(entry):
+    response = Response(entry['data'], status=entry['status'], headers=entry['headers'])
+    response[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def idempotent(handler):
+    """ Декоратор метода представления DRF (post и action ViewSet). """
+    @functools.wraps(handler)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None or not settings.IDEMPOTENCY_ENABLED or not request.user.is_authenticated:
+            return handler(self, request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return Response({"error": f"Заголовок {HEADER} должен содержать от 1 до {MAX_KEY_LENGTH} символов."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        entry_key = cache_key(request, key)
+        request_fingerprint = fingerprint(request)
+        try:
+            # Метка выполнения (SET NX): из параллельных повторов транзакцию выполнит только первый
+            acquired = cache.add(entry_key, {'fingerprint': request_fingerprint}, settings.IDEMPOTENCY_LOCK_TIMEOUT)
+            entry = None if acquired else cache.get(entry_key)
+        except Exception as e:
+            logger.warning(f"{HEADER} не учтен - кэш недоступен: {e}")
+            return handler(self, request, *args, **kwargs)
+
+        if not acquired:
+            if entry is not None and entry['fingerprint'] != request_fingerprint:
+                return Response({"error": f"{HEADER} уже использован для другого запроса."},
+                                status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            if entry is None or 'status' not in entry:
+                return Response({"error": "Запрос с этим ключом еще выполняется, повторите позже."},
+                                status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'})
+            return replay(entry)
+
+        try:
+            response = handler(self, request, *args, **kwargs)
+        except Exception:
+            cache.delete(entry_key)
+            raise
+        try:
+            if response.status_code < 500 and response.status_code not in NOT_STORED_STATUSES:
+                headers = {name: value for name, value in response.items() if name.lower() != 'content-type'}
+                cache.set(entry_key, {
+                    'fingerprint': request_fingerprint, 'status': response.status_code,
+                    'data': response.data, 'headers': headers,
+                }, settings.IDEMPOTENCY_TTL)
+            else:
+                cache.delete(entry_key)
+        except Exception as e:
+            logger.warning(f"Ответ для {HEADER} не сохранен: {e}")
+        return response
+    return wrapper
@@ -0,0 +1,205 @@
+"""
+Заранее собранная схема OpenAPI вместо SpectacularAPIView.
+
+SpectacularAPIView обходит все представления и сериализаторы на каждый запрос, а Swagger UI
+запрашивает схему при каждом открытии страницы. Здесь схема собирается один раз на версию кода:
+- командой build_schema при сборке/деплое - в OPENAPI_SCHEMA_DIR (YAML и JSON, рядом .gz);
+- если файлов нет или они собраны для другой версии кода - при первом запросе процесса,
+  с сохранением в кэш Django, чтобы остальные процессы не собирали ее заново.
+
+Версия кода - CODE_VERSION (например, git sha при деплое), иначе хэш исходников приложений
+проекта и версий django, DRF и drf-spectacular. Схема отдается из памяти с сильным ETag
+(sha256 тела), 304 на If-None-Match и заранее сжатым gzip-телом при Accept-Encoding: gzip.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import threading
+from importlib.metadata import version as package_version
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.views import View
+
+logger = logging.getLogger(__name__)
+
+# Формат -> (файл, Content-Type); YAML - по умолчанию, как у SpectacularAPIView
+FORMATS = {
+    'yaml': ('openapi.yaml', 'application/vnd.oai.openapi; charset=utf-8'),
+    'json': ('openapi.json', 'application/vnd.oai.openapi+json; charset=utf-8'),
+}
+VERSION_FILE = 'version'
+CACHE_KEY = 'openapi:{code_version}:{format}'
+
+_code_version = None
+_schemas = {}
+_lock = threading.Lock()
+
+
+def code_version():
+    """ Версия кода, для которой собирается схема (вычисляется один раз на процесс). """
+    global _code_version
+    if _code_version is None:
+        if settings.CODE_VERSION:
+            _code_version = settings.CODE_VERSION
+        else:
+            digest = hashlib.sha256()
+            for package in ('django', 'djangorestframework', 'drf-spectacular'):
+                digest.update(f'{package}=={package_version(package)}\n'.encode())
+            base_dir = Path(settings.BASE_DIR).resolve()
+            roots = {Path(config.path).resolve() for config in apps.get_app_configs()}
+            roots.add(Path(__file__).resolve().parent)
+            for root in sorted(root for root in roots if root.is_relative_to(base_dir)):
+                for source in sorted(root.rglob('*.py')):
+                    digest.update(str(source.relative_to(base_dir)).encode())
+                    digest.update(source.read_bytes())
+            _code_version = digest.hexdigest()[:16]
+    return _code_version
+
+
+def generate():
+    """ Схема во всех форматах ({формат: байты}) - как команда spectacular, без запроса. """
+    from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+    from drf_spectacular.settings import spectacular_settings
+
+    schema = spectacular_settings.DEFAULT_GENERATOR_CLASS().get_schema(request=None, public=True)
+    return {
+        'yaml': OpenApiYamlRenderer().render(schema, renderer_context={}),
+        'json': OpenApiJsonRenderer().render(schema, renderer_context={}),
+    }
+
+
+def write(bodies, directory=None):
+    """ Сохраняет схему и ее gzip-копии в OPENAPI_SCHEMA_DIR с отметкой версии кода. """
+    directory = Path(directory or settings.OPENAPI_SCHEMA_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    for fmt, body in bodies.items():
+        filename = FORMATS[fmt][0]
+        (directory / filename).write_bytes(body)
+        (directory / f'{filename}.gz').write_bytes(gzip.compress(body, compresslevel=9, mtime=0))
+    # Отметка версии - последней: файлы без нее считаются несобранными
+    (directory / VERSION_FILE).write_text(json.dumps({'code_version': code_version()}))
+    return directory
+
+
+def is_current(directory=None):
+    """ Собраны ли файлы схемы для текущей версии кода. """
+    try:
+        built = json.loads((Path(directory or settings.OPENAPI_SCHEMA_DIR) / VERSION_FILE).read_text())
+    except (OSError, ValueError):
+        return False
+    return built.get('code_version') == code_version()
+
+
+def _read(fmt):
+    directory = Path(settings.OPENAPI_SCHEMA_DIR)
+    if not is_current(directory):
+        logger.info(f"Схема OpenAPI в {directory} не собрана для версии кода {code_version()} - собираем при запросе")
+        return None
+    try:
+        filename = FORMATS[fmt][0]
+        body = (directory / filename).read_bytes()
+        compressed = directory / f'{filename}.gz'
+        return body, compressed.read_bytes() if compressed.exists() else None
+    except (OSError, ValueError):
+        return None
+
+
+def _from_cache(fmt):
+    try:
+        return cache.get(CACHE_KEY.format(code_version=code_version(), format=fmt))
+    except Exception as e:
+        logger.warning(f"Кэш схемы OpenAPI недоступен: {e}")
+        return None
+
+
+def _build():
+    bodies = generate()
+    try:
+        cache.set_many({
+            CACHE_KEY.format(code_version=code_version(), format=fmt): body for fmt, body in bodies.items()
+        }, timeout=None)
+    except Exception as e:
+        logger.warning(f"Не удалось закэшировать схему OpenAPI: {e}")
+    return bodies
+
+
+class _Schema:
+    """ Тело схемы, его gzip-копия и сильные ETag обоих представлений. """
+
+    def __init__(self, body, compressed=None):
+        self.body = body
+        self.compressed = compressed if compressed is not None else gzip.compress(body, compresslevel=9, mtime=0)
+        digest = hashlib.sha256(body).hexdigest()
+        self.etag = f'"{digest}"'
+        # Сжатое тело - другие байты, поэтому и сильный ETag у него свой
+        self.etag_gzip = f'"{digest}-gzip"'
+
+
+def schema(fmt):
+    """ Схема в формате fmt для текущей версии кода: память процесса, файлы сборки, кэш или генерация. """
+    found = _schemas.get(fmt)
+    if found is not None:
+        return found
+    with _lock:
+        if fmt not in _schemas:
+            stored = _read(fmt)
+            if stored is None:
+                body = _from_cache(fmt)
+                if body is None:
+                    body = _build()[fmt]
+                stored = (body, None)
+            _schemas[fmt] = _Schema(*stored)
+        return _schemas[fmt]
+
+
+def _accepts_gzip(request):
+    for coding in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, _, params = coding.partition(';')
+        if name.strip().lower() not in ('gzip', '*'):
+            continue
+        quality = params.replace(' ', '').partition('q=')[2]
+        try:
+            return not quality or float(quality) > 0
+        except ValueError:
+            return False
+    return False
+
+
+def _format(request):
+    fmt = request.GET.get('format')
+    if fmt in FORMATS:
+        return fmt
+    accept = request.META.get('HTTP_ACCEPT', '')
+    return 'json' if 'json' in accept and 'yaml' not in accept else 'yaml'
+
+
+class StaticSchemaView(View):
+    """ GET схемы OpenAPI (?format=json или Accept: ...json - JSON, иначе YAML). """
+    http_method_names = ['get', 'head', 'options']
+
+    def get(self, request, *args, **kwargs):
+        fmt = _format(request)
+        found = schema(fmt)
+        compressed = _accepts_gzip(request)
+        etag = found.etag_gzip if compressed else found.etag
+
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+        if etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*':
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(found.compressed if compressed else found.body, content_type=FORMATS[fmt][1])
+            if compressed:
+                response['Content-Encoding'] = 'gzip'
+            if fmt == 'yaml':
+                response['Content-Disposition'] = 'inline; filename="openapi.yaml"'
+        response['ETag'] = etag
+        # Схема меняется только с деплоем: кэшировать можно, но каждый раз сверяясь по ETag
+        response['Cache-Control'] = 'public, no-cache'
+        patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+        return response
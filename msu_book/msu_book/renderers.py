@@ -0,0 +1,79 @@
+"""
+JSON-рендерер и парсер на orjson (REST_FRAMEWORK, при FAST_JSON = True)
+и рендерер msgpack для компактных ответов.
+
+Вывод побайтно совпадает с rest_framework.renderers.JSONRenderer при настройках
+по умолчанию (UNICODE_JSON, COMPACT_JSON): даты, Decimal, ленивые строки и прочие
+типы, которые orjson не сериализует сам, отдаются encoders.JSONEncoder из DRF.
+"""
+import orjson
+from rest_framework import renderers
+from rest_framework.exceptions import NotAcceptable, ParseError
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.parsers import BaseParser
+from rest_framework.utils import encoders
+
+try:
+    import msgpack
+except ImportError: # Есть в requirements.txt; без пакета запрос msgpack получает 406 (BinaryContentNegotiation)
+    msgpack = None
+
+_encoder = encoders.JSONEncoder()
+
+# Даты - через DRF ('Z' вместо '+00:00'), ключи-не-строки - как в json.dumps
+OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+class ORJSONRenderer(renderers.JSONRenderer):
+    """ Замена JSONRenderer: тот же media_type и формат, сериализация в orjson. """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        options = OPTIONS
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context):
+            # orjson умеет только отступ в 2 пробела (Browsable API, ?format=json; indent=N)
+            options |= orjson.OPT_INDENT_2
+        ret = orjson.dumps(data, default=_encoder.default, option=options)
+        # Как JSONRenderer: U+2028/U+2029 экранируются для безопасной вставки в JavaScript
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class ORJSONParser(BaseParser):
+    """ Замена JSONParser на orjson (тело запроса - UTF-8). """
+    media_type = 'application/json'
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+class MsgPackRenderer(renderers.BaseRenderer):
+    """ Бинарный msgpack (Accept: application/msgpack или ?format=msgpack); даты - строками ISO, как в JSON. """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_encoder.default, use_bin_type=True)
+
+
+class BinaryContentNegotiation(DefaultContentNegotiation):
+    """ Выбор msgpack без установленного пакета - 406, а не 404 (?format=msgpack) или молчаливый JSON. """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        renderer, media_type = super().select_renderer(request, renderers, format_suffix)
+        if isinstance(renderer, MsgPackRenderer) and msgpack is None:
+            raise NotAcceptable("Ответ в msgpack недоступен: на сервере не установлен пакет msgpack.")
+        return renderer, media_type
+
+
+# Рендереры, которые представление может добавить к DEFAULT_RENDERER_CLASSES (вместе с BinaryContentNegotiation)
+BINARY_RENDERERS = [MsgPackRenderer]
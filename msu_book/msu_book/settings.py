@@ -1,4 +1,5 @@
 import os
+import sys
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -26,7 +27,6 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = os.getenv('SECRET_KEY')
-print(os.getenv("DEBUG"))
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = os.getenv("DEBUG").lower() in ('true', '1', 't')
 
@@ -42,6 +42,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'corsheaders',
     'django_celery_beat',
     'main',
@@ -51,21 +52,56 @@ INSTALLED_APPS = [
     'drf_spectacular',
     'drf_spectacular_sidecar',
     'rooms',
-    'events'
+    'events',
+    'monitoring',
 ]
 
+# --- Роль процесса и облегченный реестр приложений ---
+# web - полный набор приложений. worker (Celery) и command (команды cron и фоновые обработчики
+# из LEAN_COMMANDS) не обслуживают HTTP: им не нужны админка, статика, CORS и схема API,
+# а без них меньше импортов при старте и меньше память процесса.
+# Роль определяется по командной строке, PROCESS_ROLE задает ее явно.
+LEAN_COMMANDS = {'balance_updater', 'generate_slots', 'bid_sequencer', 'auction_replay'}
+WEB_ONLY_APPS = [
+    'django.contrib.admin',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'corsheaders',
+    'rest_framework',
+    'drf_spectacular',
+    'drf_spectacular_sidecar',
+]
+
+
+def _detect_process_role(argv):
+    program = Path(argv[0]) if argv else Path()
+    if program.name == 'celery' or program.parent.name == 'celery':  # celery ... / python -m celery ...
+        return 'worker'
+    if program.name == 'manage.py' and len(argv) > 1 and argv[1] in LEAN_COMMANDS:
+        return 'command'
+    return 'web'
+
+
+PROCESS_ROLE = os.getenv('PROCESS_ROLE') or _detect_process_role(sys.argv)
+if PROCESS_ROLE != 'web':
+    INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in WEB_ONLY_APPS]
+
 MIDDLEWARE = [
+    'monitoring.middleware.RequestMetricsMiddleware', # Первым, чтобы учитывать время всей цепочки
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'msu_book.db_router.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'msu_book.urls'
+# Воркерам и командам маршруты не нужны, но системные проверки (их запускают Celery и manage.py)
+# импортировали бы все представления - им достается пустой список маршрутов
+ROOT_URLCONF = 'msu_book.urls' if PROCESS_ROLE == 'web' else 'msu_book.urls_lean'
 
 TEMPLATES = [
     {
@@ -99,6 +135,24 @@ DATABASES = {
     }
 }
 
+# --- Реплики БД для чтения ---
+# Хосты реплик через запятую (host или host:port); пусто - все запросы идут в default.
+# Реплики получают имена replica_0, replica_1, ... и те же учетные данные, что и default.
+DB_REPLICA_HOSTS = [host.strip() for host in os.getenv('DB_REPLICA_HOSTS', '').split(',') if host.strip()]
+for _index, _replica in enumerate(DB_REPLICA_HOSTS):
+    _host, _, _port = _replica.partition(':')
+    DATABASES[f'replica_{_index}'] = {
+        **DATABASES['default'],
+        'HOST': _host,
+        'PORT': _port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['msu_book.db_router.ReplicaRouter']
+REPLICA_MAX_LAG_SECONDS = float(os.getenv('REPLICA_MAX_LAG_SECONDS', '5')) # Реплики с большим отставанием не используются
+REPLICA_LAG_CHECK_INTERVAL = 5 # Как часто (сек) перепроверять отставание реплики
+READ_YOUR_WRITES_SECONDS = 10 # Сколько секунд после записи чтения клиента идут в default
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -123,6 +177,15 @@ AUTH_PASSWORD_VALIDATORS = [
 
 AUTH_URL = "https://api.test.profcomff.com/auth/"
 USERDATA_URL = "https://api.test.profcomff.com/userdata/"
+
+# --- Вход (my_auth) ---
+# token - после входа выдается подписанный токен приложения (Authorization: App <токен>), сессия не создается;
+# cache - сессии Django в кэше; db - сессии Django в таблице django_session (как раньше)
+AUTH_SESSION_MODE = os.getenv('AUTH_SESSION_MODE', 'token')
+APP_TOKEN_TTL = int(os.getenv('APP_TOKEN_TTL', '3600')) # Время жизни токена приложения (сек)
+if AUTH_SESSION_MODE == 'cache':
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -146,16 +209,41 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # REST
+# --- Быстрая сериализация ---
+# Рендерер и парсер JSON на orjson (вывод совпадает с JSONRenderer DRF)
+FAST_JSON = os.getenv('FAST_JSON', 'True').lower() in ('true', '1', 't')
+# Мапперы строк на values() (main.rows) вместо сериализаторов в представлениях с row_mapper
+FAST_ROW_MAPPERS = os.getenv('FAST_ROW_MAPPERS', 'True').lower() in ('true', '1', 't')
+
 REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'msu_book.renderers.ORJSONRenderer' if FAST_JSON else 'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'msu_book.renderers.ORJSONParser' if FAST_JSON else 'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_THROTTLE_CLASSES': ['msu_book.throttling.TokenBucketThrottle'],
+    # Сколько прокси стоит перед приложением: IP для лимитов берется из X-Forwarded-For с учетом этого числа
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES')) if os.getenv('NUM_PROXIES') else None,
     'DEFAULT_AUTHENTICATION_CLASSES': [
-    'my_auth.authentication.ThirdPartyAuthentication',
+        'my_auth.authentication.AppTokenAuthentication', # Подписанный токен приложения - без запросов к БД и стороннему сервису
+        'my_auth.authentication.ThirdPartyAuthentication',
         # 'rest_framework.authentication.TokenAuthentication',  # Используем токенную аутентификацию
         # Добавь другие классы аутентификации, если нужно (например, SessionAuthentication для браузера)
     ],
 }
+# --- Схема OpenAPI (msu_book.openapi) ---
+# Версия кода, для которой собрана схема (при деплое - git sha); пусто - хэш исходников проекта
+CODE_VERSION = os.getenv('CODE_VERSION', '')
+# Куда команда build_schema складывает готовую схему
+OPENAPI_SCHEMA_DIR = Path(os.getenv('OPENAPI_SCHEMA_DIR', BASE_DIR / 'build' / 'openapi'))
+
 SPECTACULAR_SETTINGS = {
     'SWAGGER_UI_DIST': 'SIDECAR',  # shorthand to use the sidecar instead
     'SWAGGER_UI_FAVICON_HREF': 'SIDECAR',
@@ -175,6 +263,35 @@ SPECTACULAR_SETTINGS = {
     # OTHER SETTINGS
 }
 
+# Максимальная длина диапазона дат для поиска свободных окон (/booking/windows/)
+FREE_WINDOW_SEARCH_MAX_DAYS = 31
+# Максимальный диапазон дат матрицы занятости (/booking/occupancy/) и сколько секунд хранить дни в кэше
+OCCUPANCY_MAX_DAYS = 14
+OCCUPANCY_CACHE_TTL = 24 * 60 * 60
+# Максимальное количество диапазонов в одной пакетной заявке (/booking/booking-attempt-batch/)
+BATCH_BOOKING_MAX_ITEMS = 60
+# На сколько дней вперед генератор слотов (manage.py generate_slots) создает строки BookingSlot
+SLOT_GENERATION_DAYS_AHEAD = 14
+# Окно мгновенной брони для /booking/instant/ (минуты до начала слота)
+INSTANT_BOOKING_WINDOW_MINUTES = 60
+# Хранение: слоты и заявки старше N дней переносятся в архив / сводки дней (booking.archive_past_bookings)
+ARCHIVE_RETENTION_DAYS = int(os.getenv('ARCHIVE_RETENTION_DAYS', '30'))
+# Размер одной пачки архивирования и максимум пачек за один запуск
+ARCHIVE_BATCH_SIZE = 1000
+ARCHIVE_MAX_BATCHES = 50
+
+# Стратегия обработки одиночной ставки: 'orm' - services.place_bid (слоты без блокировки, условный UPDATE слотов),
+# 'lock' - то же, но слоты диапазона читаются с SELECT ... FOR UPDATE,
+# 'sql' - один вызов функции PostgreSQL booking_place_bid (booking.bid_sql, только PostgreSQL),
+# 'advisory' - 'orm' плюс advisory-блокировка дня аудитории: параллельные ставки ждут, а не получают 409 (только PostgreSQL)
+BOOKING_BID_STRATEGY = os.getenv('BOOKING_BID_STRATEGY', 'orm')
+
+# Закрытие аукционов: размер пачки (SELECT ... FOR UPDATE SKIP LOCKED) и бюджет времени одного запуска (сек, меньше expires)
+AUCTION_CLOSER_BATCH_SIZE = 100
+AUCTION_CLOSER_TIME_BUDGET = 50
+# Число шардов закрывателя по аудиториям (room_id % shards); при > 1 запуск по расписанию раздает задачи по шардам
+AUCTION_CLOSER_SHARDS = int(os.getenv('AUCTION_CLOSER_SHARDS', '1'))
+
 # --- Настройки Celery ---
 # URL вашего брокера сообщений (например, Redis или RabbitMQ)
 CELERY_BROKER_URL = 'redis://localhost:6379/0' # Пример для Redis на локальной машине
@@ -201,9 +318,83 @@ CELERY_BEAT_SCHEDULE = {
             'expires': 55.0, # Задача должна завершиться за 55 сек, иначе будет считаться просроченной
         },
     },
+    'archive-past-bookings-hourly': {
+        'task': 'booking.archive_past_bookings',
+        'schedule': 3600.0, # Раз в час; каждый запуск обрабатывает не больше ARCHIVE_MAX_BATCHES пачек
+        'options': {
+            'expires': 3000.0,
+        },
+    },
     # Можно добавить другие периодические задачи сюда
     # 'cleanup-groups-daily': {
     #     'task': 'booking.cleanup_inactive_groups',
     #     'schedule': crontab(hour=3, minute=0), # Запускать каждый день в 3:00
     # },
-}
\ No newline at end of file
+}
+
+# --- Настройки метрик (/metrics) ---
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True').lower() in ('true', '1', 't')
+# Пустой список - доступ к /metrics без ограничений по IP
+METRICS_ALLOWED_IPS = [ip for ip in os.getenv('METRICS_ALLOWED_IPS', '').split(',') if ip]
+# Учитывать время внешних HTTP-вызовов через requests (сервис авторизации, расписание)
+METRICS_TRACK_EXTERNAL_HTTP = True
+# Сколько раз один и тот же "шаблон" SQL может повториться за запрос до предупреждения о N+1 (0 - отключено)
+METRICS_NPLUSONE_THRESHOLD = int(os.getenv('METRICS_NPLUSONE_THRESHOLD', '10'))
+# Redis для метрик воркеров Celery (по умолчанию - брокер Celery)
+METRICS_REDIS_URL = os.getenv('METRICS_REDIS_URL', CELERY_BROKER_URL)
+METRICS_REDIS_TIMEOUT = 0.2 # Сек; при недоступном Redis метрика теряется, запрос не ждет
+# Суммировать метрики веб-запросов по всем процессам (gunicorn с несколькими воркерами) через Redis.
+# False - метрики в памяти процесса, /metrics показывает только воркер, ответивший на scrape
+METRICS_AGGREGATE_PROCESSES = os.getenv('METRICS_AGGREGATE_PROCESSES', 'True').lower() in ('true', '1', 't')
+METRICS_FLUSH_INTERVAL = 5 # Сек; как часто процесс сбрасывает накопленные метрики запросов в Redis
+# Порог (сек) для флага is_lagging в /booking/auctions/backlog/ и алертов по auction_overdue_backlog
+AUCTION_CLOSER_LAG_ALERT_SECONDS = int(os.getenv('AUCTION_CLOSER_LAG_ALERT_SECONDS', '120'))
+
+# --- Кэш и версии ресурсов (main.versions) ---
+# Версии ресурсов для ETag/304 должны быть общими для всех процессов - поэтому кэш в Redis
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/1')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_REDIS_URL,
+    }
+}
+
+# --- Последовательная обработка ставок (booking.sequencer) ---
+# Включено: ставки кладутся в Redis Streams по партициям (аудитория, дата), API отвечает билетом (202),
+# результат забирается long-poll запросом; обработчики запускаются командой bid_sequencer
+BOOKING_SEQUENCER_ENABLED = os.getenv('BOOKING_SEQUENCER_ENABLED', 'False').lower() in ('true', '1', 't')
+BOOKING_SEQUENCER_REDIS_URL = os.getenv('BOOKING_SEQUENCER_REDIS_URL', CELERY_BROKER_URL)
+BOOKING_SEQUENCER_PARTITIONS = int(os.getenv('BOOKING_SEQUENCER_PARTITIONS', '16'))
+# Сколько ставок обработчик берет из партиции за одну аренду и на сколько (мс) берет аренду
+BOOKING_SEQUENCER_BATCH_SIZE = 50
+BOOKING_SEQUENCER_LEASE_MS = 30000
+# Сколько (мс) обработчик ждет новых записей одним XREADGROUP BLOCK (не больше трети аренды)
+BOOKING_SEQUENCER_BLOCK_MS = 5000
+# Примерная максимальная длина потока партиции (обработанные записи удаляются сразу)
+BOOKING_SEQUENCER_STREAM_MAXLEN = 100000
+# Сколько секунд хранится билет с результатом и максимальное ожидание long-poll
+BOOKING_SEQUENCER_TICKET_TTL = 600
+BOOKING_SEQUENCER_POLL_TIMEOUT = 25
+
+# --- Ограничение частоты запросов (msu_book.throttling) ---
+THROTTLE_ENABLED = os.getenv('THROTTLE_ENABLED', 'True').lower() in ('true', '1', 't')
+THROTTLE_REDIS_URL = os.getenv('THROTTLE_REDIS_URL', CELERY_BROKER_URL)
+THROTTLE_REDIS_TIMEOUT = 0.2 # Сек; при недоступном Redis запросы пропускаются без ограничения
+# Лимиты класса эндпоинтов (throttle_scope) на пользователя и на IP: 'N/s', 'N/m', 'N/h', 'N/d' -
+# всплеск до N запросов, затем N за период. Представления без throttle_scope - класс 'default'
+THROTTLE_RATES = {
+    'default': {'user': '300/m', 'ip': '600/m'},
+    'search': {'user': '60/m', 'ip': '120/m'},
+    'bid': {'user': '30/m', 'ip': '120/m'},
+    'poll': {'user': '120/m', 'ip': '240/m'},
+}
+# Отдельный, более строгий бюджет ставок одного пользователя на один день аудитории
+THROTTLE_BID_TARGET_RATE = os.getenv('THROTTLE_BID_TARGET_RATE', '6/m')
+
+# --- Повтор запросов с Idempotency-Key (msu_book.idempotency) ---
+# Первый ответ ставки, отмены или взноса хранится в кэше по (пользователь, запрос, ключ),
+# повтор с тем же ключом получает его копию без новой транзакции
+IDEMPOTENCY_ENABLED = os.getenv('IDEMPOTENCY_ENABLED', 'True').lower() in ('true', '1', 't')
+IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', str(24 * 3600))) # Сек: сколько хранится ответ
+IDEMPOTENCY_LOCK_TIMEOUT = 60 # Сек: метка выполняющегося запроса (если процесс упал, ключ освободится)
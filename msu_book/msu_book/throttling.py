@@ -0,0 +1,158 @@
+"""
+Ограничение частоты запросов: корзины токенов в Redis (REST_FRAMEWORK, THROTTLE_*).
+
+Каждый класс эндпоинтов (throttle_scope представления, по умолчанию 'default') имеет
+лимиты на пользователя и на IP из THROTTLE_RATES. Лимит 'N/m' - корзина на N токенов,
+которая пополняется на N за период, то есть допускает всплеск до N запросов.
+Ставки дополнительно расходуют отдельную, более строгую корзину пользователя на день
+аудитории (THROTTLE_BID_TARGET_RATE), поэтому скрипт, долбящий один аукцион в овертайме,
+упирается в свой лимит и не съедает общий бюджет остальных.
+
+Все корзины запроса проверяются одним Lua-скриптом атомарно: токены списываются, только
+если хватает во всех корзинах, иначе - 429 с Retry-After (время до пополнения самой пустой).
+Если Redis недоступен, запросы пропускаются (ограничение не должно ронять ставки).
+"""
+import logging
+import math
+import time
+
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'throttle:'
+SKIP_AFTER_FAILURE = 5 # Сек: после ошибки Redis не пытаемся подключаться на каждый запрос
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# KEYS - корзины; ARGV - пары (емкость, пополнение в токенах за мс) для каждой корзины.
+# Возвращает {1, 0} при успехе или {0, мс до пополнения самой пустой корзины}.
+TOKEN_BUCKET_LUA = """
+local now_parts = redis.call('TIME')
+local now = now_parts[1] * 1000 + math.floor(now_parts[2] / 1000)
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2 - 1])
+    local rate = tonumber(ARGV[i * 2])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    levels[i] = tokens
+    if tokens < 1 then
+        wait = math.max(wait, math.ceil((1 - tokens) / rate))
+    end
+end
+if wait > 0 then
+    return {0, wait}
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2 - 1])
+    local rate = tonumber(ARGV[i * 2])
+    redis.call('HSET', key, 'tokens', levels[i] - 1, 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil(capacity / rate) + 1000)
+end
+return {1, 0}
+"""
+
+_client = None
+_script = None
+_skip_until = 0
+
+
+def get_script():
+    global _client, _script
+    if _script is None:
+        import redis
+        _client = redis.Redis.from_url(
+            settings.THROTTLE_REDIS_URL,
+            socket_timeout=settings.THROTTLE_REDIS_TIMEOUT, socket_connect_timeout=settings.THROTTLE_REDIS_TIMEOUT,
+        )
+        _script = _client.register_script(TOKEN_BUCKET_LUA)
+    return _script
+
+
+def parse_rate(rate):
+    """ 'N/m' -> (емкость N, пополнение в токенах за мс). """
+    count, _, period = rate.partition('/')
+    count = int(count)
+    return count, count / (PERIODS[period[0]] * 1000)
+
+
+def consume(buckets):
+    """
+    Списывает по токену из всех корзин [(ключ, лимит), ...] атомарно.
+    Возвращает None при успехе, иначе - секунды до следующей попытки.
+    """
+    global _skip_until
+    if not buckets or time.monotonic() < _skip_until:
+        return None
+    args = []
+    for _, rate in buckets:
+        args.extend(parse_rate(rate))
+    try:
+        allowed, wait_ms = get_script()(keys=[KEY_PREFIX + key for key, _ in buckets], args=args)
+    except Exception as e:
+        _skip_until = time.monotonic() + SKIP_AFTER_FAILURE
+        logger.warning(f"Ограничение частоты пропущено на {SKIP_AFTER_FAILURE} с - Redis недоступен: {e}")
+        return None
+    return None if allowed else math.ceil(int(wait_ms) / 1000)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """ Лимиты на пользователя и IP для класса эндпоинтов (throttle_scope представления). """
+    default_scope = 'default'
+
+    def get_scope(self, view):
+        return getattr(view, 'throttle_scope', None) or self.default_scope
+
+    def get_buckets(self, request, view):
+        scope = self.get_scope(view)
+        rates = settings.THROTTLE_RATES.get(scope) or {}
+        buckets = []
+        if rates.get('user') and request.user and request.user.is_authenticated:
+            buckets.append((f'{scope}:user:{request.user.id}', rates['user']))
+        if rates.get('ip'):
+            buckets.append((f'{scope}:ip:{self.get_ident(request)}', rates['ip']))
+        return buckets
+
+    def allow_request(self, request, view):
+        self._wait = None
+        if not settings.THROTTLE_ENABLED:
+            return True
+        self._wait = consume(self.get_buckets(request, view))
+        return self._wait is None
+
+    def wait(self):
+        return self._wait
+
+
+class BidThrottle(TokenBucketThrottle):
+    """
+    Ставки: лимиты класса 'bid' плюс корзина пользователя на каждый день аудитории из запроса
+    (room/date в теле или в items пакетной ставки).
+    """
+    default_scope = 'bid'
+    max_targets = 20 # Пакет с большим числом разных дней аудиторий отклонит валидация, корзин на них не заводим
+
+    @staticmethod
+    def get_targets(data):
+        items = data.get('items') if hasattr(data, 'get') else None
+        if not isinstance(items, list):
+            items = [data]
+        targets = []
+        for item in items:
+            if not hasattr(item, 'get') or item.get('room') in (None, '') or not item.get('date'):
+                continue
+            target = (str(item.get('room'))[:20], str(item.get('date'))[:10])
+            if target not in targets:
+                targets.append(target)
+        return targets
+
+    def get_buckets(self, request, view):
+        buckets = super().get_buckets(request, view)
+        if request.user and request.user.is_authenticated and settings.THROTTLE_BID_TARGET_RATE:
+            for room, date in self.get_targets(request.data)[:self.max_targets]:
+                buckets.append((f'bid_target:{request.user.id}:{room}:{date}', settings.THROTTLE_BID_TARGET_RATE))
+        return buckets
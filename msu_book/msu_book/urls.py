@@ -14,19 +14,27 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
 
+from msu_book.openapi import StaticSchemaView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('auth/', include('my_auth.urls')),
     path('booking/', include('booking.urls', namespace='booking')),
     path('api/', include('groups.urls')), # Assumes groups.urls defines paths starting from root ('groups/', etc.)
-    path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
+    path('api/schema/', StaticSchemaView.as_view(), name='schema'), # Заранее собранная схема (build_schema)
     path('api/schema/swagger-ui/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
     path('import-rooms/', include('rooms.urls')),
     path('import-timetable/', include('timetable.urls')),
     path('events/', include('events.urls')),
-    path('profile/', include('edit_user.urls'))
-]
\ No newline at end of file
+    path('profile/', include('edit_user.urls')),
+    path('metrics', include('monitoring.urls')),
+]
+
+if settings.DEBUG:
+    # Схема, собираемая на каждый запрос, - для проверки изменений API при разработке
+    urlpatterns.append(path('api/schema/live/', SpectacularAPIView.as_view(), name='schema-live'))
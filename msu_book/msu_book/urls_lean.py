@@ -0,0 +1,4 @@
+"""
+Маршруты процессов без HTTP (PROCESS_ROLE = worker / command, см. settings.py).
+"""
+urlpatterns = []
@@ -1,14 +1,34 @@
-from django.contrib.auth.backends import BaseBackend
-from django.contrib.auth import get_user_model
-import requests
+import logging
+
+import requests  # Для запросов к стороннему сервису
 from django.conf import settings
-from auth_lib.methods import AuthLib
-from auth_lib.exceptions import AuthFailed
-from django.contrib.auth import get_user_model
-from main.models import User as gg_user
+from django.core import signing
 from rest_framework import authentication
 from rest_framework import exceptions
-import requests  # Для запросов к стороннему сервису
+
+from main.models import User as Profile
+from . import identity, tokens
+
+logger = logging.getLogger(__name__)
+
+
+class AppTokenAuthentication(authentication.BaseAuthentication):
+    """
+    Токен приложения, выданный при входе (Authorization: App <токен>, см. my_auth.tokens).
+    Проверяется только подпись и срок - без БД и стороннего сервиса.
+    Заголовки без префикса App обрабатывает ThirdPartyAuthentication.
+    """
+    def authenticate(self, request):
+        keyword, _, token = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+        if keyword != tokens.KEYWORD:
+            return None
+        try:
+            user = tokens.read(token.strip())
+        except signing.SignatureExpired:
+            raise exceptions.AuthenticationFailed('Token expired.')
+        except signing.BadSignature:
+            raise exceptions.AuthenticationFailed('Invalid token.')
+        return (user, token)
 
 class ThirdPartyAuthentication(authentication.BaseAuthentication):
     """
@@ -36,24 +56,19 @@ class ThirdPartyAuthentication(authentication.BaseAuthentication):
 
         if not user_info:
             raise exceptions.AuthenticationFailed('Invalid token.')
-        User = get_user_model()
-        try:
-            user = User.objects.get(id=user_info['id']) # Предполагаем, что у пользователя есть поле third_party_id
-        except User.DoesNotExist:
-            # Создаем пользователя, если его нет
-            user = User.objects.create(
-                user_id=user_info['id'],
-                email=user_info.get('email', user_info['id']), # Или email, если есть
-                # Другие поля пользователя
-            )
-
-        return user
+        # Сразу запись main.User (без auth.User); если ее нет - заводим
+        profile = Profile.objects.filter(user_id=user_info['id']).first()
+        if profile is None:
+            try:
+                profile = identity.provision(user_info)
+            except Profile.DoesNotExist:
+                raise exceptions.AuthenticationFailed('User cannot be provisioned.')
+        return identity.RequestUser.for_profile(profile)
 
     def get_user_info_from_third_party(self, token):
         """
         Отправляет запрос к стороннему сервису для проверки токена и получения информации о пользователе.
         """
-        print(token)
         # Замени на URL твоего стороннего сервиса
         third_party_api_url = f"{settings.AUTH_URL}me"
         headers = {
@@ -62,10 +77,9 @@ class ThirdPartyAuthentication(authentication.BaseAuthentication):
         }
         try:
             response = requests.get(third_party_api_url, headers=headers)
-            print(response.text)
             response.raise_for_status()  # Поднимает HTTPError для плохих запросов (4XX, 5XX)
             return response.json()
         except requests.exceptions.RequestException as e:
             # Обрабатываем ошибки при запросе к стороннему сервису
-            print(f"Ошибка при запросе к стороннему сервису: {e}")
+            logger.warning(f"Ошибка при запросе к стороннему сервису: {e}")
             return None
\ No newline at end of file
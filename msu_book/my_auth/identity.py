@@ -0,0 +1,87 @@
+"""
+Единый путь от запроса к пользователю main.models.User.
+
+Аутентификация (AppTokenAuthentication, ThirdPartyAuthentication) сразу дает RequestUser -
+пользователя запроса с записью main.User. request.user.id по-прежнему внешний id
+(= main.User.user_id), поэтому существующий код и ключи версий не меняются, а представления
+берут запись через current_user(request) вместо User.objects.get(user_id=request.user.id).
+
+auth.User (id = внешний id) заводится только для сессий Django (AUTH_SESSION_MODE = cache/db).
+Старые записи сверяет и дополняет команда sync_identities.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils.functional import cached_property
+
+from main.models import User as Profile, UserRole
+
+
+class RequestUser:
+    """
+    Пользователь запроса. profile - запись main.User: передается аутентификацией
+    или загружается по pk один раз на запрос (токен приложения хранит только pk).
+    """
+    is_authenticated = True
+    is_anonymous = False
+    is_active = True
+
+    def __init__(self, external_id, profile_id, role, email='', profile=None):
+        self.id = self.pk = external_id # Как у auth.User: внешний id
+        self.profile_id = profile_id
+        self.role = role
+        self.email = email
+        if profile is not None:
+            self.__dict__['profile'] = profile
+
+    @classmethod
+    def for_profile(cls, profile):
+        return cls(profile.user_id, profile.pk, profile.role, profile.email, profile=profile)
+
+    @property
+    def is_staff(self):
+        """ Администраторы (main.User.role = admin) проходят IsAdminUser, как staff у auth.User. """
+        return self.role == UserRole.ADMIN
+
+    @property
+    def is_superuser(self):
+        return self.role == UserRole.ADMIN
+
+    @cached_property
+    def profile(self):
+        return Profile.objects.get(pk=self.profile_id)
+
+    def __str__(self):
+        return self.email or str(self.id)
+
+    def get_username(self):
+        return self.email
+
+
+def current_user(request):
+    """
+    Запись main.User пользователя запроса (Profile.DoesNotExist, если ее нет).
+    Для auth.User (сессии Django, админка) - совместимый поиск по user_id с кэшем на запрос.
+    """
+    user = request.user
+    if isinstance(user, RequestUser):
+        return user.profile
+    profile = getattr(user, '_main_profile', None)
+    if profile is None:
+        profile = user._main_profile = Profile.objects.get(user_id=user.id)
+    return profile
+
+
+def provision(user_info, auth_user=False):
+    """
+    Заводит main.User (и auth.User, если auth_user), если их еще нет, одной транзакцией
+    (INSERT ... ON CONFLICT DO NOTHING) и возвращает main.models.User. Повторный вход ничего не меняет.
+    """
+    external_id = user_info['id']
+    email = user_info.get('email', external_id)
+    with transaction.atomic():
+        if auth_user:
+            get_user_model().objects.bulk_create(
+                [get_user_model()(id=external_id, email=email, username=email)], ignore_conflicts=True,
+            )
+        Profile.objects.bulk_create([Profile(user_id=external_id, email=email)], ignore_conflicts=True)
+        return Profile.objects.get(user_id=external_id)
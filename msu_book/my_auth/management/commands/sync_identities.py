@@ -0,0 +1,60 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from main.models import User as Profile
+
+
+class Command(BaseCommand):
+    help = ('Сверяет auth.User и main.User (auth.User.id = main.User.user_id): заводит недостающие записи main.User '
+            'для старых пользователей и показывает расхождения email и имени. Источник истины - main.User')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--auth-users', action='store_true',
+                            help='Заводить и недостающие auth.User (нужны только для сессий Django, AUTH_SESSION_MODE = cache/db).')
+        parser.add_argument('--fix', action='store_true', help='Переписать расходящиеся email и имя auth.User из main.User.')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, что будет сделано.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        AuthUser = get_user_model()
+        batch_size = options['batch_size']
+        auth_rows = {row[0]: row[1:] for row in AuthUser.objects.values_list('id', 'email', 'username', 'first_name')}
+        profile_rows = {row[0]: row[1:] for row in Profile.objects.values_list('user_id', 'email', 'first_name')}
+
+        missing_profiles = [
+            Profile(user_id=user_id, email=email or username, first_name=first_name[:30])
+            for user_id, (email, username, first_name) in auth_rows.items() if user_id not in profile_rows
+        ]
+        missing_auth = [
+            AuthUser(id=user_id, email=email, username=email, first_name=first_name)
+            for user_id, (email, first_name) in profile_rows.items() if user_id not in auth_rows
+        ] if options['auth_users'] else []
+        drifted = [
+            user_id for user_id, (email, _, first_name) in auth_rows.items()
+            if user_id in profile_rows and (email, first_name) != profile_rows[user_id]
+        ]
+
+        self.stdout.write(
+            f"auth.User: {len(auth_rows)}, main.User: {len(profile_rows)}; без main.User: {len(missing_profiles)}, "
+            f"без auth.User: {sum(1 for user_id in profile_rows if user_id not in auth_rows)}, расхождений: {len(drifted)}"
+        )
+        for user_id in drifted[:20]:
+            self.stdout.write(f"  {user_id}: auth.User {auth_rows[user_id][0]!r} / {auth_rows[user_id][2]!r}, "
+                              f"main.User {profile_rows[user_id][0]!r} / {profile_rows[user_id][1]!r}")
+        if options['dry_run']:
+            return
+
+        with transaction.atomic():
+            # ignore_conflicts: запись могла появиться при входе, пока команда работала
+            Profile.objects.bulk_create(missing_profiles, batch_size=batch_size, ignore_conflicts=True)
+            AuthUser.objects.bulk_create(missing_auth, batch_size=batch_size, ignore_conflicts=True)
+            if options['fix'] and drifted:
+                users = list(AuthUser.objects.filter(id__in=drifted))
+                for user in users:
+                    user.email, user.first_name = profile_rows[user.id]
+                AuthUser.objects.bulk_update(users, ['email', 'first_name'], batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f"Заведено main.User: {len(missing_profiles)}, auth.User: {len(missing_auth)}, "
+            f"исправлено расхождений: {len(drifted) if options['fix'] else 0}."
+        ))
@@ -12,6 +12,8 @@ class TokenSerializer(serializers.Serializer):
     Сериализатор для передачи токена пользователю.
     """
     token = serializers.CharField(required=True)
+    app_token = serializers.CharField(required=False, help_text='Токен приложения (AUTH_SESSION_MODE = token): Authorization: App <app_token>.')
+    expires_in = serializers.IntegerField(required=False, help_text='Время жизни app_token в секундах.')
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
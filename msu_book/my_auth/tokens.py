@@ -0,0 +1,26 @@
+"""
+Подписанный короткоживущий токен приложения (AUTH_SESSION_MODE = 'token').
+
+Выдается при входе и содержит внешний id пользователя (тот же, что request.user.id),
+pk записи main.User и роль. Проверка - только подпись и срок (django.core.signing,
+ключ SECRET_KEY): ни таблица django_session, ни сторонний сервис при запросах не нужны.
+"""
+from django.conf import settings
+from django.core import signing
+
+from .identity import RequestUser
+
+SALT = 'my_auth.app_token'
+KEYWORD = 'App' # Authorization: App <токен>
+
+
+def issue(profile):
+    """ Токен для записи main.User. Возвращает (токен, время жизни в секундах). """
+    payload = {'ext': profile.user_id, 'uid': profile.pk, 'role': profile.role, 'email': profile.email}
+    return signing.dumps(payload, salt=SALT, compress=True), settings.APP_TOKEN_TTL
+
+
+def read(token):
+    """ RequestUser из токена; signing.BadSignature (и SignatureExpired) - подпись неверна или срок истек. """
+    payload = signing.loads(token, salt=SALT, max_age=settings.APP_TOKEN_TTL)
+    return RequestUser(payload['ext'], payload['uid'], payload['role'], payload.get('email', ''))
@@ -8,17 +8,12 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from django.contrib.auth import authenticate
 from rest_framework import status
-from auth_lib import AuthLib
 from django.conf import settings
-from rest_framework.views import APIView
-from rest_framework.response import Response
-from rest_framework import status
 from .serializers import ThirdPartyAuthSerializer, TokenSerializer, UserSerializer
+from . import identity, tokens
 import requests
 from django.contrib.auth import login
 from django.contrib.auth import get_user_model
-import requests
-from auth_lib.exceptions import AuthFailed
 from main.models import User as gg_user
 from main.models import PointTransaction
 from django.db.models import Sum
@@ -53,23 +48,21 @@ class ThirdPartyAuthView(APIView):
             if not user_info:
                 return Response({'error': 'Failed to obtain user info from third party.'}, status=status.HTTP_400_BAD_REQUEST)
 
-            # Получаем или создаем пользователя
-            User = get_user_model()
+            # Заводим main.User (и auth.User для сессий Django) одной транзакцией (повторный вход ничего не меняет)
             try:
-                user = User.objects.get(id=user_info['id'])
-            except User.DoesNotExist:
-                print(user_info)
-                user = User.objects.create(
-                    id=user_info['id'],
-                    email=user_info.get('email', user_info['id']),
-                    username=user_info.get('email', user_info['id']))
-                    # Другие поля пользователя
-                user2 = gg_user.objects.create(
-                    user_id=user_info['id'],
-                    email=user_info.get('email', user_info['id']))
-
-            # Авторизуем пользователя
-            login(request, user)
+                profile = identity.provision(user_info, auth_user=settings.AUTH_SESSION_MODE != 'token')
+            except gg_user.DoesNotExist:
+                # Запись не создалась из-за конфликта (например, email уже занят другим пользователем)
+                return Response({'error': 'Failed to provision user.'}, status=status.HTTP_400_BAD_REQUEST)
+
+            if settings.AUTH_SESSION_MODE == 'token':
+                # Без сессии Django: клиент передает Authorization: App <app_token>
+                app_token, expires_in = tokens.issue(profile)
+                return Response({'token': token_data['token'], 'app_token': app_token, 'expires_in': expires_in},
+                                status=status.HTTP_200_OK)
+
+            # Сессия Django (в кэше или в БД - SESSION_ENGINE)
+            login(request, get_user_model().objects.get(id=user_info['id']))
 
             return Response({'token': token_data['token']}, status=status.HTTP_200_OK)
 
@@ -80,6 +73,10 @@ class ThirdPartyAuthView(APIView):
         """
         Получает токен от стороннего сервиса, используя логин и пароль.
         """
+        # Клиент auth_lib нужен только при входе - не импортируем его при старте процесса
+        from auth_lib import AuthLib
+        from auth_lib.exceptions import AuthFailed
+
         # Замени на URL и параметры твоего стороннего сервиса
         auth_instance = AuthLib(auth_url=settings.AUTH_URL, userdata_url=settings.USERDATA_URL)
         try:
@@ -114,11 +111,9 @@ class profile_view(GenericAPIView):
     serializer_class = UserSerializer  # Указываем сериализатор для пользователя
 
     def get(self, request):
-        # Получаем основного пользователя Django
-        django_user = request.user 
         try:
-            # Получаем связанный объект пользователя из main.models
-            user = gg_user.objects.get(user_id=django_user.id) 
+            # Запись пользователя из main.models (уже загружена аутентификацией)
+            user = identity.current_user(request)
         except gg_user.DoesNotExist:
             return Response({"error": "User profile not found."}, status=status.HTTP_404_NOT_FOUND)
 
@@ -1,5 +1,4 @@
 # кабинеты физфака корпуса
-import requests
 
 class AuditoriumProvider:
 
@@ -82,6 +81,8 @@ class AuditoriumProvider:
         return self._room_5th_floor
 
 def get_json_all_rooms():
+    import requests # HTTP-клиент нужен только при загрузке, не при импорте модуля
+
     url = "https://api.profcomff.com/timetable/room/?limit=100000&offset=0"
 
     response = requests.get(url)
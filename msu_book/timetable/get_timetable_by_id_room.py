@@ -1,7 +1,8 @@
-import requests
 from datetime import date, timedelta
 
 def get_json_timetable_room_by_id(room_id):
+    import requests # HTTP-клиент нужен только при загрузке, не при импорте модуля
+
     date_url = date.today() + timedelta(days=35)
     url = "https://api.profcomff.com/timetable/event/?end=" + str(date_url) + "&room_id=" + str(room_id) + "&format=json&limit=1000000&offset=0"
 
@@ -1,7 +1,7 @@
-from main.models import Room, TIME_SLOTS_DETAILS, BookingSlot, BookingSlotStatus
+from main.models import Room, TIME_SLOTS_DETAILS, BookingSlot, BookingSlotStatus, slot_bounds
 from rooms.room_lists import get_id_all_rooms
 from timetable.get_timetable_by_id_room import get_json_timetable_room_by_id
-from datetime import datetime
+from datetime import date, datetime
 
 def get_room_id_by_name(room_name: str) -> int | None:
     try:
@@ -24,12 +24,26 @@ def add_timetable_list():
                 if room["id"] == room_id:
 
                     number_slot = convert_from_time_to_time_slots(start_ts[11:16])
+                    if number_slot is None:
+                        continue
                     # print(str(room["name"]) + "  // " + str(start_ts[:10]) + " // " + " // " + "status: unavailable // " + "room_id" + str(get_room_id_by_name(room["name"])) + " // " + str(start_ts[11:16]) + " // " + str(number_slot))
-                    BookingSlot.objects.get_or_create(room_id= get_room_id_by_name(room["name"]), date=start_ts[:10], status=BookingSlotStatus.UNAVAILABLE, slot_number=number_slot)
-                    BookingSlot.objects.get_or_create(room_id= get_room_id_by_name(room["name"]), date=start_ts[:10], status=BookingSlotStatus.UNAVAILABLE, slot_number=number_slot + 1)
+                    # Дата нужна объектом date: по ней save() заполняет starts_at/ends_at
+                    slot_date = date.fromisoformat(start_ts[:10])
+                    mark_unavailable(get_room_id_by_name(room["name"]), slot_date, number_slot)
+                    mark_unavailable(get_room_id_by_name(room["name"]), slot_date, number_slot + 1)
                     # print(f"Аудитория: {room['name']}, начало: {start_ts}, конец: {end_ts}, предмет {item['name']}")
 
 
+def mark_unavailable(room_id, slot_date, slot_number):
+    if room_id is None or slot_number not in TIME_SLOTS_DETAILS:
+        return
+    starts_at, ends_at = slot_bounds(slot_date, slot_number)
+    BookingSlot.objects.get_or_create(
+        room_id=room_id, date=slot_date, status=BookingSlotStatus.UNAVAILABLE, slot_number=slot_number,
+        defaults={'starts_at': starts_at, 'ends_at': ends_at},
+    )
+
+
 def convert_from_time_to_time_slots(time_str: str) -> int | None:
     # Преобразуем строку в datetime.time
     target_time = datetime.strptime(time_str, "%H:%M").time()
@@ -2,11 +2,11 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 
-from timetable.timetable_list import add_timetable_list
-
 
 class ImportTimeTableView(APIView):
     def get(self, request):
+        # Загрузчик расписания (HTTP-клиент) нужен только этому запросу - не импортируем его при старте процесса
+        from timetable.timetable_list import add_timetable_list
         try:
             add_timetable_list()
             return Response({'status': 'success', 'message': 'timetable added successfully'}, status=status.HTTP_200_OK)